@@ -0,0 +1,387 @@
+'''
+
+# AsyncInterpreter: run Lox as a coroutine
+
+Not in the book. The Interpreter is a recursive tree walk: execute() calls
+accept(), which calls a visit method, which calls evaluate() or execute()
+on the parts of the statement, and so on down; and LoxFunction.call runs a
+function's body the same way. Once interpret() is called, it doesn't come
+back until the program is done. In a program built on asyncio, that means
+a long Lox script stops the event loop, and every other task with it.
+
+This subclass does the same walk as coroutines. Every visit method is an
+"async def", and each place the Interpreter calls evaluate() or execute(),
+this awaits them instead. Since Expr.accept and Stmt.accept just return
+whatever the visit method returns, no change to the AST classes is needed:
+awaiting node.accept(self) awaits the visit method's coroutine.
+
+Being coroutines, the visit methods can suspend, and they do, in two
+cases:
+
+* Every so many loop iterations and function calls (see the time_slice
+  argument), the interpreter does a bare yield, which an asyncio Task
+  takes as "let other tasks run" (it is what asyncio.sleep(0) does). So a
+  long-running script shares the loop with everything else. Only loop
+  back-edges and calls can make a program run long, so those are the only
+  places it needs checking.
+
+* A native function can be a coroutine, see NativeFunction in
+  LoxCallable.py with is_async=True. When Lox code calls it, the
+  interpreter awaits it, so the script waits on the I/O or sleep or RPC
+  without blocking anything else.
+
+So hundreds of scripts can share one event loop, each in its own task:
+
+    interpreter = AsyncInterpreter(error_report)
+    interpreter.define_native('fetch', 1, fetch_coroutine, is_async=True)
+    await interpreter.interpret(program)
+
+or more simply, with LoxProgram.run_async(). Note that interpret() and
+one_line_program() are coroutines here.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## Not only asyncio
+
+Nothing here imports asyncio. The only things the coroutines ever yield
+are None, from suspend(), and whatever an awaited native yields. So the
+coroutine can also be driven by hand, with send(None) until it raises
+StopIteration. That's how the task scheduler and the generators of later
+plox features use it.
+
+A generator function (see Generators.py) runs on an AsyncInterpreter of
+its own, and its yield statement is an await that passes a Yielded value
+up to the code that resumes it.
+
+## Cost
+
+A coroutine call costs more than a plain call, so the same program runs
+slower here than under the Interpreter, about one and a half times slower
+when I tried it. Use this interpreter when a script must not block, and
+the ordinary one when it may.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import types
+
+import Expr
+import Stmt
+from TokenType import *
+from Environment import Environment
+from LoxCallable import LoxCallable, LoxFunction, LoxClass, LoxInstance, \
+                        ReturnUnwinder, NativeFunction, NativeError
+from Interpreter import Interpreter, CONTINUE
+from OutputSink import format_value
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, List, Mapping
+
+'''
+Give up control for a moment: a bare yield, passed up through every
+await to whatever is driving the coroutine.
+'''
+@types.coroutine
+def suspend():
+    yield
+
+'''
+A value passed up by a yield statement: "await Yielded(value)" yields this
+object through every await to the code driving the generator.
+'''
+class Yielded():
+    def __init__(self, value:object):
+        self.value = value
+    def __await__(self):
+        yield self
+
+class AsyncInterpreter(Interpreter):
+    '''
+    time_slice is the number of back-edges and calls between suspensions.
+    '''
+    def __init__(self, error_report:Callable[[int,str],None],
+                 locals_map:Mapping[Expr.Expr,int]=None,
+                 time_slice:int=200, output:object=None):
+        super().__init__(error_report, locals_map, output)
+        self.time_slice = time_slice
+        self.countdown = time_slice
+        self.task = None # the Task this runs, if it runs one, see Tasks.py
+        self.use_memos = True # but not in a task, see Tasks.py
+
+    '''
+    Make another AsyncInterpreter to run part of the same program as the
+    given interpreter, for a task or a generator: with its own environment
+    stack but the same globals, depths, output and task scheduler.
+    '''
+    @staticmethod
+    def sharing(interpreter:Interpreter)->AsyncInterpreter:
+        from Tasks import scheduler_of
+        other = AsyncInterpreter(interpreter.error_report,
+                                 locals_map=interpreter.locals,
+                                 output=interpreter.output)
+        other.globals = interpreter.globals
+        other.environment = interpreter.globals
+        other.scheduler = scheduler_of(interpreter)
+        return other
+
+    '''
+    Define a native function in the globals. See NativeFunction.
+    '''
+    def define_native(self, name:str, n_params:int, function, is_async:bool=False):
+        self.globals.define(name, NativeFunction(name, n_params, function, is_async))
+
+    '''
+    Called at each back-edge and call; every time_slice'th time, suspend.
+    '''
+    async def tick(self):
+        self.countdown -= 1
+        if self.countdown <= 0 :
+            self.countdown = self.time_slice
+            await suspend()
+
+    '''
+    The entry points, as in Interpreter, but to be awaited.
+    '''
+    async def interpret(self, program:List[Stmt.Stmt]):
+        try:
+            for a_statement in program:
+                await self.execute(a_statement)
+            if self.scheduler is not None: # let spawned tasks finish
+                self.scheduler.finish()
+        except Interpreter.EvaluationError as EVE:
+            self.report(EVE.token, EVE.message)
+        finally:
+            self.output.flush()
+
+    async def one_line_program(self, program:List[Stmt.Stmt])->object:
+        try:
+            return await self.evaluate(program[0].expression)
+        except Interpreter.EvaluationError as EVE:
+            self.report(EVE.token, EVE.message)
+        finally:
+            self.output.flush()
+
+    async def execute(self, a_statement:Stmt.Stmt):
+        await a_statement.accept(self)
+
+    async def evaluate(self, client:Expr.Expr)->object:
+        return await client.accept(self)
+
+    '''
+    Calling things. A LoxFunction or LoxClass is called here, rather than
+    by its call() method, which would run the body with the blocking
+    execute_block of Interpreter. The logic is the same as theirs, see
+    LoxCallable.py. A native is called as usual, unless it is async, in
+    which case its call_async coroutine is awaited. So is a generator
+    function, since all its call does is make the generator.
+    '''
+    async def call_function(self, function:LoxFunction, args:List[object])->object:
+        await self.tick()
+        environment = Environment(function.closure)
+        for (param,arg) in zip(function.declaration.params,args):
+            environment.define( param.lexeme, arg )
+        try:
+            await self.execute_block(function.declaration.body, environment)
+            return_value = None
+        except ReturnUnwinder as RW:
+            return_value = RW.return_value
+        return function.closure.fetch("this") if function.isInitializer else return_value
+
+    async def call(self, callee:LoxCallable, args:List[object])->object:
+        if isinstance(callee, LoxFunction) and not callee.declaration.generator:
+            return await self.call_function(callee, args)
+        if isinstance(callee, LoxClass):
+            instance = LoxInstance(callee)
+            initializer = callee.initializer
+            if initializer : # has been declared,
+                await self.call_function(initializer.bind(instance), args)
+            return instance
+        if callee.is_async :
+            return await callee.call_async(self, args)
+        return callee.call(self, args)
+
+    '''
+    Statements. Each is the same as in Interpreter, awaiting where that
+    calls.
+    '''
+    async def visitExpression(self, client:Stmt.Expression):
+        await self.evaluate(client.expression)
+
+    async def visitPrint(self, client:Stmt.Print):
+        self.output.write_line(format_value(await self.evaluate(client.expression)))
+
+    async def visitVar(self, client:Stmt.Var):
+        value = None
+        if client.initializer: # is not None,
+            value = await self.evaluate(client.initializer)
+        self.environment.define( client.name.lexeme, value )
+
+    async def visitClass(self, client:Stmt.Class):
+        superclass = None
+        if client.superclass: # is given
+            superclass = await self.evaluate(client.superclass)
+        self.define_class(client, superclass)
+
+    async def visitFunction(self, client:Stmt.Function):
+        Interpreter.visitFunction(self, client)
+
+    async def visitReturn(self, client:Stmt.Return):
+        return_value = None
+        if client.value : # is an expr not just None
+            return_value = await self.evaluate(client.value)
+        raise ReturnUnwinder(return_value)
+
+    async def visitWhile(self, client:Stmt.While):
+        self.environment.define(CONTINUE,True)
+        while self.isTruthy( await self.evaluate(client.condition ) ) \
+              and self.environment.fetch(CONTINUE) :
+            await self.execute(client.body)
+            await self.tick()
+        self.environment.define(CONTINUE,True)
+
+    async def visitYield(self, client:Stmt.Yield):
+        value = None
+        if client.value : # is an expr not just None
+            value = await self.evaluate(client.value)
+        await Yielded(value)
+
+    async def visitBreak(self, client:Stmt.Break):
+        self.environment.define(CONTINUE,False)
+
+    async def visitBlock(self, client:Stmt.Block):
+        if client in self.locals: # declares nothing, see Interpreter.visitBlock
+            await self.execute_flat( client.statements )
+            return
+        await self.execute_block( client.statements, Environment(self.environment) )
+
+    async def execute_block(self, stmts:List[Stmt.Stmt], context:Environment ):
+        save_context = self.environment
+        try:
+            self.environment = context
+            for statement in stmts:
+                await self.execute(statement)
+                if not self.environment.fetch(CONTINUE):
+                    break
+        finally:
+            self.environment = save_context
+            if context.upvalues : # see Interpreter.execute_block
+                context.close()
+
+    async def execute_flat(self, stmts:List[Stmt.Stmt]):
+        environment = self.environment
+        saved = dict.get(environment, CONTINUE) # see Interpreter.execute_flat
+        try:
+            for statement in stmts:
+                await self.execute(statement)
+                if not environment.fetch(CONTINUE):
+                    break
+        finally:
+            if dict.get(environment, CONTINUE) is not saved:
+                if saved is None:
+                    dict.__delitem__(environment, CONTINUE)
+                else:
+                    dict.__setitem__(environment, CONTINUE, saved)
+
+    async def visitMemoize(self, client:Stmt.Memoize):
+        try:
+            await self.execute(client.body)
+        finally:
+            for key in client.memos:
+                self.memos.pop(key, None)
+
+    async def visitIf(self, client:Stmt.If):
+        if self.isTruthy( await self.evaluate( client.condition ) ):
+            await self.execute( client.thenBranch )
+        elif client.elseBranch : # is not None,
+            await self.execute( client.elseBranch )
+
+    '''
+    Expressions, likewise.
+    '''
+    async def visitLiteral(self, client:Expr.Literal)->object:
+        return client.value
+
+    async def visitLogical(self, client:Expr.Logical)->object:
+        lvalue = await self.evaluate(client.left)
+        if client.operator.type == OR :
+            if self.isTruthy(lvalue) :
+                return lvalue
+        else: # operator is AND
+            if not self.isTruthy(lvalue):
+                return lvalue
+        return await self.evaluate(client.right)
+
+    async def visitGrouping(self, client:Expr.Grouping)->object:
+        return await self.evaluate(client.expression)
+
+    async def visitMemo(self, client:Expr.Memo)->object:
+        if not self.use_memos :
+            return await self.evaluate(client.expression)
+        memos = self.memos
+        if client.key in memos:
+            return memos[client.key]
+        value = await self.evaluate(client.expression)
+        memos[client.key] = value
+        return value
+
+    async def visitVariable(self, client:Expr.Variable)->object:
+        return self.lookUpVariable(client.name, client)
+
+    async def visitAssign(self, client:Expr.Assign)->object:
+        value = await self.evaluate(client.value)
+        depth = self.locals.get(client)
+        if depth is None:
+            self.assign_global(client, value)
+            return value
+        return self.environment.assignAt(depth,client.name.lexeme,value)
+
+    async def visitUnary(self, client:Expr.Unary)->object:
+        rhs = await self.evaluate(client.right)
+        if client.operator.type == MINUS:
+            if rhs.__class__ is int: # see "Integers" in Interpreter.py
+                return -rhs if rhs else -0.0
+            try:
+                return -float(rhs)
+            except ValueError: # rhs is not a number
+                raise Interpreter.EvaluationError(client.operator,'A numeric value is required')
+        return not self.isTruthy(rhs)
+
+    async def visitCall(self, client:Expr.Call)->object:
+        callee = await self.evaluate(client.callee)
+        if not isinstance(callee, LoxCallable) :
+            raise Interpreter.EvaluationError(client.paren,
+                            "Only functions and classes can be called.")
+        params = []
+        for argument in client.arguments:
+            params.append( await self.evaluate(argument) )
+        if callee.arity() != len(params):
+            raise Interpreter.EvaluationError(client.paren,
+                    f"Expected {callee.arity()} arguments but got {len(params)}." )
+        try:
+            return await self.call(callee, params)
+        except NativeError as NE:
+            raise Interpreter.EvaluationError(client.paren, str(NE))
+
+    async def visitGet(self, client:Expr.Get)->object:
+        return self.get_property(client, await self.evaluate(client.object))
+
+    async def visitSet(self, client:Expr.Set)->object:
+        target = await self.evaluate(client.object)
+        if not isinstance(target,LoxInstance):
+            raise Interpreter.EvaluationError(
+                    client.name, f"Only instances may have fields" )
+        value = await self.evaluate(client.value)
+        target.set(client.name,value)
+        return value
+
+    async def visitThis(self, client:Expr.This)->object:
+        return self.lookUpVariable(client.keyword, client)
+
+    async def visitSuper(self, client:Expr.Super)->LoxFunction:
+        return Interpreter.visitSuper(self, client)
+
+    async def visitBinary(self, client:Expr.Binary)->object:
+        lhs = await self.evaluate(client.left)
+        rhs = await self.evaluate(client.right)
+        return self.binary_value(client, lhs, rhs)
@@ -0,0 +1,553 @@
+'''
+
+# ClosureCompiler: a function or loop made into Python closures
+
+Not in the book. The Interpreter runs a program by walking its tree, and
+every node it passes costs a call of accept(), a call of the visit
+method, loads of the node's attributes, and for a variable, a lookup of
+its depth in the locals map, then a walk up the Environments, one call
+per level. That is cheap enough for code that runs once, which is most
+code. The few functions and loops that run thousands of times are worth
+more trouble: the TieredInterpreter (see TieredInterpreter.py) gives
+them to this compiler, which turns the tree into Python closures, one per
+node, each calling those of its children directly. What a visit method
+looks up every time, a closure has looked up once, when it was made:
+
+* the operator of a Binary picks the closure, and a number on either
+  side gets a fast path of its own; anything but two floats goes to the
+  Interpreter's binary_value, so strings, --int numbers and every error
+  are as they were.
+* a local variable's depth is known, and for the Environments the
+  compiled code makes itself (the function's own, and its blocks'), which
+  hold their variables directly, a closure goes up the known number of
+  levels and indexes the dict. Anything further up, a Closure of captured
+  variables, or the scopes around a compiled loop, goes through getAt()
+  and assignAt() as usual. A global is bound to its Cell when compiled
+  (see "Global cells" in Environment.py).
+* a property get tries the instance's fields before anything else.
+
+The compiled code passes the current Environment to each closure, rather
+than keeping it in the Interpreter's environment attribute, and never
+reads it from there.
+
+## Break, return, and the CONTINUE flag
+
+The Interpreter implements break with a flag, CONTINUE, set False by
+break in the current Environment and looked up by every block after each
+of its statements, and by while loops. Here a statement's closure returns
+instead: None to carry on, BROKE for a break, and a 1-tuple of the value
+for a return. The innermost statement list (a block's, flat or not, see
+"Blocks that declare nothing" in Resolver.py) takes a BROKE and stops,
+which is what the flag makes it do: it is the first to look, and a block
+with its own Environment loses the flag with it, a flat one puts it back
+as it was. A while loop takes a BROKE from its body only when the break
+is not in a block, and then stops after evaluating its condition once
+more, as the Interpreter does, with the flag set meanwhile.
+
+So the flag is only ever written, by while loops, where something else
+might look at it. The one place another function can see it is the
+globals, where it is False only while a top-level loop ends on a break,
+and a function called from the loop's condition then would stop after
+the first statement of each block. The TieredInterpreter runs any call
+made at such a moment on the tree walker, see enter() below.
+
+## What is compiled
+
+Everything that can be in a function or loop body, but for classes
+declared inside one, and the bodies of generators, which run on an
+AsyncInterpreter (see Generators.py). Given either, the compiler raises
+ClosureCompiler.Unsupported, and the function or loop stays on the tree
+walker.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import operator
+import Expr
+import Stmt
+from ExprVisitorClass import ExprVisitor
+from StmtVisitorClass import StmtVisitor
+from TokenType import *
+from Environment import Environment, Closure, UNDEFINED
+from LoxCallable import LoxCallable, LoxFunction, LoxInstance, NativeError
+from OutputSink import format_value
+from Interpreter import Interpreter, CONTINUE
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, List
+    from Token import Token
+
+'''
+What a statement's closure returns for a break, see above.
+'''
+BROKE = object()
+
+'''
+The operators of Binary done directly on two floats, by their token
+type, see visitBinary. Division is not here, for division by zero.
+'''
+FLOAT_OPS = {
+    PLUS:  operator.add,
+    MINUS: operator.sub,
+    STAR:  operator.mul,
+    GREATER: operator.gt,
+    GREATER_EQUAL: operator.ge,
+    LESS:  operator.lt,
+    LESS_EQUAL: operator.le,
+}
+
+class ClosureCompiler(ExprVisitor,StmtVisitor):
+
+    class Unsupported(Exception):
+        pass
+
+    def __init__(self, interpreter:Interpreter):
+        self.interpreter = interpreter
+        self.locals = interpreter.locals
+        self.globals = interpreter.globals
+        '''
+        How many levels of Environment, from the current one up, the
+        compiled code made itself, see above.
+        '''
+        self.owned = 0
+
+    '''
+    Compile a function's body. The result, given the LoxFunction and its
+    arguments, does what LoxFunction.call does and returns the value.
+    '''
+    def function(self, declaration:Stmt.Function)->Callable:
+        if declaration.generator :
+            raise ClosureCompiler.Unsupported("a generator")
+        self.owned = 1
+        body = self.sequence(declaration.body)
+        params = [param.lexeme for param in declaration.params]
+        interpreter = self.interpreter
+        globals_env = self.globals
+        def enter(function:LoxFunction, args:List[object])->object:
+            if not globals_env[CONTINUE]: # see "Break, return..." above
+                return function.call(interpreter, args)
+            environment = Environment(function.closure)
+            environment.update(zip(params, args))
+            try:
+                result = body(environment)
+            finally:
+                if environment.upvalues :
+                    environment.close()
+            if function.isInitializer :
+                return function.closure.fetch("this")
+            return None if result is None else result[0]
+        return enter
+
+    '''
+    Compile a while loop, to run in the Environment it is in, counting
+    the evaluations of its condition in counter[0].
+    '''
+    def loop(self, client:Stmt.While, counter:List[int])->Callable:
+        self.owned = 1
+        condition = self.compile_expr(client.condition)
+        def counted(environment):
+            counter[0] += 1
+            return condition(environment)
+        return self.while_loop(counted, self.compile(client.body))
+
+    def compile(self, a_statement:Stmt.Stmt)->Callable:
+        return a_statement.accept(self)
+
+    def compile_expr(self, an_expr:Expr.Expr)->Callable:
+        return an_expr.accept(self)
+
+    '''
+    The statements of a block run one after another, until one returns
+    anything but None; a BROKE stops here, a return goes on up.
+    '''
+    def sequence(self, stmts:List[Stmt.Stmt])->Callable:
+        compiled = [self.compile(a_statement) for a_statement in stmts]
+        if len(compiled) == 1:
+            (first,) = compiled
+            def run(environment):
+                result = first(environment)
+                if result is not BROKE:
+                    return result
+            return run
+        if len(compiled) == 2:
+            (first, second) = compiled
+            def run(environment):
+                result = first(environment)
+                if result is None:
+                    result = second(environment)
+                if result is not BROKE:
+                    return result
+            return run
+        def run(environment):
+            for a_statement in compiled:
+                result = a_statement(environment)
+                if result is not None:
+                    return None if result is BROKE else result
+        return run
+
+    '''
+    Statements. Each closure takes the current Environment.
+    '''
+    def visitBlock(self, client:Stmt.Block):
+        if client in self.locals: # declares nothing, runs where it is
+            return self.sequence(client.statements)
+        self.owned += 1
+        body = self.sequence(client.statements)
+        self.owned -= 1
+        def run(environment):
+            context = Environment(environment)
+            try:
+                return body(context)
+            finally:
+                if context.upvalues :
+                    context.close()
+        return run
+
+    def visitExpression(self, client:Stmt.Expression):
+        expression = self.compile_expr(client.expression)
+        def run(environment):
+            expression(environment)
+        return run
+
+    def visitPrint(self, client:Stmt.Print):
+        expression = self.compile_expr(client.expression)
+        interpreter = self.interpreter
+        def run(environment):
+            interpreter.output.write_line(format_value(expression(environment)))
+        return run
+
+    def visitVar(self, client:Stmt.Var):
+        name = client.name.lexeme
+        if client.initializer is None:
+            def run(environment):
+                environment[name] = None
+            return run
+        initializer = self.compile_expr(client.initializer)
+        def run(environment):
+            environment[name] = initializer(environment)
+        return run
+
+    def visitClass(self, client:Stmt.Class):
+        raise ClosureCompiler.Unsupported(f"class {client.name.lexeme}")
+
+    '''
+    A function declared inside: as Interpreter.visitFunction and
+    closure_of, with the free variables looked up now.
+    '''
+    def visitFunction(self, client:Stmt.Function):
+        name = client.name.lexeme
+        free = self.locals.get(client)
+        globals_env = self.globals
+        if free is None:
+            def run(environment):
+                environment[name] = LoxFunction(client, globals_env)
+            return run
+        def run(environment):
+            closure = Closure(globals_env)
+            for (free_name, depth) in free:
+                closure.define(free_name, environment.ancestor(depth).capture(free_name))
+            environment[name] = LoxFunction(client, closure)
+        return run
+
+    def visitReturn(self, client:Stmt.Return):
+        if client.value is None:
+            nothing = (None,)
+            return lambda environment: nothing
+        value = self.compile_expr(client.value)
+        def run(environment):
+            return (value(environment),)
+        return run
+
+    def visitYield(self, client:Stmt.Yield):
+        raise ClosureCompiler.Unsupported("yield")
+
+    def visitBreak(self, client:Stmt.Break):
+        return lambda environment: BROKE
+
+    def visitWhile(self, client:Stmt.While):
+        return self.while_loop(self.compile_expr(client.condition),
+                               self.compile(client.body))
+
+    def while_loop(self, condition:Callable, body:Callable)->Callable:
+        def run(environment):
+            environment[CONTINUE] = True
+            while True:
+                test = condition(environment)
+                if test is None or test is False:
+                    break
+                result = body(environment)
+                if result is not None:
+                    if result is not BROKE:
+                        return result # a return
+                    environment[CONTINUE] = False
+                    condition(environment) # as Interpreter.visitWhile does
+                    break
+            environment[CONTINUE] = True
+        return run
+
+    def visitMemoize(self, client:Stmt.Memoize):
+        body = self.compile(client.body)
+        keys = client.memos
+        interpreter = self.interpreter
+        def run(environment):
+            try:
+                return body(environment)
+            finally:
+                memos = interpreter.memos
+                for key in keys:
+                    memos.pop(key, None)
+        return run
+
+    def visitIf(self, client:Stmt.If):
+        condition = self.compile_expr(client.condition)
+        then_branch = self.compile(client.thenBranch)
+        if client.elseBranch is None:
+            def run(environment):
+                test = condition(environment)
+                if test is not None and test is not False:
+                    return then_branch(environment)
+            return run
+        else_branch = self.compile(client.elseBranch)
+        def run(environment):
+            test = condition(environment)
+            if test is not None and test is not False:
+                return then_branch(environment)
+            return else_branch(environment)
+        return run
+
+    '''
+    Expressions. Each closure takes the current Environment and returns
+    the value.
+    '''
+    def visitLiteral(self, client:Expr.Literal):
+        value = client.value
+        return lambda environment: value
+
+    def visitGrouping(self, client:Expr.Grouping):
+        return self.compile_expr(client.expression)
+
+    def visitLogical(self, client:Expr.Logical):
+        left = self.compile_expr(client.left)
+        right = self.compile_expr(client.right)
+        if client.operator.type == OR:
+            def evaluate(environment):
+                value = left(environment)
+                if value is not None and value is not False:
+                    return value
+                return right(environment)
+            return evaluate
+        def evaluate(environment):
+            value = left(environment)
+            if value is None or value is False:
+                return value
+            return right(environment)
+        return evaluate
+
+    def visitMemo(self, client:Expr.Memo):
+        expression = self.compile_expr(client.expression)
+        key = client.key
+        interpreter = self.interpreter
+        def evaluate(environment):
+            memos = interpreter.memos
+            if key in memos:
+                return memos[key]
+            value = memos[key] = expression(environment)
+            return value
+        return evaluate
+
+    '''
+    A variable, or this: read at its depth, see above.
+    '''
+    def reference(self, client:Expr.Expr, name_token:Token)->Callable:
+        name = name_token.lexeme
+        depth = self.locals.get(client)
+        if depth is None:
+            cell = self.globals.bind(client, name)
+            def evaluate(environment):
+                value = cell.value
+                if value is UNDEFINED:
+                    raise Interpreter.EvaluationError(name_token, f"Undefined name {name}")
+                return value
+            return evaluate
+        if depth >= self.owned:
+            return lambda environment: environment.getAt(depth, name)
+        if depth == 0:
+            return lambda environment: environment[name]
+        if depth == 1:
+            return lambda environment: environment.enclosing[name]
+        if depth == 2:
+            return lambda environment: environment.enclosing.enclosing[name]
+        def evaluate(environment):
+            for level in range(depth):
+                environment = environment.enclosing
+            return environment[name]
+        return evaluate
+
+    def visitVariable(self, client:Expr.Variable):
+        return self.reference(client, client.name)
+
+    def visitThis(self, client:Expr.This):
+        return self.reference(client, client.keyword)
+
+    '''
+    An assignment. Note that, as in Interpreter.visitAssign, assigning a
+    local has the value nil, and a global the value assigned.
+    '''
+    def visitAssign(self, client:Expr.Assign):
+        name = client.name.lexeme
+        value = self.compile_expr(client.value)
+        depth = self.locals.get(client)
+        if depth is None:
+            globals_env = self.globals
+            cell = globals_env.bind(client, name)
+            def evaluate(environment):
+                result = value(environment)
+                if cell.value is UNDEFINED:
+                    raise Interpreter.EvaluationError(client.name, f"Undefined name {name}")
+                globals_env[name] = result
+                return result
+            return evaluate
+        if depth >= self.owned:
+            def evaluate(environment):
+                environment.assignAt(depth, name, value(environment))
+            return evaluate
+        if depth == 0:
+            def evaluate(environment):
+                environment[name] = value(environment)
+            return evaluate
+        def evaluate(environment):
+            result = value(environment)
+            for level in range(depth):
+                environment = environment.enclosing
+            environment[name] = result
+        return evaluate
+
+    def visitUnary(self, client:Expr.Unary):
+        right = self.compile_expr(client.right)
+        if client.operator.type == BANG:
+            def evaluate(environment):
+                value = right(environment)
+                return value is None or value is False
+            return evaluate
+        def evaluate(environment):
+            value = right(environment)
+            if value.__class__ is float:
+                return -value
+            if value.__class__ is int:
+                return -value if value else -0.0
+            try:
+                return -float(value)
+            except ValueError:
+                raise Interpreter.EvaluationError(client.operator,'A numeric value is required')
+        return evaluate
+
+    '''
+    A binary operator. Two floats, or a float and a number literal, are
+    done here; anything else by the Interpreter, see above.
+    '''
+    def visitBinary(self, client:Expr.Binary):
+        op = client.operator.type
+        left = self.compile_expr(client.left)
+        right = self.compile_expr(client.right)
+        if op == EQUAL_EQUAL:
+            return lambda environment: left(environment) == right(environment)
+        if op == BANG_EQUAL:
+            return lambda environment: not left(environment) == right(environment)
+        binary_value = self.interpreter.binary_value
+        if op == SLASH:
+            def evaluate(environment):
+                lhs = left(environment)
+                rhs = right(environment)
+                if lhs.__class__ is float and rhs.__class__ is float and rhs:
+                    return lhs / rhs
+                return binary_value(client, lhs, rhs)
+            return evaluate
+        float_op = FLOAT_OPS[op]
+        constant = client.right
+        if isinstance(constant, Expr.Literal) and constant.value.__class__ is float:
+            rhs = constant.value
+            def evaluate(environment):
+                lhs = left(environment)
+                if lhs.__class__ is float:
+                    return float_op(lhs, rhs)
+                return binary_value(client, lhs, rhs)
+            return evaluate
+        def evaluate(environment):
+            lhs = left(environment)
+            rhs = right(environment)
+            if lhs.__class__ is float and rhs.__class__ is float:
+                return float_op(lhs, rhs)
+            return binary_value(client, lhs, rhs)
+        return evaluate
+
+    '''
+    A call: as Interpreter.visitCall, in the same order, but through the
+    TieredInterpreter's call_function and call, which may run what is
+    called compiled too.
+    '''
+    def visitCall(self, client:Expr.Call):
+        callee_of = self.compile_expr(client.callee)
+        arguments = [self.compile_expr(argument) for argument in client.arguments]
+        count = len(arguments)
+        call_function = self.interpreter.call_function
+        call = self.interpreter.call
+        paren = client.paren
+        def evaluate(environment):
+            callee = callee_of(environment)
+            if not isinstance(callee, LoxCallable) :
+                raise Interpreter.EvaluationError(paren,
+                                "Only functions and classes can be called.")
+            args = [argument(environment) for argument in arguments]
+            if callee.arity() != count:
+                raise Interpreter.EvaluationError(paren,
+                        f"Expected {callee.arity()} arguments but got {count}." )
+            if callee.__class__ is LoxFunction:
+                return call_function(callee, args)
+            try:
+                return call(callee, args)
+            except NativeError as NE:
+                raise Interpreter.EvaluationError(paren, str(NE))
+        return evaluate
+
+    def visitGet(self, client:Expr.Get):
+        source_of = self.compile_expr(client.object)
+        name = client.name.lexeme
+        get_property = self.interpreter.get_property
+        def evaluate(environment):
+            source = source_of(environment)
+            if source.__class__ is LoxInstance:
+                fields = source.fields
+                if name in fields:
+                    return fields[name]
+            return get_property(client, source)
+        return evaluate
+
+    def visitSet(self, client:Expr.Set):
+        target_of = self.compile_expr(client.object)
+        value_of = self.compile_expr(client.value)
+        name = client.name.lexeme
+        def evaluate(environment):
+            target = target_of(environment)
+            if not isinstance(target, LoxInstance):
+                raise Interpreter.EvaluationError(
+                        client.name, f"Only instances may have fields" )
+            value = value_of(environment)
+            target.fields[name] = value
+            return value
+        return evaluate
+
+    def visitSuper(self, client:Expr.Super):
+        depth = self.locals[client]
+        method_name = client.method.lexeme
+        def evaluate(environment):
+            superclass = environment.getAt(depth, "super")
+            that = environment.getAt(depth-1, "this")
+            method = superclass.findMethod(method_name)
+            if method : # was found, is not None,
+                return method.bind(that)
+            raise Interpreter.EvaluationError(client.method,
+                                f"Undefined property '{method_name}'." )
+        return evaluate
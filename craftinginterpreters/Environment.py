@@ -108,12 +108,74 @@ a display of the whole dict,
 That can't be what this toString is returning, but then what? The Environment is
 not given an identifier it could be displaying...
 
+## Flat closures
+
+Not in the book. A LoxFunction used to keep, as its closure, the whole
+Environment it was declared in, and with it every Environment enclosing
+that one. A little callback made deep inside a function kept every local
+of every enclosing call alive as long as it lived, whether it used them
+or not; and its references to them walked the chain, one ancestor() per
+level.
+
+Now the Resolver works out the free variables of each function: the
+locals of enclosing scopes that its body (or a function inside it) uses.
+When the function is declared, the Interpreter makes it a Closure, below:
+an Environment holding one Upvalue per free variable and nothing else,
+enclosed directly by the globals. The Resolver's depths for references
+to free variables lead to the Closure, and the Closure gives the value
+of the Upvalue, so getAt() and assignAt() work as ever. A function with
+no free variables needs no Closure; its closure is just the globals.
+
+An Upvalue is the clox idea (Crafting Interpreters chapter 25): a shared,
+changeable cell for one variable. While the scope that declared the
+variable is running, the Upvalue is open, and reads and writes the
+variable where it lives, in that scope's Environment, so the scope and
+every closure that captured the variable see the same value. All the
+closures that capture the same variable of the same Environment share
+one Upvalue, kept in that Environment's upvalues dict. When the scope
+ends (see execute_block in Interpreter.py), close() closes them: each
+Upvalue takes a copy of the value and lets go of the Environment, which,
+and whose enclosing Environments, can then be collected. Nothing but the
+closures can see the variable after that, and they share the copy.
+
+A function declared inside another function captures a free variable of
+the outer one from the outer one's Closure, which gives it the same
+Upvalue, so there is still only one.
+
+## Global cells
+
+Not in the book. The Resolver gives no depth to a reference to a global,
+so every time one ran, the Interpreter looked it up in the locals in
+vain, then called get(), which called fetch(), which asked the globals
+whether they had it and then for it. Every call of clock() or of a
+top-level function paid that.
+
+Now the globals are a Globals, below, which keeps a Cell for each name
+that is referred to: the value of that global, kept up to date by
+__setitem__, which every define() and assign() goes through. The first
+time a reference runs, the Interpreter binds it to its Cell, in the sites
+map of the Globals; after that, the value is the Cell's value attribute.
+A name referred to before it is defined gets a Cell holding UNDEFINED,
+which the definition replaces.
+
+The Globals remain a dict of the values, for everything else that reads
+them. The sites and Cells are for this run only: a Globals pickles
+without them (see HeapImage.py and Parallel.py), and binds afresh.
 '''
 from __future__ import annotations # allow forward-reference to this class
 
-from typing import Optional
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Mapping, Optional
 
 class Environment(dict):
+    '''
+    The open Upvalues of variables in this Environment, by name, made by
+    capture(); None (the class value, so that making an Environment costs
+    nothing more) until a closure captures one.
+    '''
+    upvalues = None # Optional[Mapping[str,Upvalue]]
+
     def __init__(self, enclosing=None):
         self.enclosing = enclosing # Optional[Environment]
 
@@ -201,3 +263,141 @@ class Environment(dict):
     def assignAt(self, distance:int, name:str, value:object):
         self.ancestor(distance).assign(name, value)
 
+    '''
+    The Upvalue of a variable defined here, for a closure, see "Flat
+    closures" above. The same one for every closure that captures it.
+    '''
+    def capture(self, name:str)->Upvalue:
+        upvalues = self.upvalues
+        if upvalues is None:
+            upvalues = self.upvalues = dict()
+        upvalue = upvalues.get(name)
+        if upvalue is None:
+            upvalue = upvalues[name] = Upvalue(self, name)
+        return upvalue
+
+    '''
+    The scope of this Environment has ended: close its Upvalues.
+    '''
+    def close(self):
+        for upvalue in self.upvalues.values():
+            upvalue.close()
+        self.upvalues = None
+
+'''
+One captured variable. Open, environment is where the variable lives;
+closed, environment is None and value is the variable.
+'''
+class Upvalue():
+    __slots__ = ('environment', 'name', 'value')
+
+    def __init__(self, environment:Environment, name:str):
+        self.environment = environment
+        self.name = name
+        self.value = None
+
+    def get(self)->object:
+        environment = self.environment
+        if environment is None:
+            return self.value
+        return environment[self.name]
+
+    def set(self, value:object):
+        environment = self.environment
+        if environment is None:
+            self.value = value
+        else:
+            environment[self.name] = value
+
+    def close(self):
+        self.value = self.environment[self.name]
+        self.environment = None
+
+'''
+The closure of a function, holding an Upvalue for each of its free
+variables. Reading a name gives the value of its Upvalue, and assign()
+sets it. fetch(), and so get() and getAt(), do what get() of the Upvalue
+does in line, since every reference to a free variable comes here.
+define() is only used, by the Interpreter, to put the Upvalues in.
+Capturing a name from here gives its Upvalue itself, so a function
+declared inside the one this belongs to shares it.
+
+Note that __setitem__ is left alone: pickle (see HeapImage.py) puts the
+Upvalues back in with it when loading, and must not have them unwrapped.
+'''
+class Closure(Environment):
+    def __getitem__(self, name:str)->object:
+        return dict.__getitem__(self, name).get()
+
+    def fetch(self, name:str)->object:
+        if self.__contains__(name):
+            upvalue = dict.__getitem__(self, name)
+            environment = upvalue.environment
+            if environment is None:
+                return upvalue.value
+            return environment[name]
+        return self.enclosing.fetch(name)
+
+    get = fetch
+
+    def assign(self, name:str, value:object):
+        if self.__contains__(name):
+            dict.__getitem__(self, name).set(value)
+        else:
+            self.enclosing.assign(name, value)
+
+    def capture(self, name:str)->Upvalue:
+        return dict.__getitem__(self, name)
+
+'''
+The value of a Cell of a global not yet defined.
+'''
+UNDEFINED = object()
+
+'''
+The value of one global, for the references to it, see "Global cells"
+above.
+'''
+class Cell():
+    __slots__ = ('value',)
+
+    def __init__(self, value:object):
+        self.value = value
+
+'''
+The global Environment. cells are by name, and sites, the references bound
+to them, by the Expr of the reference.
+'''
+class Globals(Environment):
+    cells = None # Optional[Mapping[str,Cell]]
+
+    def __init__(self):
+        super().__init__()
+        self.cells = dict()
+        self.sites = dict() # Mapping[Expr,Cell]
+
+    def __setitem__(self, name:str, value:object):
+        dict.__setitem__(self, name, value)
+        cells = self.cells
+        if cells is not None: # None while being unpickled
+            cell = cells.get(name)
+            if cell is not None:
+                cell.value = value
+
+    '''
+    Bind a reference to the Cell of its name, made if need be.
+    '''
+    def bind(self, reference:object, name:str)->Cell:
+        cell = self.cells.get(name)
+        if cell is None:
+            cell = self.cells[name] = Cell(dict.get(self, name, UNDEFINED))
+        self.sites[reference] = cell
+        return cell
+
+    def __getstate__(self)->dict:
+        return {'enclosing': self.enclosing}
+
+    def __setstate__(self, state:dict):
+        self.enclosing = state['enclosing']
+        self.cells = dict()
+        self.sites = dict()
@@ -8,8 +8,11 @@
 #  Creative Commons Attribution-NonCommercial 4.0 International License
 #  see http://creativecommons.org/licenses/by-nc/4.0/
 
+from __future__ import annotations # no annotation is evaluated
 from Token import Token
-from typing import List
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List
 
 class Expr:
 	def accept(self,visitor:object):
@@ -122,3 +125,12 @@ class Variable(Expr):
 
 	def accept(self, visitor:object):
 		return visitor.visitVariable(self)
+
+class Memo(Expr):
+	def __init__(self, expression:Expr,key:Expr ):
+		# initialize attributes
+		self.expression = expression
+		self.key = key
+
+	def accept(self, visitor:object):
+		return visitor.visitMemo(self)
@@ -36,3 +36,5 @@ class ExprVisitor:
         raise NotImplementedError("No visitor defined for Expr.Unary")
     def visitVariable(self, client:Expr.Variable)->object:
         raise NotImplementedError("No visitor defined for Expr.Variable")
+    def visitMemo(self, client:Expr.Memo)->object:
+        raise NotImplementedError("No visitor defined for Expr.Memo")
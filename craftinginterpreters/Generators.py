@@ -0,0 +1,161 @@
+'''
+
+# Generators: functions that yield a stream of values
+
+Not in the book. To work through a large data set in Lox, a script had to
+build all of it first, as a linked list of instances, say, and then walk
+it. A generator makes the values one at a time, as they are wanted, so a
+pipeline of them holds only the value in hand:
+
+    fun numbers(limit) {
+        var i = 0;
+        while (i < limit) { yield i; i = i + 1; }
+    }
+    fun squares(source) {
+        while (!done(source)) { var n = next(source); yield n * n; }
+    }
+    var it = squares(numbers(1000000));
+    var total = 0;
+    while (!done(it)) total = total + next(it);
+
+A function (or method) whose body contains a yield statement is a
+generator function. Calling it does not execute its body; it returns a
+generator, which these builtins consume:
+
+    next(gen)    run the body until its next yield, and return the value
+                 yielded; once the body has ended, return nil.
+    done(gen)    true when the body has ended, and there is nothing more
+                 for next() to return.
+
+The body ends by running off its end or by a plain "return;". A return
+with a value is an error in a generator (see Resolver.py), as is a yield
+in an initializer. "yield;" alone yields nil.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## How it works
+
+The Interpreter can't stop partway through a function body and carry on
+later: its state is the Python stack of the recursive visit calls. An
+AsyncInterpreter (see AsyncInterpreter.py) keeps that same state in a
+chain of coroutines, which can be suspended. So a generator runs its
+function's body on an AsyncInterpreter of its own, sharing the globals and
+variable depths of the interpreter that called the function, exactly as a
+task does (see Tasks.py). A yield statement there awaits a Yielded object
+holding the value, which comes up out of the coroutine's send(); next()
+keeps sending until one does. The other things a coroutine can pass up,
+None at the end of a time slice, are just passed over.
+
+done() has to know whether there is another value, and the only way to
+find out is to run the body to its next yield, so it does, and keeps the
+value for the next call of next().
+
+A runtime error in the body is reported where it happened, in the body,
+and (as with any error) stops the program. The generator is finished after
+that, as it is after its body ends.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+
+from LoxCallable import LoxCallable, LoxFunction, NativeError
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List
+
+class LoxGenerator():
+    '''
+    Made by LoxFunction.call, for a function whose declaration is marked
+    as a generator. The coroutine isn't made until the first value is
+    wanted, so a generator that is never used costs next to nothing.
+    '''
+    def __init__(self, function:LoxFunction, interpreter, args:List[object]):
+        self.function = function
+        self.interpreter = interpreter
+        self.args = args
+        self.coroutine = None
+        self.has_value = False # a value yielded and not yet taken by next()
+        self.value = None
+        self.finished = False
+        self.running = False
+
+    '''
+    Run the body to its next yield, keeping the value; or to its end.
+    '''
+    def advance(self):
+        from AsyncInterpreter import AsyncInterpreter, Yielded # not at top: it imports us
+        if self.running :
+            raise NativeError("A generator can't resume itself.")
+        if self.coroutine is None:
+            body_interpreter = AsyncInterpreter.sharing(self.interpreter)
+            self.coroutine = body_interpreter.call_function(self.function, self.args)
+            self.interpreter = self.args = None # done with those
+        self.running = True
+        try:
+            while True:
+                signal = self.coroutine.send(None)
+                if isinstance(signal, Yielded):
+                    self.value = signal.value
+                    self.has_value = True
+                    return
+                if signal is not None: # waiting on a channel, see Tasks.py
+                    self.coroutine.close()
+                    raise NativeError("A generator can't wait on a channel.")
+        except StopIteration:
+            self.finished = True
+        except BaseException:
+            self.finished = True
+            raise
+        finally:
+            self.running = False
+
+    def is_done(self)->bool:
+        if not (self.has_value or self.finished):
+            self.advance()
+        return not self.has_value
+
+    def take(self)->object:
+        if not (self.has_value or self.finished):
+            self.advance()
+        value = self.value
+        self.has_value = False
+        self.value = None
+        return value
+
+    def __str__(self)->str:
+        return f"generator {self.function.declaration.name.lexeme}()"
+
+    '''
+    A generator part way through its body is a Python coroutine, which
+    can't be pickled, so none can be saved in a heap image (HeapImage.py).
+    '''
+    def __reduce__(self):
+        raise TypeError("a generator cannot be saved")
+
+'''
+## The builtins
+'''
+def check_generator(value:object, operation:str)->LoxGenerator:
+    if not isinstance(value, LoxGenerator):
+        raise NativeError(f"{operation} needs a generator")
+    return value
+
+class Next(LoxCallable):
+    def arity(self): return 1
+    def call(self, interpreter, args:List[object]):
+        return check_generator(args[0], "next").take()
+    def __str__(self): return "native function 'next'"
+
+class Done(LoxCallable):
+    def arity(self): return 1
+    def call(self, interpreter, args:List[object]):
+        return check_generator(args[0], "done").is_done()
+    def __str__(self): return "native function 'done'"
+
+'''
+Add the builtins to a global environment.
+'''
+def define_natives(environment):
+    environment.define('next', Next())
+    environment.define('done', Done())
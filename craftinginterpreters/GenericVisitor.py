@@ -52,6 +52,8 @@ class GenericVisitor(ExprVisitor,StmtVisitor):
         pass
     def visitVariable(self, client:Expr.Variable)->object:
         pass
+    def visitMemo(self, client:Expr.Memo)->object:
+        pass
     '''
     Statement visitors.
     '''
@@ -75,3 +77,7 @@ class GenericVisitor(ExprVisitor,StmtVisitor):
         pass
     def visitWhile(self, client:Stmt.While):
         pass
+    def visitMemoize(self, client:Stmt.Memoize):
+        pass
+    def visitYield(self, client:Stmt.Yield):
+        pass
@@ -0,0 +1,138 @@
+'''
+
+# HeapImage: save the state of an Interpreter after a prelude, and restore it
+
+Not in the book. Our jobs all begin by running the same big prelude of
+utility classes and functions, and running it means scanning, parsing,
+resolving and executing all of it before the job's own first statement.
+What the prelude leaves behind is simply the contents of the global
+Environment: LoxFunctions with their closures, LoxClasses with their
+method tables, LoxInstances and whatever they point to. So
+
+    plox --save-image prelude.img prelude.lox
+
+runs the prelude and then writes that state to an image file, and
+
+    plox --image prelude.img job.lox
+
+loads the image into a new Interpreter before running the job, in place
+of running the prelude again. Loading is a single unpickling, much faster
+than executing the prelude.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## What is saved
+
+Two things: the Interpreter's globals Environment, and its locals map of
+resolver depths. The locals are needed because every LoxFunction holds the
+Stmt.Function it was declared by, and when it is called, the interpreter
+looks up the depth of each variable reference in its body by the Expr
+object. So the Expr objects in the saved function bodies and the keys of
+the saved locals must be the same objects after loading, as they were
+before saving.
+
+That is why both go into one pickle. Within one dump, pickle writes each
+object once and thereafter refers back to it, so everything that was
+shared before saving is shared after loading: two closures that captured
+the same Environment still capture one Environment (and so still see each
+other's assignments), an instance stored in two places is still one
+instance, a method's declaration is still a key in locals. Cycles, like
+a function stored in the very environment it closes over, are fine too.
+
+The builtin clock() is saved by class name, Interpreter.builtinClock,
+and is a fresh instance after loading, which is all it needs to be.
+
+## Validity
+
+An image depends on the classes of the objects in it, so like the
+program cache (see ProgramCache.py), its header carries a fingerprint of
+the Python version and of the interpreter modules. An image made by a
+different plox is refused with a message to remake it, rather than loaded
+into objects whose classes have changed shape.
+
+Errors of any kind, reading or writing, are raised as HeapImage.ImageError
+with a message that plox reports.
+'''
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from ProgramCache import interpreter_fingerprint
+
+MAGIC = b'PLOXIMAGE\n'
+
+'''
+The modules whose classes appear in an image, or whose code makes them.
+'''
+IMAGE_MODULES = ('Token', 'TokenType', 'Scanner', 'Parser', 'Expr',
+                 'Stmt', 'Resolver', 'Interpreter', 'Optimizer',
+                 'Environment', 'LoxCallable', 'Tasks', 'Generators',
+                 'Parallel', 'HeapImage')
+
+def image_stamp()->bytes:
+    return hashlib.sha256(interpreter_fingerprint(IMAGE_MODULES)).hexdigest().encode()+b'\n'
+
+class HeapImage():
+    class ImageError(Exception):
+        pass
+
+    def __init__(self, path:str):
+        self.path = path
+
+    '''
+    Write the globals and locals of the interpreter to our path, replacing
+    any existing file only when the new one is complete.
+    '''
+    def save(self, interpreter):
+        state = (interpreter.globals, interpreter.locals)
+        try:
+            data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            raise HeapImage.ImageError("the state is too deeply nested to save")
+        except (pickle.PicklingError, TypeError, AttributeError) as E:
+            raise HeapImage.ImageError(f"the state cannot be saved: {E}")
+        folder = os.path.dirname(os.path.abspath(self.path))
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(image_stamp())
+                f.write(data)
+            umask = os.umask(0) # mkstemp makes the file private; an
+            os.umask(umask)     # image is meant to be shared, as usual
+            os.chmod(temp_path, 0o666 & ~umask)
+            os.replace(temp_path, self.path)
+            temp_path = None
+        except OSError as E:
+            raise HeapImage.ImageError(f"cannot write {self.path}: {E.strerror}")
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    '''
+    Load our image into a new interpreter, whose globals it replaces. Any
+    locals the interpreter already has are kept.
+    '''
+    def load(self, interpreter):
+        try:
+            with open(self.path, 'rb') as f:
+                if f.readline() != MAGIC:
+                    raise HeapImage.ImageError(f"{self.path} is not a plox image")
+                if f.readline() != image_stamp():
+                    raise HeapImage.ImageError(
+                        f"{self.path} was made by a different version of plox; remake it")
+                saved_globals, saved_locals = pickle.load(f)
+        except HeapImage.ImageError:
+            raise
+        except OSError as E:
+            raise HeapImage.ImageError(f"cannot read {self.path}: {E}")
+        except Exception as E: # truncated, or otherwise garbled
+            raise HeapImage.ImageError(f"{self.path} is damaged: {E}")
+        interpreter.globals = saved_globals
+        interpreter.environment = saved_globals
+        interpreter.locals.update(saved_locals)
@@ -10,6 +10,31 @@ objects. When interpreting an Expression, it "visits" the tree of Expr
 objects. As such it has methods that correspond to (eventually) all of the
 methods defined in the StmtVisitor and ExprVisitor classes.
 
+## Integers
+
+Not in the book. A Lox number is a float, and every operation on numbers
+used to convert both operands with float() before doing its work, even
+when, as with most loop counters and indices, they are whole numbers and
+always will be. With plox --int (see Scanner.number_lit) a whole number
+literal is a Python int instead, and arithmetic on two ints is done on
+ints, without the conversions. It must not be possible to tell: every
+result has to be exactly the float the same operation gives in the
+usual mode, so that print shows the same thing and == is the same:
+
+* An int result is exact; the float result is that, rounded to a float.
+  Those are the same while the magnitude is at most 2**53 (INT_LIMIT in
+  Scanner.py); past that the result is converted to float, rounded just
+  as float arithmetic would round it, and from then on it is a float.
+* Division gives a float, as Python's / does.
+* A float zero has a sign and an int zero doesn't: -0 and 0 * -1 are
+  -0.0, which prints as "-0". Those results are made the float -0.0.
+* Anything else with an int operand, a float with it for example, goes
+  the usual way, through float().
+
+Nothing here depends on the mode. An Interpreter handles ints whenever it
+meets them, which in the usual mode it only does when a native function
+written in Python returns one.
+
 This work is licensed under a
   Creative Commons Attribution-NonCommercial 4.0 International License
   see http://creativecommons.org/licenses/by-nc/4.0/
@@ -24,9 +49,17 @@ import Stmt
 from StmtVisitorClass import StmtVisitor
 from Token import Token
 from TokenType import *
-from Environment import Environment
-from LoxCallable import LoxCallable, LoxFunction, LoxClass, LoxInstance, ReturnUnwinder
-from typing import Callable, List, Mapping
+from Environment import Environment, Closure, Globals, UNDEFINED
+from LoxCallable import LoxCallable, LoxFunction, LoxClass, LoxInstance, ReturnUnwinder, NativeError
+import Tasks
+import Generators
+import Parallel
+from OutputSink import BufferedSink, format_value
+from Rope import Rope, concatenate
+from Scanner import INT_LIMIT
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, List, Mapping
 
 '''
 This global is the variable name string used by WHILE, BLOCK and BREAK to
@@ -35,6 +68,8 @@ implement break statements. See Chapter 9, challenge 1.
 
 CONTINUE = "¿seguir?" # out of band variable name
 
+NUMBER_TYPES = (int, float)
+
 class Interpreter(ExprVisitor,StmtVisitor):
 
     '''
@@ -51,6 +86,20 @@ class Interpreter(ExprVisitor,StmtVisitor):
         LESS:  lambda x,y: x < y,
         LESS_EQUAL: lambda x,y: x <= y
         }
+    '''
+    The same, for two ints (see "Integers" above), using int's own methods,
+    which unlike lambdas don't cost a Python call. Division isn't here:
+    it's done on floats.
+    '''
+    intdic = {
+        PLUS:  int.__add__,
+        MINUS: int.__sub__,
+        STAR:  int.__mul__,
+        GREATER: int.__gt__,
+        GREATER_EQUAL: int.__ge__,
+        LESS:  int.__lt__,
+        LESS_EQUAL: int.__le__
+        }
 
     '''
     Define our own error exception class which contains a token from which
@@ -78,9 +127,15 @@ class Interpreter(ExprVisitor,StmtVisitor):
     by calling directly to an error display function in the Lox main class.
     That isn't convenient (or even possible) in Python module structure, so
     again, I'm having an error handler passed in to __init__.
+
+    The output of print statements goes to the output sink, by default a
+    BufferedSink on stdout. See OutputSink.py.
     '''
-    def __init__(self, error_report:Callable[[int,str],None]):
+    def __init__(self, error_report:Callable[[int,str],None],
+                 locals_map:Mapping[Expr.Expr,int]=None,
+                 output:object=None):
         self.error_report = error_report
+        self.output = BufferedSink() if output is None else output
         '''
         Create the global environment for this run. Personally I don't like
         calling it "environment". It's wordy and repetitive and also
@@ -95,9 +150,12 @@ class Interpreter(ExprVisitor,StmtVisitor):
         Create the globals environment and initialize it with an instance of
         the clock function.
         '''
-        self.globals = Environment() # Environment
+        self.globals = Globals() # see "Global cells" in Environment.py
         self.globals.define(CONTINUE,True) # initialize magic loop variable
         self.globals.define('clock',Interpreter.builtinClock())
+        Tasks.define_natives(self.globals) # spawn, channel etc, see Tasks.py
+        Generators.define_natives(self.globals) # next and done
+        Parallel.define_natives(self.globals) # parallelMap
         self.environment = self.globals # initialize nested environments
         '''
         Define the "locals" as a dict. This is initialized by the Resolver so
@@ -111,8 +169,26 @@ class Interpreter(ExprVisitor,StmtVisitor):
         Thus there is no fear of name-collisions in the mapping; and each
         reference is related to its access-depth at the syntactic point it
         was found.
+
+        The Resolver also puts in each function declaration, a Stmt.Function,
+        that has free variables, with their names and depths; see
+        closure_of() below. And each Stmt.Block that declares nothing, with
+        0, see visitBlock().
+
+        A caller can supply its own mapping for the locals; the interactive
+        session passes a WeakKeyDictionary, see ReplSession.py.
         '''
-        self.locals = dict() # Mapping[Expr,int]
+        self.locals = dict() if locals_map is None else locals_map # Mapping[Expr,int]
+        '''
+        Saved values of Expr.Memo nodes, keyed by the memo key. See
+        Optimizer.py, and visitMemo and visitMemoize below.
+        '''
+        self.memos = dict() # Mapping[Expr,object]
+        '''
+        The Scheduler of tasks started with spawn(), made when first needed.
+        See Tasks.py.
+        '''
+        self.scheduler = None
 
     '''
     Entry point called from the Resolver to store an item in the locals.
@@ -125,14 +201,26 @@ class Interpreter(ExprVisitor,StmtVisitor):
     list of Stmt objects as produced by Parser.parse.
 
     It returns nothing; the value of a Lox program is all in its
-    side-effects, i.e. printed or file output.
+    side-effects, i.e. printed or file output. Whatever happens, flush
+    the output before returning.
     '''
     def interpret(self, program:List[Stmt.Stmt]):
         try:
             for a_statement in program:
                 self.execute(a_statement)
+            if self.scheduler is not None: # let spawned tasks finish
+                self.scheduler.finish()
         except Interpreter.EvaluationError as EVE:
-            self.error_report(EVE.token, EVE.message)
+            self.report(EVE.token, EVE.message)
+        finally:
+            self.output.flush()
+
+    '''
+    Report a runtime error, after the output printed before it.
+    '''
+    def report(self, a_token:Token, message:str):
+        self.output.flush()
+        self.error_report(a_token, message)
 
     '''
     Optional entry point for Challenge 8#1, permit "desk calculator mode".
@@ -144,7 +232,9 @@ class Interpreter(ExprVisitor,StmtVisitor):
             value = self.evaluate(program[0].expression)
             return value
         except Interpreter.EvaluationError as EVE:
-            self.error_report(EVE.token, EVE.message)
+            self.report(EVE.token, EVE.message)
+        finally:
+            self.output.flush()
 
     '''
     Utility functions
@@ -196,13 +286,11 @@ class Interpreter(ExprVisitor,StmtVisitor):
 
     '''
     S2. Execute a print statement
-    Note the gimmick of dropping ".0" at the end of integral numbers.
+    Note the gimmick of dropping ".0" at the end of integral numbers, now
+    done by format_value, see OutputSink.py.
     '''
     def visitPrint(self, client:Stmt.Print):
-        value = self.evaluate(client.expression)
-        str_value = str(value)
-        if str_value.endswith('.0') : str_value = str_value[0:-2]
-        print(str_value)
+        self.output.write_line(format_value(self.evaluate(client.expression)))
     '''
     S3. Var statement.
     '''
@@ -223,6 +311,14 @@ class Interpreter(ExprVisitor,StmtVisitor):
         superclass = None
         if client.superclass: # is given
             superclass = self.evaluate(client.superclass)
+        self.define_class(client, superclass)
+    '''
+    The rest of visitClass, once any superclass expression has been
+    evaluated, split out so the async interpreter can share it (see
+    AsyncInterpreter.py).
+    '''
+    def define_class(self, client:Stmt.Class, superclass:object):
+        if client.superclass: # is given
             if not isinstance(superclass, LoxClass):
                 raise Interpreter.EvaluationError(
                     client.superclass.name,
@@ -234,24 +330,39 @@ class Interpreter(ExprVisitor,StmtVisitor):
             self.environment.define("super", superclass) # push a super context
         meth_dict = dict()
         for method in client.methods:
-            meth_fun = LoxFunction(method,self.environment,
+            meth_fun = LoxFunction(method,self.closure_of(method),
                                    method.name.lexeme == LoxClass.Init)
             meth_dict[method.name.lexeme]=meth_fun
         klass = LoxClass(name_str,meth_dict,superclass)
         if client.superclass : # was given,
+            if self.environment.upvalues : # methods using super captured it,
+                self.environment.close() # and it can't change, so let go now
             self.environment = self.environment.enclosing # pop the super context
         self.environment.assign(name_str,klass)
 
     '''
     SF. Function statement. To "execute" a function declaration is to create
-    a LoxCallable and bind its name it in the current environment. A
-    reference to the current environment is also stored in the callable as
-    its "closure".
+    a LoxCallable and bind its name it in the current environment. Its
+    "closure" is stored in the callable with it.
     '''
     def visitFunction(self, client:Stmt.Function):
-        callable = LoxFunction(client, self.environment)
+        callable = LoxFunction(client, self.closure_of(client))
         self.environment.define(client.name.lexeme, callable)
     '''
+    The closure of a function being declared here: a Closure holding an
+    Upvalue for each of the free variables the Resolver found for it, or
+    if none, the globals. See "Flat closures" in Environment.py.
+    '''
+    def closure_of(self, declaration:Stmt.Function)->Environment:
+        free = self.locals.get(declaration)
+        if free is None:
+            return self.globals
+        environment = self.environment
+        closure = Closure(self.globals)
+        for (name, depth) in free:
+            closure.define(name, environment.ancestor(depth).capture(name))
+        return closure
+    '''
     Sr. Execute a return statement. Get the value of its return expression
         if it has one. Then raise the exception.
     '''
@@ -261,6 +372,14 @@ class Interpreter(ExprVisitor,StmtVisitor):
             return_value = self.evaluate(client.value)
         raise ReturnUnwinder(return_value)
     '''
+    Sy. A yield statement. The body of a generator never runs here, but on
+        an AsyncInterpreter, which awaits at a yield (see Generators.py);
+        and the Resolver and Parser allow yield nowhere else.
+    '''
+    def visitYield(self, client:Stmt.Yield):
+        raise Interpreter.EvaluationError(client.keyword,
+                            "Yield outside of a generator.")
+    '''
     Sq. Execute a while statement. Set the CONTINUE flag True on entry.
         Stop executing if it becomes False (because a BREAK was executed).
         Force it to True before exit, so a BREAK in this loop won't break
@@ -294,8 +413,14 @@ class Interpreter(ExprVisitor,StmtVisitor):
     break could be nested, for example { if (p) { if (q) { break } } }. A
     break executed at any level within the block should cause the block to
     exit. For this we use the CONTINUE flag set by the break statement.
+
+    A block the Resolver found declares nothing, it gave us with depth 0:
+    its scope is the one it is in. See execute_flat().
     '''
     def visitBlock(self, client:Stmt.Block):
+        if client in self.locals:
+            self.execute_flat( client.statements )
+            return
         context = Environment(self.environment)
         self.execute_block( client.statements, context )
 
@@ -315,6 +440,44 @@ class Interpreter(ExprVisitor,StmtVisitor):
                     break # oops, that was a BREAK, exit
         finally:
             self.environment = save_context
+            if context.upvalues : # closures captured some of its variables
+                context.close()
+    '''
+    Execute the statements of a block that declares nothing, in the
+    current environment, which saves making one, and a level for every
+    lookup inside to walk past. A break (or a while) in the block sets
+    CONTINUE in the current environment, where in a scope of its own it
+    would have been set in that, and gone with it; so put it back as it
+    was afterward, and the block stops, and what runs after it carries
+    on, as they did.
+    '''
+    def execute_flat(self, stmts:List[Stmt.Stmt]):
+        environment = self.environment
+        saved = dict.get(environment, CONTINUE) # None: not set here
+        try:
+            for statement in stmts:
+                self.execute(statement)
+                if not environment.fetch(CONTINUE):
+                    break
+        finally:
+            if dict.get(environment, CONTINUE) is not saved:
+                if saved is None:
+                    dict.__delitem__(environment, CONTINUE)
+                else:
+                    dict.__setitem__(environment, CONTINUE, saved)
+    '''
+    Sm. Memoize statement, placed by the Optimizer around a loop or a
+        statement that contains Expr.Memo nodes. Execute the statement it
+        wraps, then forget the values saved by its Memos, so that the
+        next execution computes them afresh. The try/finally makes sure
+        of that even when the statement ends with a return or an error.
+    '''
+    def visitMemoize(self, client:Stmt.Memoize):
+        try:
+            self.execute(client.body)
+        finally:
+            for key in client.memos:
+                self.memos.pop(key, None)
     '''
     S5. If statement.
     '''
@@ -359,11 +522,24 @@ class Interpreter(ExprVisitor,StmtVisitor):
     def visitGrouping(self, client:Expr.Grouping)->object:
         return self.evaluate(client.expression)
     '''
+    Em. Evaluate a Memo. The first time, evaluate the expression it wraps,
+        right here, and save the value under its key. After that, until the
+        owning Memoize statement finishes, just return the saved value.
+    '''
+    def visitMemo(self, client:Expr.Memo)->object:
+        memos = self.memos
+        if client.key in memos:
+            return memos[client.key]
+        value = self.evaluate(client.expression)
+        memos[client.key] = value
+        return value
+    '''
     E3. Evaluate a variable reference.
 
         First, get its depth from the locals map. If that returns None, the
-        reference is not to a local; ergo it is a global, so try to fetch it.
-        That might result in a name error, which we trap and convert into an
+        reference is not to a local; ergo it is a global, whose value is in
+        the Cell the reference is bound to (see "Global cells" in
+        Environment.py). If the global is not defined (yet), that is an
         EvaluationError.
 
         When it is a local being referenced, use the environment getAt()
@@ -380,13 +556,14 @@ class Interpreter(ExprVisitor,StmtVisitor):
 
     def lookUpVariable(self,name:Token, client):
         depth = self.locals.get(client)
-        if depth is None:
-            try:
-                return self.globals.get(name.lexeme)
-            except NameError as NE:
-                # the value in BaseException.args is a tuple, (namestring,None)
-                # for the message, extract the string alone.
-                raise Interpreter.EvaluationError(client.name,f"Undefined name {NE.args[0]}")
+        if depth is None: # a global, see "Global cells" in Environment.py
+            cell = self.globals.sites.get(client)
+            if cell is None: # the first time this reference runs
+                cell = self.globals.bind(client, name.lexeme)
+            value = cell.value
+            if value is UNDEFINED:
+                raise Interpreter.EvaluationError(name,f"Undefined name {name.lexeme}")
+            return value
         # it is local, can't be undefined, so fetch it at its proper depth.
         return self.environment.getAt(depth, name.lexeme)
 
@@ -397,19 +574,26 @@ class Interpreter(ExprVisitor,StmtVisitor):
         value = self.evaluate(client.value)
         depth = self.locals.get(client)
         if depth is None:
-            try:
-                self.globals.assign(client.name.lexeme,value)
-                return value
-            except NameError as NE:
-                raise Interpreter.EvaluationError(client.name,f"Undefined name {NE.args[0]}")
+            self.assign_global(client, value)
+            return value
         # it is known as a local, so assignment should work.
         return self.environment.assignAt(depth,client.name.lexeme,value)
+
+    def assign_global(self, client:Expr.Assign, value:object):
+        cell = self.globals.sites.get(client)
+        if cell is None:
+            cell = self.globals.bind(client, client.name.lexeme)
+        if cell.value is UNDEFINED:
+            raise Interpreter.EvaluationError(client.name,f"Undefined name {client.name.lexeme}")
+        self.globals[client.name.lexeme] = value # which sets the cell too
     '''
     E5. Evaluate a Unary expression, -x or !x.
     '''
     def visitUnary(self, client:Expr.Unary)->object:
         rhs = self.evaluate(client.right)
         if client.operator.type == MINUS:
+            if rhs.__class__ is int: # see "Integers" above
+                return -rhs if rhs else -0.0
             try:
                 return -float(rhs)
             except ValueError: # rhs is not a number
@@ -428,20 +612,47 @@ class Interpreter(ExprVisitor,StmtVisitor):
         "hello"(mom). We have to do that here.
         '''
         callee = self.evaluate(client.callee)
+        '''
+        A function that is not a generator, or a class, given the number of
+        arguments it takes, goes by the lean call protocol (see LoxCallable.py):
+        up to three argument values are passed straight to call0..call3, and
+        more are evaluated straight into the function's new Environment.
+        '''
+        arguments = client.arguments
+        count = len(arguments)
+        kind = callee.__class__
+        if ((kind is LoxFunction and not callee.declaration.generator)
+                or kind is LoxClass) and callee.n_params == count:
+            evaluate = self.evaluate
+            if count == 0:
+                return callee.call0(self)
+            if count == 1:
+                return callee.call1(self, evaluate(arguments[0]))
+            if count == 2:
+                return callee.call2(self, evaluate(arguments[0]), evaluate(arguments[1]))
+            if count == 3:
+                return callee.call3(self, evaluate(arguments[0]), evaluate(arguments[1]),
+                                    evaluate(arguments[2]))
+            if kind is LoxFunction:
+                environment = callee.frame()
+                for (param, argument) in zip(callee.declaration.params, arguments):
+                    environment[param.lexeme] = evaluate(argument)
+                return callee.run(self, environment)
         if not isinstance(callee, LoxCallable) :
             raise Interpreter.EvaluationError(client.paren,
                             "Only functions and classes can be called.")
         ''' Evaluate the argument expressions left to right and save them '''
-        params = []
-        for argument in client.arguments:
-            params.append( self.evaluate(argument) )
+        params = [self.evaluate(argument) for argument in arguments]
         '''
         Check that there is an equal number of args and params.
         '''
         if callee.arity() != len(params):
             raise Interpreter.EvaluationError(client.paren,
                     f"Expected {callee.arity()} arguments but got {len(params)}." )
-        return callee.call(self,params)
+        try:
+            return callee.call(self,params)
+        except NativeError as NE:
+            raise Interpreter.EvaluationError(client.paren, str(NE))
     '''
     Eg1. Evaluate a property reference, <something>.identifier.
         The <something> had better evaluate to a LoxInstance.
@@ -455,7 +666,9 @@ class Interpreter(ExprVisitor,StmtVisitor):
         exception if necessary.
     '''
     def visitGet(self, client:Expr.Get)->object:
-        source = self.evaluate(client.object)
+        return self.get_property(client, self.evaluate(client.object))
+
+    def get_property(self, client:Expr.Get, source:object)->object:
         if isinstance(source,LoxInstance):
             name_found = True
             value = None # keep lint happy
@@ -525,9 +738,24 @@ class Interpreter(ExprVisitor,StmtVisitor):
 
     '''
     def visitBinary(self, client:Expr.Binary)->object:
-        lhs = self.evaluate(client.left)
-        rhs = self.evaluate(client.right)
+        return self.binary_value(client, self.evaluate(client.left),
+                                 self.evaluate(client.right))
+    '''
+    The operation itself, given the values of the operands. Separate so that
+    the async interpreter can share it.
+    '''
+    def binary_value(self, client:Expr.Binary, lhs:object, rhs:object)->object:
         op = client.operator.type # factor out a few calls
+        if lhs.__class__ is int and rhs.__class__ is int: # see "Integers" above
+            int_op = Interpreter.intdic.get(op)
+            if int_op is not None:
+                result = int_op(lhs, rhs)
+                if result.__class__ is int: # not a comparison
+                    if not -INT_LIMIT <= result <= INT_LIMIT:
+                        return float(result)
+                    if result == 0 and op == STAR and (lhs < 0 or rhs < 0):
+                        return -0.0
+                return result
         '''
         Handle equality comparisons first. Rules of equality are defined in
         isEqual().
@@ -548,11 +776,14 @@ class Interpreter(ExprVisitor,StmtVisitor):
         find you being "inconsistent". Generally I don't think it is a good
         idea, in a language described as "simple", to get into the game of
         coercing types at all.
+
+        A string here may be a str or a Rope, see Rope.py.
         '''
         if op == PLUS:
-            if isinstance(lhs,str) and isinstance(rhs,str):
-                return lhs+rhs
-            if type(lhs) != type(rhs) :
+            if isinstance(lhs,(str,Rope)) and isinstance(rhs,(str,Rope)):
+                return concatenate(lhs, rhs)
+            if type(lhs) != type(rhs) and not (lhs.__class__ in NUMBER_TYPES
+                                               and rhs.__class__ in NUMBER_TYPES):
                 raise Interpreter.EvaluationError(client.operator,'Both operands must have the same type')
             # at this point we know both PLUS operands are numbers. Fall through.
         '''
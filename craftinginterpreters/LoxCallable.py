@@ -20,10 +20,30 @@ Specifically this module declares,
 * ReturnUnwinder, an Exception raised by the Interpreter executing a RETURN,
   and caught in LoxFunction.call.
 
+* NativeFunction, a LoxCallable that wraps a Python function, for builtins
+  supplied by a host program (or by plox itself).
+
+* NativeError, an Exception a native function raises to report a Lox
+  runtime error, which the Interpreter reports at the call.
+
 This work is licensed under a
   Creative Commons Attribution-NonCommercial 4.0 International License
   see http://creativecommons.org/licenses/by-nc/4.0/
 
+## The lean call protocol
+
+Not in the book. Calling is the commonest thing a Lox program does, so a
+LoxFunction and a LoxClass can be called more cheaply than through arity()
+and call(). Each knows its arity as the attribute n_params, worked out
+when it is made (a LoxClass finds its initializer once, then, rather than
+twice a call). And each has call0() to call3(), which take the argument
+values as Python arguments rather than in a list, and put them straight
+into the new Environment by name, with no zip() or define(). Interpreter.
+visitCall uses those for calls of up to three arguments, and for more,
+evaluates the arguments directly into an Environment from frame(), which
+run() then runs the body in. A generator function is only ever called by
+call(), which makes the generator.
+
 Note: the call() method references an Interpreter; however this class has to
 be imported by Interpreter.py. To import Interpreter here would create a
 circular import that Python will not allow. For that reason we do not
@@ -37,7 +57,10 @@ from __future__ import annotations # allow forward-reference to classes in class
 import Stmt
 from Token import Token
 from Environment import Environment
-from typing import List, Mapping
+from Rope import plain
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List, Mapping
 
 '''
 Define our RETURN exception for quick unwinding from a return statement.
@@ -55,6 +78,20 @@ class LoxCallable():
         raise NotImplementedError()
     def call(self, interpreter, params:List[object] ):
         raise NotImplementedError()
+    '''
+    A callable with is_async True also has a coroutine method call_async,
+    with the same arguments, which the async interpreter awaits in place
+    of call(); see AsyncInterpreter.py.
+    '''
+    is_async = False
+
+'''
+Raised by a native function (or anything it calls) with a message, to
+report a Lox runtime error. The Interpreter catches it at the call and
+reports it like any other error at that point in the program.
+'''
+class NativeError(Exception):
+    pass
 
 '''
 Define the properties of a callable function. At runtime, when a FUN
@@ -69,12 +106,20 @@ class LoxFunction(LoxCallable):
         self.declaration = declaration
         self.closure = closure
         self.isInitializer = isInitializer # True when this is class init()
+        self.n_params = len(declaration.params)
 
     def arity(self):
-        return len(self.declaration.params)
+        return self.n_params
 
     def call(self, interpreter, args:List[object] ):
         '''
+        Calling a generator function doesn't run its body, but makes an
+        object that runs it a piece at a time. See Generators.py.
+        '''
+        if self.declaration.generator :
+            from Generators import LoxGenerator # not at top: it imports us
+            return LoxGenerator(self, interpreter, args)
+        '''
         Create a fresh local symbol table for this call, with a parent of the
         "closure" environment that was frozen-in when the function was
         declared.
@@ -100,13 +145,46 @@ class LoxFunction(LoxCallable):
              Initializer     "this"         "this"
              normal method    None           expr
         '''
+        return self.run(interpreter, environment)
+
+    def run(self, interpreter, environment:Environment)->object:
         try:
             interpreter.execute_block(self.declaration.body, environment)
-            return_value = self.closure.fetch("this") if self.isInitializer else None
+            return_value = None
         except ReturnUnwinder as RW:
-            return_value = self.closure.fetch("this") if self.isInitializer else RW.return_value
+            return_value = RW.return_value
+        if self.isInitializer :
+            return self.closure.fetch("this")
         return return_value
     '''
+    The lean call protocol, see above: never for a generator function.
+    '''
+    def frame(self)->Environment:
+        return Environment(self.closure)
+
+    def call0(self, interpreter)->object:
+        return self.run(interpreter, Environment(self.closure))
+
+    def call1(self, interpreter, a:object)->object:
+        environment = Environment(self.closure)
+        environment[self.declaration.params[0].lexeme] = a
+        return self.run(interpreter, environment)
+
+    def call2(self, interpreter, a:object, b:object)->object:
+        environment = Environment(self.closure)
+        params = self.declaration.params
+        environment[params[0].lexeme] = a
+        environment[params[1].lexeme] = b
+        return self.run(interpreter, environment)
+
+    def call3(self, interpreter, a:object, b:object, c:object)->object:
+        environment = Environment(self.closure)
+        params = self.declaration.params
+        environment[params[0].lexeme] = a
+        environment[params[1].lexeme] = b
+        environment[params[2].lexeme] = c
+        return self.run(interpreter, environment)
+    '''
     Create a customized version of this very function but bound to
     a particular instance of a class. To bind is simply to invoke but
     with the name "this" predefined as the object instance.
@@ -162,6 +240,15 @@ class LoxClass(LoxCallable):
         self.name = name
         self.super_class = super_class
         self.methods = methods
+        self.find_initializer()
+    '''
+    Find the initializer, and so the arity, once and for all: a class's
+    methods don't change once it is made. (Parallel.py fills in the copy
+    of a class after making it, and calls this again.)
+    '''
+    def find_initializer(self):
+        self.initializer = self.findMethod(LoxClass.Init)
+        self.n_params = 0 if self.initializer is None else self.initializer.n_params
     '''
     Implement display string: in the book he simply returns the name
     alone, but I am going to emulate python a little bit.
@@ -189,17 +276,14 @@ class LoxClass(LoxCallable):
     has been defined, return its arity, otherwise return 0.
     '''
     def arity(self):
-        initializer = self.findMethod(LoxClass.Init)
-        if initializer : # exists, even
-            return initializer.arity() # return its needs
-        return 0 # else we take no args, thanks
+        return self.n_params
     '''
     To "call" a Class is to create a new LoxInstance object, then
     invoke the initializer with that object as its "this" arg.
     '''
     def call(self, interpreter, params:List[object] )->LoxInstance:
         instance = LoxInstance(self)
-        initializer = self.findMethod(LoxClass.Init)
+        initializer = self.initializer
         if initializer : # has been declared,
             '''
             create version of the initializer bound to the new
@@ -207,6 +291,30 @@ class LoxClass(LoxCallable):
             '''
             initializer.bind(instance).call(interpreter,params)
         return instance
+    '''
+    The lean call protocol, see above. With an argument, there is an
+    initializer, or the arity would be 0.
+    '''
+    def call0(self, interpreter)->LoxInstance:
+        instance = LoxInstance(self)
+        if self.initializer is not None:
+            self.initializer.bind(instance).call0(interpreter)
+        return instance
+
+    def call1(self, interpreter, a:object)->LoxInstance:
+        instance = LoxInstance(self)
+        self.initializer.bind(instance).call1(interpreter, a)
+        return instance
+
+    def call2(self, interpreter, a:object, b:object)->LoxInstance:
+        instance = LoxInstance(self)
+        self.initializer.bind(instance).call2(interpreter, a, b)
+        return instance
+
+    def call3(self, interpreter, a:object, b:object, c:object)->LoxInstance:
+        instance = LoxInstance(self)
+        self.initializer.bind(instance).call3(interpreter, a, b, c)
+        return instance
 '''
 Define the contents of a class instance. It knows its class (see above) and
 it holds a dict of its data attributes aka "fields". The fields of a class
@@ -246,3 +354,32 @@ class LoxInstance():
     '''
     def __str__(self):
         return f"{self.klass.name} instance."
+
+'''
+A builtin function implemented in Python. The function is called with the
+Lox argument values (a string always as a str, never a Rope, see Rope.py)
+and its return value is the value of the call. If
+is_async, the function is a coroutine function, which only the async
+interpreter can await (see AsyncInterpreter.py); the ordinary Interpreter
+can't call it.
+'''
+class NativeFunction(LoxCallable):
+    def __init__(self, name:str, n_params:int, function, is_async:bool=False):
+        self.name = name
+        self.n_params = n_params
+        self.function = function
+        self.is_async = is_async
+
+    def arity(self):
+        return self.n_params
+
+    def call(self, interpreter, args:List[object] ):
+        if self.is_async :
+            raise NativeError(f"native function '{self.name}' needs the async interpreter")
+        return self.function(*map(plain, args))
+
+    async def call_async(self, interpreter, args:List[object] ):
+        return await self.function(*map(plain, args))
+
+    def __str__(self)->str:
+        return f"native function '{self.name}'"
@@ -0,0 +1,248 @@
+'''
+
+# LoxProgram: compile Lox once, run it many times, from Python
+
+Not in the book. plox.run_lox is made for the command line: it scans,
+parses and resolves its source every time it is called, prints errors on
+stderr, and signals them by setting the module-global HAD_ERROR, which
+makes it useless to a program that wants to run the same Lox code over
+and over, maybe on several threads at once. This module is the API for
+such a program:
+
+    import LoxProgram
+    program = LoxProgram.compile(source)      # once
+    ...
+    results = program.run({'amount':12.5})   # as often as you like
+
+compile() raises LoxProgram.CompileError if the source has any errors,
+with all of them in its errors attribute as LoxError objects (line,
+where, message), rather than printing them. run() raises
+LoxProgram.ExecutionError, carrying one LoxError, for an error at run
+time. Neither touches plox.HAD_ERROR.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## Running
+
+Each run() gets a new Interpreter, with a new global environment holding
+the clock() builtin and the names and values of the globals argument.
+Python values are used as Lox values directly: str, bool and None are
+the Lox string, boolean and nil, and a Python int is converted to float,
+since that is what Lox numbers are (unless the program was compiled with
+int_numbers=True, the same as plox --int, see "Integers" in
+Interpreter.py, when an int small enough to be exact is kept). When the program finishes, run()
+returns a dict of the Lox globals as they were then; that's how a script
+gives back its results. (A string in it is always a str, though inside
+Lox it may have been a Rope; see Rope.py.) A program that is a single
+expression statement, like "amount * 1.2;", can be run with evaluate(),
+which returns its value.
+
+What the program prints goes to stdout, unless run() is given an output
+sink (see OutputSink.py). To have the printed lines as data:
+
+    sink = OutputSink.MemorySink()
+    program.run({'amount':12.5}, output=sink)
+    sink.lines                                # ['15', ...]
+
+Making an Interpreter is cheap, just an Environment and a few attributes,
+so there is no pool of them; a fresh one each time is simplest and means
+no run can see anything left by another.
+
+## Sharing
+
+A LoxProgram is the program data: the list of statements and the
+Resolver's map of variable depths (a Resolver.Depths, made without any
+Interpreter). compile() makes both and nothing changes either afterward;
+executing never writes to a syntax tree node, nor to the depths. Every
+Interpreter made by run() is handed the same depths map (see the
+locals_map argument of Interpreter) rather than a copy.
+
+An Interpreter is the execution state, everything that running the
+program changes: the globals, the current environment, the values of the
+Optimizer's Memo nodes, the task scheduler. Each run gets its own, and
+so one LoxProgram can be run by any number of threads at once, each
+thread with its own Interpreter. run_all() does just that, running the
+program once per input on a pool of threads:
+
+    results = program.run_all([{'amount':a} for a in amounts], threads=8)
+
+How much that gains depends on the Python. On the usual build, with its
+global interpreter lock, only one thread executes Python at a time, so
+threads help only a program that waits on something (an async native, a
+host callback that does I/O). On a free-threaded build (3.13t and later)
+the threads really run at once, one per core. benchmarks/threads.py
+measures the throughput at a range of thread counts.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+
+from Scanner import Scanner, INT_LIMIT
+from Parser import Parser
+import Stmt
+from Token import Token
+from TokenType import EOF
+from Interpreter import Interpreter, CONTINUE
+from Resolver import Resolver, Depths
+from Optimizer import Optimizer
+from LoxCallable import LoxCallable, LoxFunction, LoxClass
+from Rope import plain
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Mapping
+
+'''
+One error, found by the Scanner, Parser or Resolver or while executing.
+str() gives the same form of message plox prints.
+'''
+class LoxError():
+    def __init__(self, line:int, where:str, message:str):
+        self.line = line
+        self.where = where
+        self.message = message
+
+    def __str__(self)->str:
+        return f"Error in line {self.line} {self.where}: {self.message}"
+
+    def __repr__(self)->str:
+        return f"LoxError({self.line!r}, {self.where!r}, {self.message!r})"
+
+    '''
+    Make one from the arguments of the two error reporting functions,
+    see plox.lex_error and plox.parse_error.
+    '''
+    @staticmethod
+    def from_line(line:int, message:str, where:int=None)->LoxError:
+        return LoxError(line, f"chr {where}" if (where is not None) else "", message)
+
+    @staticmethod
+    def from_token(a_token:Token, message:str)->LoxError:
+        return LoxError(a_token.line,
+                        "at " + (a_token.lexeme if (a_token.type != EOF) else "end"),
+                        message)
+
+class LoxProgram():
+    class CompileError(Exception):
+        def __init__(self, errors:List[LoxError]):
+            super().__init__('\n'.join(str(error) for error in errors))
+            self.errors = errors
+
+    class ExecutionError(Exception):
+        def __init__(self, error:LoxError):
+            super().__init__(str(error))
+            self.error = error
+
+    '''
+    Made only by compile(), below.
+    '''
+    def __init__(self, statements:List[Stmt.Stmt], depths:Mapping,
+                 int_numbers:bool=False):
+        self.statements = statements
+        self.depths = depths
+        self.int_numbers = int_numbers
+
+    def is_expression(self)->bool:
+        return 1 == len(self.statements) and isinstance(self.statements[0], Stmt.Expression)
+
+    '''
+    Make an Interpreter for one run, its globals loaded from the argument,
+    printing to the given output sink, or stdout.
+    '''
+    def new_interpreter(self, globals_in:Mapping[str,object],
+                        interpreter_class:type=Interpreter,
+                        output:object=None)->Interpreter:
+        interpreter = interpreter_class(self.raise_error, locals_map=self.depths,
+                                        output=output)
+        if globals_in :
+            for (name, value) in globals_in.items():
+                if isinstance(value, int) and not isinstance(value, bool) \
+                   and not (self.int_numbers and -INT_LIMIT <= value <= INT_LIMIT):
+                    value = float(value)
+                interpreter.globals.define(name, value)
+        return interpreter
+
+    '''
+    The Interpreter reports an error by calling its error_report with a
+    token and message, after it has caught the error. Turn that back into
+    an exception, for run() to let go through to its caller.
+    '''
+    @staticmethod
+    def raise_error(a_token:Token, message:str):
+        raise LoxProgram.ExecutionError(LoxError.from_token(a_token, message))
+
+    '''
+    Execute the program, and return its globals at the end as a dict.
+    Native functions and the internal flag used by break aren't included.
+    '''
+    def run(self, globals_in:Mapping[str,object]=None,
+            output:object=None)->Dict[str,object]:
+        interpreter = self.new_interpreter(globals_in, output=output)
+        interpreter.interpret(self.statements)
+        return self.results(interpreter)
+
+    '''
+    The same, as a coroutine for asyncio, running the program on an
+    AsyncInterpreter (see AsyncInterpreter.py) so that it gives way to
+    other tasks as it goes. A global can be a NativeFunction with
+    is_async=True, which the script can call to await a coroutine.
+    '''
+    async def run_async(self, globals_in:Mapping[str,object]=None,
+                        output:object=None)->Dict[str,object]:
+        from AsyncInterpreter import AsyncInterpreter
+        interpreter = self.new_interpreter(globals_in, AsyncInterpreter, output)
+        await interpreter.interpret(self.statements)
+        return self.results(interpreter)
+
+    '''
+    Run the program once for each of the inputs, a globals mapping as for
+    run(), on a pool of threads, and return the list of their results in
+    the same order. The first ExecutionError, in input order, is raised
+    once all the runs are over. threads=None lets concurrent.futures
+    choose the number of threads.
+    '''
+    def run_all(self, inputs:Iterable[Mapping[str,object]],
+                threads:int=None)->List[Dict[str,object]]:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [pool.submit(self.run, globals_in) for globals_in in inputs]
+        return [future.result() for future in futures]
+
+    def results(self, interpreter:Interpreter)->Dict[str,object]:
+        return {name:plain(value) for (name, value) in interpreter.globals.items()
+                if name != CONTINUE and not (isinstance(value, LoxCallable)
+                    and not isinstance(value, (LoxFunction, LoxClass)))}
+
+    '''
+    Return the value of a program that is a single expression.
+    '''
+    def evaluate(self, globals_in:Mapping[str,object]=None)->object:
+        if not self.is_expression():
+            raise TypeError("evaluate() needs a program that is one expression")
+        interpreter = self.new_interpreter(globals_in)
+        return plain(interpreter.one_line_program(self.statements))
+
+'''
+Scan, parse, resolve and prepare the source, collecting errors as we go.
+As in plox, each stage runs only if the ones before it found no error.
+int_numbers is plox --int.
+'''
+def compile(source:str, int_numbers:bool=False)->LoxProgram:
+    errors = list()
+    def report_line(line:int, message:str, where:int=None):
+        errors.append(LoxError.from_line(line, message, where))
+    def report_token(a_token:Token, message:str):
+        errors.append(LoxError.from_token(a_token, message))
+
+    tokens = Scanner(source, report_line, int_numbers).scanTokens()
+    if not errors :
+        statements = Parser(tokens, report_token).parse()
+    if not errors :
+        depths = Depths()
+        Resolver(depths, report_token).resolve(statements)
+    if errors :
+        raise LoxProgram.CompileError(errors)
+    program = LoxProgram(statements, depths, int_numbers)
+    if not program.is_expression():
+        program.statements = Optimizer().optimize(statements)
+    return program
@@ -0,0 +1,277 @@
+'''
+
+# MemoryProfile: which lines of a Lox program make its runtime objects
+
+Not in the book. When a Lox program takes too much memory, Python's own
+tools will say which lines of the interpreter made the objects, which is
+no help: every Environment is made in the same few places. plox
+--mem-profile runs the program under a MemoryProfile, which puts each
+object down to the Lox source line, and the Lox function, being executed
+when it was made, and at the end prints, to stderr:
+
+* per kind of runtime object, how many were made, the most that were
+  alive at once, and how many are alive at the end. The kinds are
+  Environment (the scope of a block or a call), Closure (the variables a
+  function captured, see "Flat closures" in Environment.py), Globals
+  (the global scope, see "Global cells" there), LoxFunction
+  (a function, or a method bound to an instance, which is made on every
+  call of a method), LoxInstance, and the strings made by "+", Rope and
+  str (see Rope.py).
+* the allocation sites, line, function and kind, that made the most bytes.
+* the top retainers: the sites whose objects still alive at the end hold
+  the most bytes.
+
+## Sampling
+
+Counting the objects made and freed is cheap, so those counts are exact:
+while profiling, the __init__ of each kind (and concatenate(), for the
+strings) is wrapped to count the object it makes, and each kind is given
+a __del__ that counts it freed. A str can't be given a __del__, so how
+many of those are alive is not known, and not shown.
+
+Finding the Lox line is dearer: it means walking up the Python stack to
+the visit method of the node being executed. That is done for a sample
+of the objects, one in SAMPLE_RATE on average, at random intervals so
+that no loop can fall into step with them, and the objects and bytes of
+each site are estimated from the sample, each sampled object standing
+for SAMPLE_RATE of them; the report marks them with ~. A MemoryProfile
+with rate=1 samples every object, for exact numbers at a higher cost.
+The sampled objects are remembered by id() until their __del__ lets go
+of them, so those alive when the program ends can be found again, with
+gc, and weighed.
+
+Sizes are sys.getsizeof(), an object's own size, including its dict of
+variables or fields, or the body of a Rope (the pair of its pieces, or
+once joined its text), but not what they refer to. An object alive at
+the end retains its own size and that of the strings it holds directly,
+as the value of a variable or field.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import gc
+import random
+import sys
+from Token import Token
+import Expr
+import Stmt
+import Interpreter as interpreter_module # its global concatenate is wrapped
+from Environment import Environment
+from LoxCallable import LoxFunction, LoxInstance
+from Rope import Rope
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, TextIO, Tuple
+
+'''
+One object in this many, on average, has its allocation site found.
+'''
+SAMPLE_RATE = 64
+
+'''
+The kinds of object counted, in the order reported.
+'''
+KINDS = ('Environment', 'Closure', 'Globals', 'LoxFunction', 'LoxInstance', 'Rope', 'str')
+
+'''
+The code of LoxFunction.run, the frame of which, on the Python stack,
+marks the call of a Lox function, however it was called (see "The lean
+call protocol" in LoxCallable.py).
+'''
+CALL_CODE = LoxFunction.run.__code__
+
+'''
+The line of the first token in an Expr or Stmt, or None if it has none
+(a literal, say).
+'''
+def line_of(node:object)->Optional[int]:
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Token):
+            return item.line
+        if isinstance(item, list):
+            stack.extend(reversed(item))
+        elif isinstance(item, (Expr.Expr, Stmt.Stmt)):
+            stack.extend(reversed(list(vars(item).values())))
+    return None
+
+'''
+The size of an object, see "Sampling" above.
+'''
+def size_of(obj:object)->int:
+    size = sys.getsizeof(obj)
+    if obj.__class__ is Rope:
+        size += sys.getsizeof(obj.body)
+    elif hasattr(obj, '__dict__'):
+        size += sys.getsizeof(vars(obj))
+        if obj.__class__ is LoxInstance:
+            size += sys.getsizeof(obj.fields)
+    return size
+
+'''
+The size of an object and of the strings it holds directly.
+'''
+def retained_by(obj:object)->int:
+    size = size_of(obj)
+    if isinstance(obj, Environment):
+        held = obj.values()
+    elif obj.__class__ is LoxInstance:
+        held = obj.fields.values()
+    else:
+        return size
+    for value in held:
+        if value.__class__ is str or value.__class__ is Rope:
+            size += size_of(value)
+    return size
+
+class MemoryProfile():
+
+    def __init__(self, rate:int=SAMPLE_RATE):
+        self.rate = rate
+        self.random = random.Random(rate) # the same intervals every run
+        self.countdown = self.interval()
+        self.made = dict.fromkeys(KINDS, 0) # Dict[str,int]
+        self.freed = dict.fromkeys(KINDS, 0) # Dict[str,int]
+        self.peak = dict.fromkeys(KINDS, 0) # Dict[str,int]
+        self.live_at_end = dict.fromkeys(KINDS, 0) # Dict[str,int]
+        # per site, (line, function, kind): [objects sampled, their bytes]
+        self.sites = dict() # Dict[Tuple[int,str,str],List[int]]
+        # per site, of the sampled objects alive at the end: the same
+        self.retainers = dict() # Dict[Tuple[int,str,str],List[int]]
+        # the sampled objects not yet freed: id -> site
+        self.sampled = dict() # Dict[int,Tuple[int,str,str]]
+        self.lines = dict() # line_of() each node asked about
+        self.patches = list() # (owner, attribute, its value before, or None)
+
+    '''
+    The number of objects to count before the next one is sampled.
+    '''
+    def interval(self)->int:
+        if self.rate == 1:
+            return 1
+        return int(self.random.expovariate(1 / self.rate)) + 1
+
+    '''
+    Start profiling, by wrapping and adding the methods that count.
+    '''
+    def __enter__(self)->MemoryProfile:
+        note = self.note
+        def counting(init):
+            def __init__(obj, *args, **kwargs):
+                init(obj, *args, **kwargs)
+                note(obj)
+            return __init__
+        for cls in (Environment, LoxFunction, LoxInstance):
+            self.patch(cls, '__init__', counting(cls.__init__))
+        freed = self.freed
+        sampled = self.sampled
+        def __del__(obj):
+            freed[obj.__class__.__name__] += 1
+            if sampled:
+                sampled.pop(id(obj), None)
+        for cls in (Environment, LoxFunction, LoxInstance, Rope):
+            self.patch(cls, '__del__', __del__)
+        concatenate = interpreter_module.concatenate
+        def counted_concatenate(lhs:object, rhs:object)->object:
+            result = concatenate(lhs, rhs)
+            note(result)
+            return result
+        self.patch(interpreter_module, 'concatenate', counted_concatenate)
+        return self
+
+    '''
+    Stop: find the sampled objects still alive, and count what is alive,
+    then put everything back as it was.
+    '''
+    def __exit__(self, *exception):
+        for obj in gc.get_objects():
+            site = self.sampled.get(id(obj))
+            if site is not None and obj.__class__.__name__ == site[2]:
+                retainer = self.retainers.setdefault(site, [0, 0])
+                retainer[0] += 1
+                retainer[1] += retained_by(obj)
+        for kind in KINDS:
+            self.live_at_end[kind] = max(0, self.made[kind] - self.freed[kind])
+        for (owner, attribute, before) in reversed(self.patches):
+            if before is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, before)
+        self.patches.clear()
+        self.sampled.clear()
+        return False
+
+    def patch(self, owner:object, attribute:str, value:object):
+        self.patches.append((owner, attribute, vars(owner).get(attribute)))
+        setattr(owner, attribute, value)
+
+    '''
+    Count an object just made, and sample it when its turn comes.
+    '''
+    def note(self, obj:object):
+        kind = obj.__class__.__name__
+        made = self.made[kind] = self.made[kind] + 1
+        if made - self.freed[kind] > self.peak[kind]:
+            self.peak[kind] = made - self.freed[kind]
+        self.countdown -= 1
+        if self.countdown == 0:
+            self.countdown = self.interval()
+            site = self.site() + (kind,)
+            stats = self.sites.setdefault(site, [0, 0])
+            stats[0] += 1
+            stats[1] += size_of(obj)
+            if kind != 'str': # whose freeing can't be seen
+                self.sampled[id(obj)] = site
+
+    '''
+    Where the object being made is made: the line of the node whose visit
+    method is innermost on the Python stack (the visit methods all call the
+    node client), and the Lox function whose call is innermost above that.
+    '''
+    def site(self)->Tuple[int,str]:
+        frame = sys._getframe(2)
+        line = None
+        while frame is not None:
+            code = frame.f_code
+            if line is None:
+                if 'client' in code.co_varnames:
+                    client = frame.f_locals.get('client')
+                    if client is not None:
+                        if client not in self.lines:
+                            self.lines[client] = line_of(client)
+                        line = self.lines[client]
+            elif code is CALL_CODE:
+                return (line, frame.f_locals['self'].declaration.name.lexeme)
+            frame = frame.f_back
+        return (line, '(script)')
+
+    '''
+    Print what was found. Each table of sites shows the top ones.
+    '''
+    def report(self, out:TextIO=sys.stderr, top:int=10):
+        estimate = '' if self.rate == 1 else '~'
+        print(f"plox memory profile, 1 in {self.rate} objects sampled, "
+              f"~ marks estimates from the sample", file=out)
+        print(f"\n{'kind':<12} {'made':>12} {'peak live':>12} {'live at end':>12}", file=out)
+        for kind in KINDS:
+            if kind == 'str':
+                print(f"{kind:<12} {self.made[kind]:>12} {'-':>12} {'-':>12}", file=out)
+            else:
+                print(f"{kind:<12} {self.made[kind]:>12} {self.peak[kind]:>12} "
+                      f"{self.live_at_end[kind]:>12}", file=out)
+        for (title, table) in (("allocation sites, by bytes made", self.sites),
+                               ("top retainers at end, by bytes held", self.retainers)):
+            print(f"\n{title}", file=out)
+            print(f"{estimate+'bytes':>12} {estimate+'objects':>10} {'line':>6}  "
+                  f"{'function':<20} kind", file=out)
+            ranked = sorted(table.items(), key=lambda item: -item[1][1])
+            for ((line, function, kind), (count, size)) in ranked[:top]:
+                print(f"{size*self.rate:>12} {count*self.rate:>10} "
+                      f"{'?' if line is None else line:>6}  {function:<20} {kind}",
+                      file=out)
+            if not ranked:
+                print(f"{'(none)':>12}", file=out)
@@ -0,0 +1,412 @@
+'''
+
+## Optimizer: loop-invariant code motion and common subexpressions
+
+This is not in the book. It is a pass over the program after the Resolver
+has done its work and before the Interpreter gets it. Inner loops of real
+Lox code keep recomputing the same things, "a.b.c" property chains and
+arithmetic over variables the loop never changes, and visitGet and
+visitBinary are about the most expensive things the Interpreter does.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## How it works
+
+The classic way to hoist an invariant out of a loop is to compute it into
+a temporary before the loop starts. That won't do here, for two reasons.
+First, it changes the order of evaluation and, worse, the error behavior:
+if the loop body never executes, or the expression sits behind an "if" or
+an "and", a hoisted "a.b" could report an undefined property that the
+original program never touched. Second, a temporary is a new variable,
+and every variable depth the Resolver has computed inside the loop would
+then be off by one.
+
+So instead of moving the expression, we leave it exactly where it is and
+wrap it in an Expr.Memo node. The first time the Interpreter evaluates a
+Memo it evaluates the wrapped expression, in place, in the environment it
+would have used anyway, and saves the value. Every later evaluation just
+returns the saved value. The loop (or statement) that owns the Memo is
+wrapped in a Stmt.Memoize, which names the Memo keys it owns and discards
+their saved values when it is done. Errors happen exactly where and when
+they always did, because the first evaluation is the original one.
+
+The key of a Memo is an Expr node, that of the first occurrence found.
+Equal subexpressions in the same loop or statement share a key, and so
+share one computed value.
+
+## What is safe to memoize
+
+A subexpression is "pure" when it contains no Call, no Assign, no Set and
+no Super; that is, only literals, variables, "this", groupings, unary,
+binary and logical operators, and property Gets. Bare literals, variables
+and "this" are pure but not worth the trouble.
+
+Within a While (both its condition and its body), a pure subexpression is
+invariant when,
+
+* none of its variable names is assigned anywhere in the loop, or declared
+  anywhere in the loop (which would make it a different variable on each
+  iteration);
+* if it contains a variable at all, the loop makes no calls, because a
+  called function could assign any global or any variable in its closure;
+  and has no yield, because the same goes for whoever resumes it;
+* if it contains a Get, the loop makes no calls and has no Set, because
+  either could change the field.
+
+An expression built only of literals is always invariant. The bodies of
+functions and classes declared inside a loop are not examined for that
+loop; they run in their own activations and get their own treatment.
+
+Within a single statement (expression, print, var, return, or the
+condition of an if), any pure subexpression that appears twice is shared,
+provided the statement has no Call, no Set, and no Assign other than the
+outermost one. Repeated variables name the same binding, because there is
+no way to open a new scope inside an expression.
+
+One small difference can be seen: a Get of a method returns a new bound
+function each time in the Interpreter, and so "a.m == a.m" is false; once
+memoized, the two sides are the same object. Nobody should care.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import Expr
+import Stmt
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, Iterator, List, Optional
+
+class Optimizer():
+
+    '''
+    The Optimizer keeps no state between calls; optimize() may be called
+    on any number of programs.
+    '''
+    def __init__(self):
+        pass
+
+    '''
+    ### Top-level entry, called from plox.run_lox after the Resolver.
+
+    The argument is the list of Stmt objects returned by the Parser. The
+    statements are modified in place where possible; the returned list
+    should be used in place of the argument, as some top-level statements
+    may have been wrapped in a Memoize.
+    '''
+    def optimize(self, statements:List[Stmt.Stmt])->List[Stmt.Stmt]:
+        return [self.optimize_stmt(stmt) for stmt in statements]
+
+    '''
+    Optimize one statement, returning it or its replacement. The recursion
+    visits every statement in the program, including the bodies of
+    functions and class methods.
+    '''
+    def optimize_stmt(self, stmt:Stmt.Stmt)->Stmt.Stmt:
+        if isinstance(stmt, Stmt.While):
+            return self.optimize_while(stmt)
+        if isinstance(stmt, Stmt.Block):
+            stmt.statements = self.optimize(stmt.statements)
+            return stmt
+        if isinstance(stmt, Stmt.Function):
+            stmt.body = self.optimize(stmt.body)
+            return stmt
+        if isinstance(stmt, Stmt.Class):
+            for method in stmt.methods:
+                method.body = self.optimize(method.body)
+            return stmt
+        if isinstance(stmt, Stmt.If):
+            stmt.thenBranch = self.optimize_stmt(stmt.thenBranch)
+            if stmt.elseBranch is not None:
+                stmt.elseBranch = self.optimize_stmt(stmt.elseBranch)
+        return self.share_common(stmt)
+
+    '''
+    ### Loop-invariant code motion
+
+    Work from the outermost loop inward. Memos are placed around the
+    largest invariant subexpressions of this loop first; then the body is
+    optimized, which handles nested loops and single statements. Memo
+    nodes already placed are opaque to the inner passes.
+    '''
+    def optimize_while(self, loop:Stmt.While)->Stmt.Stmt:
+        facts = LoopFacts(loop)
+        keys = dict() # shape -> key Expr, in order of discovery
+        def hoist(expr:Expr.Expr)->Optional[Expr.Expr]:
+            shape = pure_shape(expr)
+            if shape is None or not facts.invariant(expr):
+                return None # not this one, look at its parts
+            if not worth_memoizing(expr):
+                return expr # invariant, but leave it alone
+            key = keys.setdefault(shape, expr)
+            return Expr.Memo(expr, key)
+        loop.condition = rewrite(loop.condition, hoist)
+        for stmt in statements_in(loop.body):
+            for (owner, attr) in expression_slots(stmt):
+                setattr(owner, attr, rewrite(getattr(owner, attr), hoist))
+        loop.body = self.optimize_stmt(loop.body)
+        if keys :
+            return Stmt.Memoize(list(keys.values()), loop)
+        return loop
+
+    '''
+    ### Common subexpressions within one statement
+
+    Count the shapes of all pure subexpressions of the statement's
+    expression, then replace the largest repeated ones with Memos.
+    '''
+    def share_common(self, stmt:Stmt.Stmt)->Stmt.Stmt:
+        root = statement_expression(stmt)
+        if root is None:
+            return stmt
+        owner, attr = root
+        expr = getattr(owner, attr)
+        if isinstance(expr, Expr.Assign):
+            owner, attr = expr, 'value' # the outermost assignment is ok
+            expr = expr.value
+        for node in walk_expr(expr):
+            if isinstance(node, (Expr.Call, Expr.Assign, Expr.Set)):
+                return stmt
+        counts = dict() # shape -> number of occurrences
+        for node in walk_expr(expr):
+            if worth_memoizing(node):
+                shape = pure_shape(node)
+                if shape is not None:
+                    counts[shape] = counts.get(shape, 0) + 1
+        keys = dict() # shape -> key Expr
+        def share(node:Expr.Expr)->Optional[Expr.Expr]:
+            if not worth_memoizing(node):
+                return None
+            shape = pure_shape(node)
+            if shape is None or counts[shape] < 2:
+                return None
+            key = keys.setdefault(shape, node)
+            return Expr.Memo(node, key)
+        setattr(owner, attr, rewrite(expr, share))
+        if keys :
+            return Stmt.Memoize(list(keys.values()), stmt)
+        return stmt
+
+'''
+Gather the facts about one loop that decide what is invariant in it: the
+names assigned or declared anywhere in it, and whether it contains any
+call (or yield) or property Set. Unlike the rewriting, this looks everywhere,
+including inside functions declared in the loop, since a function
+declared in the loop might assign a variable that the loop also uses.
+'''
+class LoopFacts():
+    def __init__(self, loop:Stmt.While):
+        self.changed = set() # names assigned or declared in the loop
+        self.has_call = False
+        self.has_set = False
+        for node in walk_all(loop):
+            if isinstance(node, Expr.Assign):
+                self.changed.add(node.name.lexeme)
+            elif isinstance(node, (Stmt.Var, Stmt.Class)):
+                self.changed.add(node.name.lexeme)
+            elif isinstance(node, Stmt.Function):
+                self.changed.add(node.name.lexeme)
+                self.changed.update(param.lexeme for param in node.params)
+            elif isinstance(node, (Expr.Call, Stmt.Yield)):
+                self.has_call = True
+            elif isinstance(node, Expr.Set):
+                self.has_set = True
+
+    def invariant(self, expr:Expr.Expr)->bool:
+        for node in walk_expr(expr):
+            if isinstance(node, Expr.Variable):
+                if self.has_call or node.name.lexeme in self.changed:
+                    return False
+            elif isinstance(node, Expr.Get):
+                if self.has_call or self.has_set:
+                    return False
+        return True
+
+'''
+### Utility functions
+
+Return a hashable description of a pure expression, such that two
+expressions with equal shapes always produce equal values in the same
+environment. Return None if the expression is not pure. A Memo already in
+place has the shape of its key, so that equal Memos can be shared again.
+
+Note the type of a literal is part of its shape, since in Python
+1.0 == True and so (1.0, ...) and (True, ...) would be one dict key.
+'''
+def pure_shape(expr:Expr.Expr)->Optional[tuple]:
+    if isinstance(expr, Expr.Literal):
+        return ('lit', type(expr.value), expr.value)
+    if isinstance(expr, Expr.Variable):
+        return ('var', expr.name.lexeme)
+    if isinstance(expr, Expr.This):
+        return ('this',)
+    if isinstance(expr, Expr.Memo):
+        return pure_shape(expr.key)
+    if isinstance(expr, Expr.Grouping):
+        return pure_shape(expr.expression)
+    if isinstance(expr, Expr.Get):
+        inner = pure_shape(expr.object)
+        return None if inner is None else ('get', inner, expr.name.lexeme)
+    if isinstance(expr, Expr.Unary):
+        inner = pure_shape(expr.right)
+        return None if inner is None else ('un', expr.operator.type, inner)
+    if isinstance(expr, (Expr.Binary, Expr.Logical)):
+        lhs = pure_shape(expr.left)
+        rhs = pure_shape(expr.right)
+        if lhs is None or rhs is None:
+            return None
+        return (type(expr).__name__, expr.operator.type, lhs, rhs)
+    return None # Call, Assign, Set, Super
+
+'''
+Is it worth wrapping this expression in a Memo? Not for the things that
+are as quick to evaluate as a Memo is: literals, variables, "this", a
+grouping of one of those, or a Memo already.
+'''
+def worth_memoizing(expr:Expr.Expr)->bool:
+    while isinstance(expr, Expr.Grouping):
+        expr = expr.expression
+    return not isinstance(expr,
+        (Expr.Literal, Expr.Variable, Expr.This, Expr.Memo))
+
+'''
+Rewrite an expression tree top-down. The replace function is given each
+node; if it returns a node, that replaces the subtree and its parts are
+not visited. If it returns None, the parts of the node are rewritten in
+turn. Memo nodes are never looked into.
+'''
+def rewrite(expr:Expr.Expr, replace:Callable[[Expr.Expr],Optional[Expr.Expr]])->Expr.Expr:
+    if expr is None or isinstance(expr, Expr.Memo):
+        return expr
+    new_expr = replace(expr)
+    if new_expr is not None:
+        return new_expr
+    if isinstance(expr, (Expr.Binary, Expr.Logical)):
+        expr.left = rewrite(expr.left, replace)
+        expr.right = rewrite(expr.right, replace)
+    elif isinstance(expr, Expr.Unary):
+        expr.right = rewrite(expr.right, replace)
+    elif isinstance(expr, Expr.Grouping):
+        expr.expression = rewrite(expr.expression, replace)
+    elif isinstance(expr, Expr.Get):
+        expr.object = rewrite(expr.object, replace)
+    elif isinstance(expr, Expr.Set):
+        expr.object = rewrite(expr.object, replace)
+        expr.value = rewrite(expr.value, replace)
+    elif isinstance(expr, Expr.Assign):
+        expr.value = rewrite(expr.value, replace)
+    elif isinstance(expr, Expr.Call):
+        expr.callee = rewrite(expr.callee, replace)
+        expr.arguments = [rewrite(arg, replace) for arg in expr.arguments]
+    return expr
+
+'''
+Generate every node of an expression tree, parents before children. A
+Memo is yielded but not looked into; what is inside is already known to
+be pure.
+'''
+def walk_expr(expr:Expr.Expr)->Iterator[Expr.Expr]:
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        yield node
+        if isinstance(node, (Expr.Binary, Expr.Logical)):
+            stack.extend((node.right, node.left))
+        elif isinstance(node, Expr.Unary):
+            stack.append(node.right)
+        elif isinstance(node, Expr.Grouping):
+            stack.append(node.expression)
+        elif isinstance(node, Expr.Get):
+            stack.append(node.object)
+        elif isinstance(node, Expr.Set):
+            stack.extend((node.value, node.object))
+        elif isinstance(node, Expr.Assign):
+            stack.append(node.value)
+        elif isinstance(node, Expr.Call):
+            stack.extend(reversed(node.arguments))
+            stack.append(node.callee)
+
+'''
+Generate the statements that are executed as part of a loop body: the
+body itself, and recursively the statements of blocks, ifs, nested loops
+and Memoize wrappers. Function and class declarations are yielded but not
+looked into.
+'''
+def statements_in(stmt:Stmt.Stmt)->Iterator[Stmt.Stmt]:
+    stack = [stmt]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        yield node
+        if isinstance(node, Stmt.Block):
+            stack.extend(reversed(node.statements))
+        elif isinstance(node, Stmt.If):
+            stack.extend((node.elseBranch, node.thenBranch))
+        elif isinstance(node, Stmt.While):
+            stack.append(node.body)
+        elif isinstance(node, Stmt.Memoize):
+            stack.append(node.body)
+
+'''
+Generate (object, attribute-name) pairs for the expressions held directly
+by one statement, so that they can be rewritten with setattr().
+'''
+def expression_slots(stmt:Stmt.Stmt)->Iterator[tuple]:
+    if isinstance(stmt, (Stmt.Expression, Stmt.Print)):
+        yield (stmt, 'expression')
+    elif isinstance(stmt, Stmt.Var) and stmt.initializer is not None:
+        yield (stmt, 'initializer')
+    elif isinstance(stmt, (Stmt.Return, Stmt.Yield)) and stmt.value is not None:
+        yield (stmt, 'value')
+    elif isinstance(stmt, (Stmt.If, Stmt.While)):
+        yield (stmt, 'condition')
+
+'''
+The one expression of a statement that common-subexpression sharing
+applies to, as an (object, attribute-name) pair, or None. A While is not
+included: its condition is evaluated once per iteration, but a Memoize
+around the loop would only reset once per loop.
+'''
+def statement_expression(stmt:Stmt.Stmt)->Optional[tuple]:
+    if isinstance(stmt, Stmt.While):
+        return None
+    for slot in expression_slots(stmt):
+        return slot
+    return None
+
+'''
+Generate every node, statement or expression, in and under a statement,
+including the bodies of functions and methods.
+'''
+def walk_all(stmt:Stmt.Stmt)->Iterator[object]:
+    stack = [stmt]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        if isinstance(node, Expr.Expr):
+            yield from walk_expr(node)
+            continue
+        yield node
+        if isinstance(node, Stmt.Block):
+            stack.extend(node.statements)
+        elif isinstance(node, Stmt.If):
+            stack.extend((node.condition, node.thenBranch, node.elseBranch))
+        elif isinstance(node, Stmt.While):
+            stack.extend((node.condition, node.body))
+        elif isinstance(node, Stmt.Memoize):
+            stack.append(node.body)
+        elif isinstance(node, Stmt.Function):
+            stack.extend(node.body)
+        elif isinstance(node, Stmt.Class):
+            stack.append(node.superclass)
+            stack.extend(node.methods)
+        elif isinstance(node, (Stmt.Expression, Stmt.Print)):
+            stack.append(node.expression)
+        elif isinstance(node, Stmt.Var):
+            stack.append(node.initializer)
+        elif isinstance(node, (Stmt.Return, Stmt.Yield)):
+            stack.append(node.value)
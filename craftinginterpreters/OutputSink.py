@@ -0,0 +1,115 @@
+'''
+
+# OutputSink: where print statements go, and how values look there
+
+Not in the book. The Interpreter's print statement used to format its
+value with str(), look at the end of the string for ".0", slice that off,
+and call the builtin print(); and plox.show_value had its own copy of the
+same formatting. For a script that prints a million lines, that was most
+of its run time: print() is an expensive call, with its keyword arguments
+and its separate writes of the text and the newline.
+
+Now formatting is done by format_value(), below, which both use, and an
+Interpreter sends the lines it prints to its output sink, an object with
+two methods,
+
+    write_line(text)    take one line of output, without its newline
+    flush()             pass on any lines still held
+
+The Interpreter calls flush() when a program (or REPL entry) finishes,
+and before it reports a runtime error, so that what was printed before
+the error comes before the error message. Three kinds are here:
+
+* BufferedSink, the default, collects lines and writes them to a stream
+  (stdout, unless told otherwise) many at a time, in one write.
+* FileSink is a BufferedSink writing to a file it opens.
+* MemorySink keeps the lines in a list, for a program that runs Lox
+  code and wants its output as data, see LoxProgram.run.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## Flush policy
+
+A BufferedSink writes when it holds flush_lines lines, and when flushed.
+By default, flush_lines is 1 when stdout is a terminal, so that a person
+watching sees each line as it is printed, as before; otherwise it is
+BUFFER_LINES. flush_lines=1 is the way to get a line at a time anywhere.
+
+A BufferedSink with no stream looks up sys.stdout each time it writes,
+not once when it is made, so that contextlib.redirect_stdout still
+captures Lox output (plox_batch.py depends on that).
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import sys
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List, TextIO
+
+'''
+Lines a BufferedSink holds, by default, before writing them.
+'''
+BUFFER_LINES = 512
+
+'''
+The text of a Lox value, as print shows it. A Lox number is a float, and
+an integral one is shown without its ".0". Every integral float of
+magnitude under 1e16 has the repr "<digits>.0", so those take the quick
+way, through int; bigger ones, which may be in exponent form, and zero,
+which may be "-0.0", take the general one. Everything else is str(),
+nil as None and booleans as True and False, as ever.
+
+Note that the ".0" is cut off the text of any value at all, as it always
+has been, so the Lox string "v1.0" prints as "v1". Scripts' output is
+the same as before, wart included.
+'''
+def format_value(value:object)->str:
+    if value.__class__ is float and value.is_integer() and 0.0 < abs(value) < 1e16:
+        return str(int(value))
+    text = value if value.__class__ is str else str(value)
+    return text[:-2] if text.endswith('.0') else text
+
+class BufferedSink():
+    def __init__(self, stream:TextIO=None, flush_lines:int=None):
+        self.stream = stream
+        if flush_lines is None:
+            terminal = (stream or sys.stdout).isatty()
+            flush_lines = 1 if terminal else BUFFER_LINES
+        self.flush_lines = flush_lines
+        self.lines = list() # List[str]
+
+    def write_line(self, text:str):
+        lines = self.lines
+        lines.append(text)
+        if len(lines) >= self.flush_lines:
+            self.flush()
+
+    def flush(self):
+        if self.lines :
+            lines = self.lines
+            self.lines = list()
+            lines.append('') # for the final newline
+            (self.stream or sys.stdout).write('\n'.join(lines))
+
+class FileSink(BufferedSink):
+    def __init__(self, path:str, flush_lines:int=BUFFER_LINES):
+        super().__init__(open(path, 'w', encoding='utf_8'), flush_lines)
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+class MemorySink():
+    def __init__(self):
+        self.lines = list() # List[str]
+
+    def write_line(self, text:str):
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+    def text(self)->str:
+        return ''.join(line + '\n' for line in self.lines)
@@ -0,0 +1,374 @@
+'''
+
+# Parallel: run a Lox function over many items on every core
+
+Not in the book. Lox runs on one thread, which in CPython means one core,
+however many the machine has. When a job is the same pure computation
+done to each of many items, the items can be farmed out to other
+processes, each with a Python (and an Interpreter) of its own. This
+builtin does that:
+
+    parallelMap(fn, items)
+
+fn is a Lox function of one argument. items is a generator (see
+Generators.py), all of whose values are taken, or a number n, meaning the
+numbers 0 to n-1. The result is a stream of fn(item) for each item, in
+the order of the items, which is read with next() and done() just like a
+generator:
+
+    fun collatz(n) { var steps = 0; ... return steps; }
+    var lengths = parallelMap(collatz, 100000);
+    var longest = 0;
+    while (!done(lengths)) { var l = next(lengths); if (l > longest) longest = l; }
+
+The items, and the values fn returns, must be numbers, strings, booleans
+or nil, which can be copied between processes exactly.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## Sending a function to another process
+
+A LoxFunction is its declaration, a Stmt.Function, plus its closure,
+an Environment which leads (through any enclosing Environments) to the
+globals, which hold everything else in the program.
+Pickling the function as it stands would send all of that. Instead, a
+Packer makes a copy of the function with a pruned closure: a chain of new
+Environments, one for each level of the original chain (so that the
+Resolver's depths still count the right number of levels), holding only
+the names the function's body refers to. The values of those names are
+copied in turn: a function it calls is packed the same way, with the
+same pruned globals, and so is a class it uses, method by method.
+
+A function's closure is a Closure of its free variables (see "Flat
+closures" in Environment.py), or the globals, so the chain is short; the
+copy of a Closure is a plain Environment holding the values of its
+Upvalues, which is all a function that can't assign them needs.
+
+The pickle also carries the depths of every variable reference in every
+packed function, the free variables of every function declared in one,
+and which of its blocks declare nothing, taken from the Interpreter's
+locals. It is sent to the
+worker processes with each chunk of items. A worker unpickles it (once,
+then keeps it), makes an Interpreter whose globals are the pruned globals
+plus the worker's own builtins, and calls the function on each item.
+
+## What can't be sent
+
+A function whose closure holds anything that can't be copied faithfully
+gets a runtime error at the call of parallelMap, naming the variable:
+
+* an instance: its fields could be changed by the function in a worker,
+  or by the program while the workers run, and neither would see it.
+  (An instance made by the function in the worker is fine, of course.)
+* a channel, a generator, or a native function supplied by a host
+  program, none of which can live in two processes.
+
+Nor may the function, or any function it uses, assign to a variable
+declared outside itself: each worker would change its own copy, and the
+program would never see it. That is also an error at the call.
+
+A runtime error in fn, in a worker, is reported where it happened in fn.
+What fn prints goes to the same place as the program's output, but from
+several processes at once, in no particular order.
+
+## The workers
+
+One pool of worker processes, one per core, is started on the first
+call of parallelMap, and lasts as long as the program. The items are
+split into a few chunks per worker, so that a slow chunk doesn't leave
+the other workers idle at the end.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import os
+
+import Expr
+import Stmt
+from Environment import Environment, Globals
+from LoxCallable import LoxCallable, LoxFunction, LoxClass, LoxInstance, \
+                        NativeFunction, NativeError
+from Generators import LoxGenerator
+from Rope import Rope
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Iterator, List, Mapping, Set, Tuple
+
+PLAIN_TYPES = (type(None), bool, float, int, str, Rope) # a Rope pickles as a str
+
+'''
+Chunks per worker process, see "The workers" above.
+'''
+CHUNKS_PER_WORKER = 4
+
+'''
+Every node of a syntax tree, statements and expressions, each once.
+'''
+def nodes_in(root:object)->Iterator[object]:
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        for value in vars(node).values():
+            if isinstance(value, (Expr.Expr, Stmt.Stmt)):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(item for item in value
+                             if isinstance(item, (Expr.Expr, Stmt.Stmt)))
+
+'''
+Make pruned copies of functions and classes, and of the Environments they
+close over, for one pickle. Copies are made once each, keyed by the id of
+the original, so that the copies refer to each other as the originals do.
+'''
+class Packer():
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.globals = Globals()
+        self.environments = {id(interpreter.globals): self.globals}
+        self.copies = dict() # id of function or class -> its copy
+        self.originals = list() # keep them alive, so their ids stay theirs
+        self.depths = dict() # Mapping[Expr,int]
+
+    def pack_function(self, function:LoxFunction)->LoxFunction:
+        if id(function) in self.copies:
+            return self.copies[id(function)]
+        copy = LoxFunction(function.declaration, None, function.isInitializer)
+        self.copies[id(function)] = copy
+        self.originals.append(function)
+        names = set() # names referred to in the body
+        declared = set(param.lexeme for param in function.declaration.params)
+        assigned = list() # Tokens of names assigned in the body
+        for node in nodes_in(function.declaration):
+            if isinstance(node, (Expr.Variable, Expr.Assign)):
+                names.add(node.name.lexeme)
+            elif isinstance(node, Expr.This):
+                names.add("this")
+            elif isinstance(node, Expr.Super):
+                names.update(("super", "this"))
+            if isinstance(node, Expr.Assign):
+                assigned.append(node.name)
+            elif isinstance(node, (Stmt.Var, Stmt.Function, Stmt.Class)):
+                declared.add(node.name.lexeme)
+            if isinstance(node, Stmt.Function):
+                declared.update(param.lexeme for param in node.params)
+            depth = self.interpreter.locals.get(node) \
+                    if isinstance(node, (Expr.Expr, Stmt.Function, Stmt.Block)) else None
+            if depth is not None:
+                self.depths[node] = depth
+        for name in assigned:
+            if name.lexeme not in declared:
+                raise NativeError(f"parallelMap: {function} assigns to '{name.lexeme}', "
+                                  "a variable outside it, which a worker process can't change")
+        copy.closure = self.pack_environment(function.closure, names)
+        return copy
+
+    def pack_class(self, klass:LoxClass)->LoxClass:
+        if id(klass) in self.copies:
+            return self.copies[id(klass)]
+        copy = LoxClass(klass.name, dict(), None)
+        self.copies[id(klass)] = copy
+        self.originals.append(klass)
+        if klass.super_class is not None:
+            copy.super_class = self.pack_class(klass.super_class)
+        for (name, method) in (klass.methods or {}).items():
+            copy.methods[name] = self.pack_function(method)
+        return copy
+
+    '''
+    A class copy is filled in after it is made, and a class it inherits
+    from may be filled in later still, when the classes refer to each
+    other; so each finds its initializer (see LoxCallable.py) when all
+    are done.
+    '''
+    def find_initializers(self):
+        for copy in self.copies.values():
+            if isinstance(copy, LoxClass):
+                copy.find_initializer()
+
+    '''
+    The copy of an Environment, made empty (with the copy of its
+    enclosing Environment) the first time it is asked for; then copy
+    into it, and each of its enclosing copies, the given names that the
+    original has.
+    '''
+    def pack_environment(self, environment:Environment, names:Set[str])->Environment:
+        chain = list()
+        level = environment
+        while level is not None:
+            chain.append(level)
+            level = level.enclosing
+        for level in reversed(chain): # make the copies outermost first
+            if id(level) not in self.environments:
+                self.environments[id(level)] = Environment(self.environments[id(level.enclosing)])
+                self.originals.append(level)
+        from Interpreter import CONTINUE # not at top: it imports us
+        for level in chain:
+            copy = self.environments[id(level)]
+            for name in names.union((CONTINUE,)):
+                if name in level and name not in copy:
+                    value = self.pack_value(name, level[name])
+                    if value is not SKIP:
+                        copy.define(name, value)
+        return self.environments[id(environment)]
+
+    def pack_value(self, name:str, value:object)->object:
+        if isinstance(value, PLAIN_TYPES):
+            return value
+        if isinstance(value, LoxFunction):
+            return self.pack_function(value)
+        if isinstance(value, LoxClass):
+            return self.pack_class(value)
+        if isinstance(value, LoxInstance):
+            raise NativeError(f"parallelMap: the function uses '{name}', an instance, "
+                              "whose fields can't be shared between processes")
+        if isinstance(value, LoxCallable) and not isinstance(value, NativeFunction):
+            return SKIP # a builtin, which the worker has of its own
+        raise NativeError(f"parallelMap: the function uses '{name}', {value}, "
+                          "which can't be sent to another process")
+
+SKIP = object() # pack_value: leave this name out
+
+'''
+## In the worker
+
+The unpickled function and its Interpreter, by payload, so that the
+chunks after the first don't unpickle it again.
+'''
+_loaded = dict() # Mapping[bytes,Tuple[LoxFunction,Interpreter]]
+
+def loaded(payload:bytes)->Tuple[LoxFunction,object]:
+    if payload not in _loaded:
+        import pickle
+        from Interpreter import Interpreter
+        function, globals_copy, depths = pickle.loads(payload)
+        def raise_error(a_token, message:str): # as from a task, see Tasks.py
+            raise Interpreter.EvaluationError(a_token, message)
+        interpreter = Interpreter(raise_error, locals_map=depths)
+        for (name, value) in interpreter.globals.items():
+            if name not in globals_copy:
+                globals_copy.define(name, value)
+        interpreter.globals = interpreter.environment = globals_copy
+        _loaded.clear() # only the latest is likely to be wanted again
+        _loaded[payload] = (function, interpreter)
+    return _loaded[payload]
+
+'''
+Call the function on each of a chunk of items. Return (results, None), or
+(None, (token, message)) for the first runtime error.
+'''
+def run_chunk(payload:bytes, items:List[object])->tuple:
+    from Interpreter import Interpreter
+    function, interpreter = loaded(payload)
+    results = list()
+    try:
+        for item in items:
+            value = function.call(interpreter, [item])
+            if not isinstance(value, PLAIN_TYPES):
+                raise Interpreter.EvaluationError(function.declaration.name,
+                    f"parallelMap: {function} returned something other than a "
+                    "number, string, boolean or nil")
+            results.append(value)
+    except Interpreter.EvaluationError as EVE:
+        return (None, (EVE.token, EVE.message))
+    finally:
+        interpreter.output.flush()
+    return (results, None)
+
+'''
+## In the program
+'''
+_pool = None
+
+def pool():
+    global _pool
+    if _pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+'''
+The values of parallelMap, for next() and done() to take, as from a
+generator that has already run.
+'''
+class ResultStream(LoxGenerator):
+    def __init__(self, values:List[object]):
+        self.values = iter(values)
+        self.has_value = False
+        self.value = None
+        self.finished = False
+        self.running = False
+
+    def advance(self):
+        try:
+            self.value = next(self.values)
+            self.has_value = True
+        except StopIteration:
+            self.finished = True
+
+    def __str__(self)->str:
+        return "parallelMap results"
+
+def items_of(source:object)->List[object]:
+    if isinstance(source, LoxGenerator):
+        items = list()
+        while not source.is_done():
+            items.append(source.take())
+    elif source.__class__ in (float, int) and source >= 0 and source == int(source):
+        items = [source.__class__(n) for n in range(int(source))] # int with plox --int
+    else:
+        raise NativeError("parallelMap needs a generator or a count of items")
+    for item in items:
+        if not isinstance(item, PLAIN_TYPES):
+            raise NativeError(f"parallelMap: item {item} is not a number, "
+                              "string, boolean or nil")
+    return items
+
+class ParallelMap(LoxCallable):
+    def arity(self): return 2
+    def call(self, interpreter, args:List[object]):
+        import pickle
+        from concurrent.futures.process import BrokenProcessPool
+        from Interpreter import Interpreter
+        function, source = args
+        if not isinstance(function, LoxFunction) or function.arity() != 1:
+            raise NativeError("parallelMap needs a function of one argument")
+        items = items_of(source)
+        if not items :
+            return ResultStream([])
+        packer = Packer(interpreter)
+        packed = packer.pack_function(function)
+        packer.find_initializers()
+        try:
+            payload = pickle.dumps((packed, packer.globals, packer.depths),
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            raise NativeError("parallelMap: the function is too deeply nested to send")
+        workers = os.cpu_count() or 1
+        size = max(1, -(-len(items) // (workers * CHUNKS_PER_WORKER)))
+        try:
+            futures = [pool().submit(run_chunk, payload, items[start:start+size])
+                       for start in range(0, len(items), size)]
+            outcomes = [future.result() for future in futures]
+        except BrokenProcessPool:
+            global _pool
+            _pool = None
+            raise NativeError("parallelMap: a worker process died")
+        results = list()
+        for (values, error) in outcomes:
+            if error is not None:
+                raise Interpreter.EvaluationError(*error)
+            results.extend(values)
+        return ResultStream(results)
+    def __str__(self): return "native function 'parallelMap'"
+
+'''
+Add the builtin to a global environment.
+'''
+def define_natives(environment):
+    environment.define('parallelMap', ParallelMap())
@@ -10,11 +10,16 @@ This work is licensed under a
 
 '''
 
+from __future__ import annotations # no annotation is evaluated
 from TokenType import * # all the names of lexemes
 from Token import Token
 import Expr # refer to Expr.Expr, Expr.Binary, etc.
 import Stmt # refer to Stmt.Stmt, Stmt.Function, Stmt.Block, etc.
-from typing import Callable, List, Union, Optional
+from Resolver import Resolver, Depths, FunctionType, ClassType
+from LoxCallable import LoxClass
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, List, Union, Optional
 
 '''
 The Parser class implements a recursive descent parser, section 6.2.2, with
@@ -27,6 +32,36 @@ IMHO.) For the challenge of the error functions, see plox.py line 100ff.
 
 This version is now modified to handle Statements, see Chapter 8.2ff.
 
+## Resolving in the same pass (one_pass)
+
+Not in the book. The front end used to make three passes over a program:
+the Scanner over the text, the Parser over the tokens, and the Resolver
+over the tree. Given one_pass=True, the Parser does the Resolver's work as
+it goes, keeping the Resolver's stack of scopes (in a Resolver of its own,
+whose methods it uses) and resolving each Variable, Assign, This and
+Super as it makes it, so the tree is only made, never walked.
+
+The hooks are few: a scope opens and closes around a block, a function
+body, a class's methods and the desugared parts of a for (see for_stmt);
+var, fun and class declare and define their names; and primary() and
+assignment() resolve references. A Variable followed by "=" is not
+resolved in primary(), since it may be about to become an Assign, which
+assignment() resolves after its value, as the Resolver would.
+
+A block that declares nothing gets no scope from the Resolver (see
+"Blocks that declare nothing" in Resolver.py), which knows from its
+statements. We must know before reading them, so we look ahead over the
+tokens, see block_declares().
+
+All of the Resolver's diagnostics are kept, in a simple way: the Parser
+never reports one. If its Resolver raises a ResolutionError, or the
+Parser finds a syntax error, or a function turns out to be a generator
+that breaks a rule (which can't be known until its body has been read)
+the Parser just stops resolving. Then depths is None after parse(), and
+the caller runs the usual Resolver over the tree, which finds and reports
+the error exactly as before. A program with an error costs a little more
+to compile; a correct one is resolved in the one pass, and then depths is
+a Resolver.Depths for it. See front_end() in plox.py.
 '''
 
 class Parser:
@@ -49,13 +84,24 @@ class Parser:
     Initialize a new Parser instance, receiving a list of tokens as
     produced by Scanner.py, and an error reporting function.
     '''
-    def __init__(self, tokens:List[Token],error_report:Callable[[Token,str],None]):
+    def __init__(self, tokens:List[Token],error_report:Callable[[Token,str],None],
+                 one_pass:bool=False):
         # save the list of tokens
         self.tokens = tokens
         # save the error reporter
         self.error_report = error_report
         # initialize our index to the next Token to eat
         self.current = 0
+        # one flag per function being parsed, innermost last: has it a yield?
+        self.function_yields = list() # List[bool]
+        # for one_pass, the Resolver doing the work and its results, see above
+        self.depths = Depths() if one_pass else None
+        self.resolver = Resolver(self.depths, None) if one_pass else None
+        # with one_pass, per function being parsed: has it a return value?
+        self.function_returns = list() # List[bool]
+        # with one_pass, the indexes of the '{' of blocks that declare
+        # something, found when first wanted, see block_declares()
+        self.declaring_blocks = None # Optional[Set[int]]
 
     '''
     Initialize a tuple of the declaration keyword types, see statement()
@@ -73,9 +119,55 @@ class Parser:
                 results.append(self.declaration())
         except Parser.ParseError as PEX:
             self.error_report(PEX.error_token, PEX.error_message)
+            self.resolver = None
             results = None
+        if self.resolver is None:
+            self.depths = None # not resolved, or not completely
         return results # here's the return!
 
+    '''
+    ## For one_pass
+
+    Call a method of our Resolver, if we have one still. If it raises an
+    error, give up resolving; the Resolver proper will find it again.
+    '''
+    def resolving(self, action:Callable, *args):
+        try:
+            action(*args)
+        except Resolver.ResolutionError:
+            self.resolver = None
+
+    '''
+    Does the block whose '{' is tokens[brace] declare anything in its own
+    scope? The first time we're asked, find every block that does, in one
+    look over the tokens: one with a var, fun or class inside its braces
+    but not inside any deeper, nor inside parentheses, where a for's var
+    is. A block left open is a syntax error, and counted as declaring.
+    '''
+    def block_declares(self, brace:int)->bool:
+        if self.declaring_blocks is None:
+            found = set()
+            stack = [] # per open '{': [its index, open parens, declares]
+            for (index, token) in enumerate(self.tokens):
+                ttype = token.type
+                if ttype == LEFT_BRACE:
+                    stack.append([index, 0, False])
+                elif not stack:
+                    continue
+                elif ttype == RIGHT_BRACE:
+                    (start, parens, declares) = stack.pop()
+                    if declares:
+                        found.add(start)
+                elif ttype == LEFT_PAREN:
+                    stack[-1][1] += 1
+                elif ttype == RIGHT_PAREN:
+                    stack[-1][1] -= 1
+                elif ttype in Parser.declarators and stack[-1][1] == 0:
+                    stack[-1][2] = True
+            found.update(entry[0] for entry in stack)
+            self.declaring_blocks = found
+        return brace in self.declaring_blocks
+
     '''
     Utility functions for parsing.
     U1. peek: get current token without advancing
@@ -147,7 +239,7 @@ class Parser:
             if self.previous().type == SEMICOLON:
                 return;
             # ... or if at a token that starts a new block or statement,
-            if self.peek().type in (CLASS,FUN,VAR,FOR,IF,WHILE,PRINT,RETURN) :
+            if self.peek().type in (CLASS,FUN,VAR,FOR,IF,WHILE,PRINT,RETURN,YIELD) :
                 return;
             # otherwise, keep swallowing...
             self.advance();
@@ -173,6 +265,7 @@ class Parser:
                           | if_statement
                           | print_statement
                           | return_statement
+                          | yield_statement
                           | while_statement
                           | break_statement
                           | block
@@ -184,6 +277,7 @@ class Parser:
         if_statement      → "if" "(" expression ")" statement ( "else" statement )?
         print_statement   → "print" expression ";"
         return_statement  → "return" expression? ";"
+        yield_statement   → "yield" expression? ";"
         while_statement   → "while" "(" expression ")" statement
         break_statement   → "break" ";"
         block             → "{" declaration* "}"
@@ -209,6 +303,7 @@ class Parser:
             raise NotImplementedError
         except Parser.ParseError as PEX:
             self.error_report(PEX.error_token, PEX.error_message)
+            self.resolver = None # the program won't be run anyway
             self.synchronize()
             return None
     '''
@@ -224,12 +319,21 @@ class Parser:
             return self.print_stmt()
         if self.match(RETURN):
             return self.return_stmt()
+        if self.match(YIELD):
+            return self.yield_stmt()
         if self.match(WHILE):
             return self.while_stmt(in_loop=in_loop)
         if self.match(BREAK):
             return self.break_stmt(in_loop=in_loop)
         if self.match(LEFT_BRACE):
-            return Stmt.Block( self.block(in_loop=in_loop) )
+            scoped = self.resolver and self.block_declares(self.current - 1)
+            if scoped : self.resolver.beginScope()
+            statements = self.block(in_loop=in_loop)
+            a_block = Stmt.Block( statements )
+            if self.resolver :
+                if scoped : self.resolving(self.resolver.endScope)
+                else : self.depths.resolve(a_block, 0)
+            return a_block
         # None of the above, assume expression statement
         return self.expr_stmt()
     '''
@@ -247,23 +351,55 @@ class Parser:
     '''
     def class_decl(self):
         name = self.consume(IDENTIFIER, "Expect class name.")
+        resolver = self.resolver # for one_pass, as in Resolver.visitClass
+        if resolver :
+            enclosing_class_type = resolver.current_class
+            resolver.current_class = ClassType.CLASS
+            self.resolving(resolver.declare, name)
+            resolver.define(name)
         superclass = None
         if self.match(LESS) :
             self.consume(IDENTIFIER, "Expect superclass name.")
             superclass = Expr.Variable(self.previous())
+            if self.resolver :
+                if name.lexeme == superclass.name.lexeme :
+                    self.resolver = None # inherits from itself
+                else:
+                    resolver.current_class = ClassType.SUBCLASS
+                    self.resolving(resolver.visitVariable, superclass)
+                    resolver.beginScope()
+                    resolver.scopes[-1]["super"] = True
         self.consume(LEFT_BRACE, "Expect '{' before class body.")
+        if self.resolver :
+            resolver.beginScope()
+            resolver.scopes[-1]["this"] = True
         methods = []
         while (not self.isAtEnd()) and (not self.check(RIGHT_BRACE)):
             methods.append( self.function("method") )
         self.consume(RIGHT_BRACE, "Expect '}' to close class declaration.")
+        if self.resolver :
+            self.resolving(resolver.endScope)
+            if superclass and self.resolver :
+                self.resolving(resolver.endScope)
+            resolver.current_class = enclosing_class_type
         return Stmt.Class(name,methods,superclass)
 
     '''
     SD1. Process a function declaration. Depending on context the
          expected var is either "function" or "method".
+
+         A function whose own body (not that of a function inside it)
+         contains a yield statement is a generator; see Generators.py.
+
+         For one_pass, do what Resolver.visitFunction and resolveFunDecl
+         do, except that a return with a value is only noted, not checked,
+         until we know whether this is a generator.
     '''
     def function(self, expected:str)->Stmt.Function:
         name = self.consume(IDENTIFIER, f"Expect {expected} name")
+        if self.resolver and expected == "function" :
+            self.resolving(self.resolver.declare, name)
+            self.resolver.define(name)
         self.consume(LEFT_PAREN, f"Expect '(' after {expected} name")
         parameters = []
         while not self.check(RIGHT_PAREN):
@@ -280,17 +416,45 @@ class Parser:
         self.consume(RIGHT_PAREN,"Expect ')' to close parameter list")
         self.consume(LEFT_BRACE,
                      f"Expect block statement as {expected} body" )
-        body = self.block() # block and not in a loop
-        return Stmt.Function(name,parameters,body)
+        resolver = self.resolver
+        if resolver :
+            funtype = FunctionType.FUNCTION
+            if expected == "method":
+                funtype = FunctionType.INITIALIZER if name.lexeme == LoxClass.Init \
+                          else FunctionType.METHOD
+            enclosing_fun_type = resolver.current_function
+            resolver.current_function = funtype
+            resolver.beginFunction(expected == "method")
+            resolver.beginScope()
+            for param in parameters:
+                resolver.define(param)
+        self.function_yields.append(False)
+        self.function_returns.append(False)
+        try:
+            body = self.block() # block and not in a loop
+        finally:
+            generator = self.function_yields.pop()
+            returns_value = self.function_returns.pop()
+        function = Stmt.Function(name,parameters,body,generator)
+        if self.resolver :
+            if generator and (returns_value or funtype == FunctionType.INITIALIZER):
+                self.resolver = None # see "Resolving in the same pass" above
+            else:
+                self.resolving(resolver.endScope)
+                resolver.endFunction(function)
+                resolver.current_function = enclosing_fun_type
+        return function
 
     '''
     SD2. Var statement. Doesn't nest, so doesn't care about in_loop.
     '''
     def var_stmt(self) -> Stmt.Var:
         name = self.consume(IDENTIFIER, "Expect variable name.")
+        if self.resolver : self.resolving(self.resolver.declare, name)
         initializer = None
         if self.match(EQUAL):
             initializer = self.expression()
+        if self.resolver : self.resolver.define(name)
         self.consume(SEMICOLON, "Expect ';' after variable declaration.")
         return Stmt.Var(name, initializer)
     '''
@@ -301,6 +465,12 @@ class Parser:
     we construct:
          { init; while (test) {body; post;} }
     Okayyyy but I think there will be problems with error messages...
+
+    For one_pass, the outer block's scope is opened before the init, when
+    that is a var; otherwise the block declares nothing, and like the
+    block around body and post (the body is a statement, never a
+    declaration) gets no scope, but depth 0, see "Blocks that declare
+    nothing" in Resolver.py.
     '''
     def for_stmt(self, in_loop=False)->Stmt.Block:
         ''' at this point we have matched FOR, check ( '''
@@ -315,6 +485,7 @@ class Parser:
         init_Stmt = None
         if not self.match(SEMICOLON): # match() consumes a naked ';'
             if self.match(VAR):
+                if self.resolver : self.resolver.beginScope()
                 init_Stmt = self.var_stmt() # consumes the ';'
             else:
                 init_Stmt = self.expr_stmt() # also consumes ';'
@@ -338,6 +509,8 @@ class Parser:
         a block but who knows?) which is definitely in a loop.
         '''
         body_Stmt = self.statement(in_loop=True)
+        if isinstance(init_Stmt, Stmt.Var) and self.resolver :
+            self.resolving(self.resolver.endScope)
         '''
         put it all together in a single statement. I coded this before seeing
         what Nystrom does, and his was better so I changed it. I was always
@@ -352,11 +525,14 @@ class Parser:
         loop_body = body_Stmt
         if post_Expr : # is given, make loop body a block
             loop_body = Stmt.Block( [body_Stmt, Stmt.Expression(post_Expr)] )
+            if self.resolver : self.depths.resolve(loop_body, 0)
         ''' the loop is that body, conditioned by the test expression '''
         loop_Stmt = Stmt.While(test_Expr,loop_body)
         ''' if there is an initializer, we need to put the loop in a block '''
         if init_Stmt:
             loop_Stmt = Stmt.Block( [init_Stmt,loop_Stmt] )
+            if self.resolver and not isinstance(init_Stmt, Stmt.Var) :
+                self.depths.resolve(loop_Stmt, 0)
         return loop_Stmt
 
     '''
@@ -390,9 +566,31 @@ class Parser:
         value = None # default return value
         if not self.check(SEMICOLON):
             value = self.expression()
+        if self.resolver : # for one_pass, see function()
+            function_type = self.resolver.current_function
+            if function_type == FunctionType.NOFUN or \
+               (value and function_type == FunctionType.INITIALIZER) :
+                self.resolver = None
+            elif value :
+                self.function_returns[-1] = True
         self.consume(SEMICOLON,"Expect semicolon after 'return'")
         return Stmt.Return(keyword, value)
 
+    '''
+    SSy. Yield statement, like return, but syntax error if not in a function,
+         and it marks the function it is in as a generator.
+    '''
+    def yield_stmt(self)->Stmt.Yield:
+        keyword = self.previous()
+        if not self.function_yields:
+            self.error(keyword,"Yield statement only allowed within a function.")
+        self.function_yields[-1] = True
+        value = None
+        if not self.check(SEMICOLON):
+            value = self.expression()
+        self.consume(SEMICOLON,"Expect semicolon after 'yield'")
+        return Stmt.Yield(keyword, value)
+
     '''
     SS3. While statement.
     '''
@@ -483,7 +681,10 @@ class Parser:
         Now ask, We have something =, but is it variable = or property?
         '''
         if isinstance(possible_lhs, Expr.Variable):
-            return Expr.Assign(possible_lhs.name, rhs)
+            assign = Expr.Assign(possible_lhs.name, rhs)
+            if self.resolver : # for one_pass; see primary()
+                self.resolver.resolveLocal(assign, assign.name)
+            return assign
         if isinstance(possible_lhs, Expr.Get):
             return Expr.Set(possible_lhs.object, possible_lhs.name, rhs)
         '''
@@ -612,18 +813,23 @@ class Parser:
     def primary(self)->Expr.Expr:
         if self.match(IDENTIFIER):
             # IDENTIFIER token contains a word, make it into an Expr
-            return Expr.Variable(self.previous())
+            return self.variable(self.previous())
         # handle the keyword values
         if self.match(FALSE): return Expr.Literal(False)
         if self.match(TRUE):  return Expr.Literal(True)
         if self.match(NIL):   return Expr.Literal(None)
-        if self.match(THIS):  return Expr.This(self.previous())
+        if self.match(THIS):
+            this = Expr.This(self.previous())
+            if self.resolver : self.resolving(self.resolver.visitThis, this)
+            return this
         if self.match(SUPER):
             keyword = self.previous() # save "super" token
             self.consume(DOT, "Expect '.' after 'super'")
             method_name = self.consume(IDENTIFIER,
                             "Expect superclass method name.")
-            return Expr.Super(keyword,method_name)
+            super_expr = Expr.Super(keyword,method_name)
+            if self.resolver : self.resolving(self.resolver.visitSuper, super_expr)
+            return super_expr
         # handle literal values
         if self.match(NUMBER,STRING):
             return Expr.Literal(self.previous().literal)
@@ -669,3 +875,16 @@ class Parser:
         Finally we just don't know what's going on.
         '''
         self.error(bad_token,'Unanticipated input')
+
+    '''
+    E9. A reference to a variable, the name just consumed. For one_pass,
+        resolve it now, unless it is an assignment target, see assignment().
+    '''
+    def variable(self, name:Token)->Expr.Variable:
+        variable = Expr.Variable(name)
+        if self.resolver and self.tokens[self.current].type != EQUAL:
+            try: # as resolving() does, without the extra call
+                self.resolver.visitVariable(variable)
+            except Resolver.ResolutionError:
+                self.resolver = None
+        return variable
@@ -0,0 +1,139 @@
+'''
+
+# PrattParser: the Parser, with expressions parsed by precedence climbing
+
+Not in the book (though the book's second half, clox, does the same thing
+in C, see its chapter 17). The Parser takes an expression down a ladder
+of methods, one per level of precedence,
+
+    assignment, logic_or, logic_and, equality, comparison,
+    addition, multiplication, unary, call, primary
+
+and each rung calls the next and then calls match() with its operators.
+So the simplest expression, a lone number or name, costs eight method
+calls and some twenty calls of match(), check(), isAtEnd() and peek()
+before primary() finds it, and an operand in a long expression pays that
+again. In expression-dense code that is most of the parse time.
+
+A PrattParser is a Parser with the middle of that ladder, logic_or down
+to multiplication, replaced by one method, climb(), driven by a table,
+INFIX, of the binary operators keyed by token type: its precedence, and
+the kind of Expr it makes. climb() takes an operand, then as long as the
+next token is an operator binding at least as tightly as it was asked
+for, takes the operator, and the right operand by climbing one level
+higher, so all the binary operators are left-associative, as they are in
+the Parser. unary(), call() and primary() look at token types directly
+rather than through match(), and primary() finds the common cases, names
+and literals, in a second table, PREFIX, leaving the rest to the
+Parser's own primary().
+
+The result is the same tree, node for node, and the same error messages,
+at the same tokens: everything outside the expression ladder, all the
+statements, assignment (with its "Invalid target" check), finish_call,
+the "operator requires a left operand" check, and the one_pass resolving
+hooks, is the Parser's, inherited. plox --pratt uses it; so does
+benchmarks/pratt.py, which times the two and checks their trees match.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+from __future__ import annotations # no annotation is evaluated
+from TokenType import * # all the names of lexemes
+from Token import Token
+import Expr
+from Parser import Parser
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, Mapping, Tuple
+
+'''
+The binary operators: token type -> (precedence, Expr class). A bigger
+number binds more tightly. These are the rungs of the Parser's ladder,
+logic_or at the bottom to multiplication at the top.
+'''
+INFIX = {
+    OR:            (1, Expr.Logical),
+    AND:           (2, Expr.Logical),
+    BANG_EQUAL:    (3, Expr.Binary),
+    EQUAL_EQUAL:   (3, Expr.Binary),
+    GREATER:       (4, Expr.Binary),
+    GREATER_EQUAL: (4, Expr.Binary),
+    LESS:          (4, Expr.Binary),
+    LESS_EQUAL:    (4, Expr.Binary),
+    MINUS:         (5, Expr.Binary),
+    PLUS:          (5, Expr.Binary),
+    SLASH:         (6, Expr.Binary),
+    STAR:          (6, Expr.Binary),
+} # type: Mapping[int,Tuple[int,type]]
+
+'''
+The tokens that are an operand by themselves: token type -> a function
+of the parser and the token, which has been consumed, giving the Expr.
+Anything else goes to Parser.primary.
+'''
+PREFIX = {
+    IDENTIFIER: lambda parser, token: parser.variable(token),
+    NUMBER:     lambda parser, token: Expr.Literal(token.literal),
+    STRING:     lambda parser, token: Expr.Literal(token.literal),
+    TRUE:       lambda parser, token: Expr.Literal(True),
+    FALSE:      lambda parser, token: Expr.Literal(False),
+    NIL:        lambda parser, token: Expr.Literal(None),
+} # type: Mapping[int,Callable[[Parser,Token],Expr.Expr]]
+
+class PrattParser(Parser):
+
+    '''
+    assignment() is the Parser's, which calls this for its possible lhs.
+    '''
+    def logic_or(self)->Expr.Expr:
+        return self.climb(1)
+
+    '''
+    An expression of operators of precedence min_prec and up. There is
+    always an EOF token at the end of the list, which is in neither table,
+    so there is no need for isAtEnd() here.
+    '''
+    def climb(self, min_prec:int)->Expr.Expr:
+        result = self.unary()
+        tokens = self.tokens
+        while True:
+            operator = tokens[self.current]
+            entry = INFIX.get(operator.type)
+            if entry is None or entry[0] < min_prec:
+                return result
+            self.current += 1
+            rhs = self.climb(entry[0] + 1)
+            result = entry[1](result, operator, rhs)
+
+    def unary(self)->Expr.Expr:
+        operator = self.tokens[self.current]
+        if operator.type == BANG or operator.type == MINUS:
+            self.current += 1
+            return Expr.Unary(operator, self.unary())
+        return self.call()
+
+    def call(self)->Expr.Expr:
+        an_expr = self.primary()
+        tokens = self.tokens
+        while True:
+            ttype = tokens[self.current].type
+            if ttype == LEFT_PAREN:
+                self.current += 1
+                an_expr = self.finish_call(an_expr)
+            elif ttype == DOT:
+                self.current += 1
+                name = self.consume(IDENTIFIER,
+                            "Expect property name after '.'")
+                an_expr = Expr.Get(an_expr,name)
+            else:
+                return an_expr
+
+    def primary(self)->Expr.Expr:
+        token = self.tokens[self.current]
+        prefix = PREFIX.get(token.type)
+        if prefix is None:
+            return Parser.primary(self) # this, super, groups, and errors
+        self.current += 1
+        return prefix(self, token)
@@ -0,0 +1,195 @@
+'''
+
+# ProgramCache: keep compiled Lox programs on disk
+
+Not in the book. Every run of a script re-runs Scanner.scanTokens,
+Parser.parse and Resolver.resolve (and now the Optimizer too), even when
+the script hasn't changed since the last run. For our big generated
+scripts that front end costs more than running the program does. So, the
+way Python keeps .pyc files in __pycache__, plox keeps the compiled form
+of each script in a __ploxcache__ directory beside it, and the next run
+loads that instead of compiling again.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## What is stored
+
+The compiled form of a program is its list of Stmt objects, as prepared
+for execution, plus the resolution data the Resolver made for it: the
+map from Expr objects to their depths (see Resolver.Depths), which the
+Interpreter uses as its "locals". Both go into a single pickle. That
+matters: the keys of the depths map are the very Expr objects in the
+tree, and pickle keeps track of object identity within one dump, so when
+they are loaded the keys of the loaded map are the objects in the loaded
+tree. A pickle is also about as compact a form of a
+tree of small objects as Python offers, and loading it is much faster
+than scanning, parsing and resolving.
+
+## When it is valid
+
+A cache file is named for the script and a key. The key is a hash of the
+source text and the variant (see below) together with a fingerprint of
+the interpreter: the size and
+modification time of each module whose classes or behavior shape the
+compiled form (change the Parser and every cache entry is stale), plus the
+Python version and the pickle protocol. If the key of the file doesn't
+match, it is simply not found. When a new entry is stored, older entries
+for the same script are deleted.
+
+The key is also written at the front of the file, and checked on loading,
+so a file that was truncated or renamed is treated as a miss. Any failure
+at all while loading is a miss; the program is then compiled normally and
+the entry rewritten.
+
+The same source compiled differently, as with plox --int, where whole
+number literals are ints, is a different program. Each such way is a
+variant, named by a short string, and a variant's entries are named for
+the script and the variant, so that they don't count as stale entries
+of the plain program, or it of them: running a script both ways keeps
+an entry for each.
+
+Note that loading a pickle can execute arbitrary code, so the cache is only
+as trustworthy as whoever can write the __ploxcache__ directory; the same
+is true of __pycache__.
+
+## Atomic writes
+
+Two plox processes might be compiling the same script at once. Each
+writes its entry to a temporary file in the cache directory and then
+renames it into place with os.replace, which is atomic. A reader sees
+either the old file, the new one or none, never half of one. If the
+directory can't be created or written, caching is silently skipped.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import os
+import sys
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List, Mapping, Optional, Tuple
+
+import Stmt
+
+CACHE_DIR = '__ploxcache__'
+SUFFIX = '.plc'
+MAGIC = b'PLOXCACHE\n'
+
+'''
+The modules whose code determines what a compiled program looks like.
+They are all in the same folder as this one.
+'''
+FRONT_END_MODULES = ('Token', 'TokenType', 'Scanner', 'Parser', 'Expr',
+                     'Stmt', 'Resolver', 'Interpreter', 'Optimizer',
+                     'ProgramCache')
+
+'''
+Using the cache means importing pickle and hashlib, which (with what
+they import) takes longer than compiling a few thousand characters of Lox.
+So plox doesn't bother with the cache for scripts shorter than this, and
+those modules are imported only in the functions that use them, so that
+asking worth_caching() costs nothing.
+'''
+MIN_CACHED_SOURCE = 4096
+
+def worth_caching(source:str)->bool:
+    return len(source) >= MIN_CACHED_SOURCE
+
+_fingerprints = dict() # computed on first use, per tuple of module names
+
+def interpreter_fingerprint(modules:Tuple[str,...]=FRONT_END_MODULES)->bytes:
+    if modules not in _fingerprints:
+        import pickle
+        folder = os.path.dirname(os.path.abspath(__file__))
+        parts = [sys.version.encode(), str(pickle.HIGHEST_PROTOCOL).encode()]
+        for name in modules:
+            path = os.path.join(folder, name + '.py')
+            if os.path.exists(path) :
+                stat = os.stat(path)
+                parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        _fingerprints[modules] = b'\n'.join(parts)
+    return _fingerprints[modules]
+
+class ProgramCache():
+    '''
+    A cache for the single script file at script_path, compiled in the
+    given variant, if any. It is cheap to make one; nothing happens on disk
+    until load() or store().
+    '''
+    def __init__(self, script_path:str, variant:str=None):
+        folder, name = os.path.split(os.path.abspath(script_path))
+        self.directory = os.path.join(folder, CACHE_DIR)
+        self.variant = variant or ''
+        self.stem = f"{name}.{variant}" if variant else name
+
+    '''
+    The key for a given source text, as a hex string.
+    '''
+    def key(self, source:str)->str:
+        import hashlib
+        digest = hashlib.sha256(interpreter_fingerprint())
+        digest.update(self.variant.encode() + b'\n')
+        digest.update(source.encode('utf_8'))
+        return digest.hexdigest()
+
+    def entry_path(self, key:str)->str:
+        return os.path.join(self.directory, f"{self.stem}.{key[:32]}{SUFFIX}")
+
+    '''
+    Return the cached program for this source text, having put its
+    resolution data into the interpreter; or None if there is no valid
+    entry.
+    '''
+    def load(self, source:str, interpreter)->Optional[List[Stmt.Stmt]]:
+        import pickle
+        key = self.key(source)
+        try:
+            with open(self.entry_path(key), 'rb') as f:
+                if f.readline() != MAGIC or f.readline() != key.encode()+b'\n':
+                    return None
+                program, depths = pickle.load(f)
+        except Exception: # missing, unreadable, or garbage: just a miss
+            return None
+        interpreter.locals.update(depths)
+        return program
+
+    '''
+    Save a compiled program and its resolution data (see Resolver.Depths)
+    for this source. Then remove any other entries for the same script,
+    which must be stale.
+    '''
+    def store(self, source:str, program:List[Stmt.Stmt], depths:Mapping):
+        import pickle, tempfile
+        key = self.key(source)
+        target = self.entry_path(key)
+        temp_path = None
+        try:
+            data = pickle.dumps((program, dict(depths)),
+                                protocol=pickle.HIGHEST_PROTOCOL)
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(key.encode()+b'\n')
+                f.write(data)
+            os.replace(temp_path, target)
+            temp_path = None
+        except Exception: # e.g. read-only directory, or a tree too deep to pickle
+            return
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.unlink(temp_path)
+        self.remove_stale(target)
+
+    def remove_stale(self, keep:str):
+        prefix = self.stem + '.'
+        try:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith(prefix) and name.endswith(SUFFIX) \
+                   and len(name) == len(prefix) + 32 + len(SUFFIX) \
+                   and path != keep:
+                    os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,170 @@
+'''
+
+# ReplSession: the state of one interactive plox session
+
+Not in the book, which runs each line typed at the prompt through the same
+run() as a whole file. plox.run_prompt used to do the same thing, calling
+run_lox for every line, which made a new Scanner, Parser and Resolver each
+time; and as its docstring admitted, the Interpreter's locals map, which
+gets an entry for every local variable reference in every line, grew for
+as long as the session lasted.
+
+That was fine for a person typing, but we also drive the prompt from
+scripts, for hours. So the session is now an object that holds what must
+last from one entry to the next, and nothing else:
+
+* One Interpreter, whose global environment holds the user's variables,
+  functions and classes.
+* One Resolver. Between entries it is always at the top level with no
+  open scopes (globals aren't tracked by the Resolver), but there is no
+  reason to make a new one each time, and Resolver.resolve resets it
+  after an error.
+* The Interpreter's locals, made a weakref.WeakKeyDictionary instead of
+  a dict. Its keys are Expr objects. Once an entry has executed, nothing
+  refers to its statements any more unless it declared a function or class
+  that is still reachable from the globals, whose body holds on to its
+  Exprs. When the statements go, their entries in locals go with them
+  automatically. Declare fun f() a thousand times and the locals hold the
+  entries of one f, the current one. The same goes for the sites of the
+  globals, where each reference to a global is bound to its Cell (see
+  "Global cells" in Environment.py).
+
+So memory stays flat over a long session, and each entry costs the same
+however many came before it.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## Multi-line input
+
+An entry isn't complete while it has an open brace or parenthesis, or an
+open string, so a function or class can be typed over several lines. The
+feed() method takes one line at a time and returns False while it is still
+waiting for more, so the caller can show a continuation prompt. Counting
+the brackets means skipping over strings and // comments, which is done
+by a little scan of its own; an entry with more closers than openers is
+complete (and wrong, which the Parser will say).
+
+As before, an entry that doesn't end with ; or } is given a ; so that the
+user can type a bare expression and see its value.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import weakref
+
+from Scanner import Scanner
+from Parser import Parser
+import Stmt
+from Interpreter import Interpreter
+from Resolver import Resolver
+from Optimizer import Optimizer
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, List
+    from Token import Token
+
+'''
+Count the open brackets in some Lox text. Return how many braces and
+parentheses are still open, or if a string is still open, 1.
+'''
+def open_brackets(text:str)->int:
+    depth = 0
+    index = 0
+    length = len(text)
+    while index < length:
+        c = text[index]
+        if c == '"':
+            close = text.find('"', index+1)
+            if close < 0 : return 1 # open string, keep reading
+            index = close
+        elif c == '/' and text.startswith('//', index):
+            newline = text.find('\n', index)
+            if newline < 0 : break # comment to end of text
+            index = newline
+        elif c in '({':
+            depth += 1
+        elif c in ')}':
+            depth -= 1
+        index += 1
+    return depth
+
+class ReplSession():
+    '''
+    The error functions are those of plox: lex_error for the Scanner, and
+    parse_error for the others. The show function is called with the value
+    of an entry that is a single expression.
+
+    had_error is set when any error is reported for the current entry.
+    int_numbers is plox --int, see Scanner.number_lit.
+    '''
+    def __init__(self,
+                 lex_error:Callable[[int,str],None],
+                 parse_error:Callable[[Token,str],None],
+                 show:Callable[[object],None],
+                 int_numbers:bool=False):
+        self.lex_error = lex_error
+        self.int_numbers = int_numbers
+        self.parse_error = parse_error
+        self.show = show
+        self.had_error = False
+        self.interpreter = Interpreter(self.report_parse,
+                                       locals_map=weakref.WeakKeyDictionary())
+        self.interpreter.globals.sites = weakref.WeakKeyDictionary()
+        self.resolver = Resolver(self.interpreter, self.report_parse)
+        self.pending = list() # lines of an incomplete entry
+
+    '''
+    Wrap the given error functions, to note that there was an error.
+    '''
+    def report_lex(self, line:int, message:str, where:int=None):
+        self.had_error = True
+        self.lex_error(line, message, where)
+
+    def report_parse(self, token:Token, message:str):
+        self.had_error = True
+        self.parse_error(token, message)
+
+    '''
+    Take one line of input. If it completes an entry, run the entry and
+    return True; otherwise keep it and return False.
+    '''
+    def feed(self, line:str)->bool:
+        self.pending.append(line)
+        entry = '\n'.join(self.pending)
+        if open_brackets(entry) > 0:
+            return False
+        self.pending.clear()
+        self.run_entry(entry)
+        return True
+
+    def waiting(self)->bool:
+        return len(self.pending) > 0
+
+    '''
+    Forget a partly typed entry, e.g. on ^c at the continuation prompt.
+    '''
+    def cancel(self):
+        self.pending.clear()
+
+    '''
+    Scan, parse, resolve and execute one complete entry.
+    '''
+    def run_entry(self, entry:str):
+        self.had_error = False
+        entry = entry.strip()
+        if not entry : return
+        if not entry.endswith(';') and not entry.endswith('}'):
+            entry += ';'
+        tokens = Scanner(entry, self.report_lex, self.int_numbers).scanTokens()
+        if self.had_error : return
+        program = Parser(tokens, self.report_parse).parse()
+        if self.had_error or 0 == len(program) : return
+        self.resolver.resolve(program)
+        if self.had_error : return
+        if 1 == len(program) and isinstance(program[0], Stmt.Expression):
+            value = self.interpreter.one_line_program(program)
+            if not self.had_error :
+                self.show(value)
+        else:
+            self.interpreter.interpret(Optimizer().optimize(program))
@@ -19,6 +19,13 @@ parsed statements, where it could be used along with them, for example as
 input to a byte-code or other translator, or for repeated execution. But it
 isn't my book...
 
+Later: and then we did want repeated execution, of one program on many
+threads at once (see LoxProgram.py). So the Resolver will now poke its
+data into anything with a resolve(reference, depth) method, and in
+particular into a Depths, below, which holds just that data and nothing
+else; it goes with the statements, and any number of Interpreters can
+share it, read-only, as their locals.
+
 The Resolver also catches and diagnoses a few errors that the Parser could
 not. To do this, it defines its own exception, similar to those of the Parser
 and Interpreter, and on catching it, calls an error reporting function
@@ -28,30 +35,90 @@ This work is licensed under a
   Creative Commons Attribution-NonCommercial 4.0 International License
   see http://creativecommons.org/licenses/by-nc/4.0/
 
+## Free variables
+
+Not in the book. A function no longer keeps the whole Environment it was
+declared in, only its free variables, in a Closure (see "Flat closures"
+in Environment.py). So the Resolver finds those: a reference from inside
+a function to a local declared outside it is to a free variable of that
+function, and of every function in between, which must pass it on. The
+depths given for such a reference don't count the scopes outside the
+function, which are not there at run time: they lead to the function's
+Closure, one level beyond its own scope (two for a method, whose "this"
+scope, made by LoxFunction.bind, is in between).
+
+For each function with free variables, the Resolver gives the Interpreter
+(or the Depths) the Stmt.Function with a tuple of (name, depth) pairs,
+one per free variable, the depth counting from the scope the function is
+declared in, where the Interpreter looks for the variable to capture.
+
+## Blocks that declare nothing
+
+Not in the book. Executing a block made a new Environment for its scope,
+every time, though most blocks declare nothing: the body of a loop or an
+if, and the block a for makes of its body and increment, which runs on
+every iteration. So now a block whose statements include no var, fun or
+class gets no scope here, and the depths of the references in it count
+one level fewer. The Resolver gives the Interpreter the Stmt.Block with
+depth 0, meaning its scope is the one it is in, and the Interpreter runs
+it in the current Environment (see execute_flat in Interpreter.py).
 '''
+from __future__ import annotations # no annotation is evaluated
 from GenericVisitor import GenericVisitor
-from Interpreter import Interpreter
-from typing import List, Mapping, Callable
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List, Mapping, Callable, Optional, Tuple
+    from Interpreter import Interpreter
+    from typing import Union
 import Expr
 import Stmt
 import Token
 from TokenType import *
-from enum import Enum
 from LoxCallable import LoxClass
 '''
 Per section 11.5.1, create an enum for the type of function
 at this point in the tree walk.
+
+These were Enum classes, but importing enum costs more start-up time than
+a one-line script takes to run (see plox.py), and nothing here needs more
+of an enum than distinct names compared with ==. So, like TokenType, they
+are plain int constants, gathered in classes for the sake of the names.
 '''
-class FunctionType(Enum):
+class FunctionType():
     NOFUN = 0 # not "NONE" -- too many uses of that word
     FUNCTION = 1
     METHOD = 2
     INITIALIZER = 3
-class ClassType(Enum):
+    GENERATOR = 4 # a function or method with a yield, see Generators.py
+class ClassType():
     NOCLASS = 0 # again, not "NONE" in a Python context
     CLASS = 1
     SUBCLASS = 2
 
+'''
+The resolution data of one program, apart from any Interpreter: a dict
+of Expr (each Variable, Assign, This and Super that refers to a local) to
+its depth, of each Stmt.Function with free variables to those (see
+"Free variables" above), and of each Stmt.Block that declares nothing to
+0 (see "Blocks that declare nothing"). Give it to the Resolver in place of an Interpreter, then to
+each Interpreter that runs the program, as the locals_map argument.
+'''
+class Depths(dict):
+    def resolve(self, reference:Expr.Expr, depth:int):
+        self[reference] = depth
+
+'''
+Whether a block of these statements declares anything in its scope. A
+Memoize placed by the Optimizer is looked into, should an optimized
+program be resolved again.
+'''
+def declares(statements:List[Stmt.Stmt])->bool:
+    for statement in statements:
+        while isinstance(statement, Stmt.Memoize):
+            statement = statement.body
+        if isinstance(statement, (Stmt.Var, Stmt.Function, Stmt.Class)):
+            return True
+    return False
 
 class Resolver(GenericVisitor):
 
@@ -69,12 +136,20 @@ class Resolver(GenericVisitor):
     Initialize this resolver.
     '''
 
-    def __init__(self, interpreter:Interpreter, error_report:Callable[[Token.Token,str],None]):
+    def __init__(self, interpreter:Union[Interpreter,Depths],
+                 error_report:Callable[[Token.Token,str],None]):
         self.interpreter = interpreter
         self.error_report = error_report
         self.current_function = FunctionType.NOFUN
         self.current_class = ClassType.NOCLASS
         self.scopes = list() # List[Mapping[str,bool]]
+        '''
+        One per function being resolved, innermost last: the index in
+        scopes of the first scope that exists at run time inside it (its
+        own, or for a method its "this" scope), and its free variables,
+        each with its depth from where the function is declared.
+        '''
+        self.functions = list() # List[Tuple[int,Mapping[str,int]]]
 
     '''
     Initiate a scope (a dict mapping names to usage) by pushing a new
@@ -112,11 +187,19 @@ class Resolver(GenericVisitor):
 
     That may turn out to be a mistake, if it turns out that in some
     later chapter he will call those methods from outside the class.
+
+    An error can leave us partway into nested scopes, functions and
+    classes. Reset all that, so that the same Resolver can be used again
+    on the next program, as the interactive session does.
     '''
     def resolve(self, statements:List[Stmt.Stmt]):
         try:
             self.resolve_statements(statements)
         except Resolver.ResolutionError as RE:
+            self.scopes.clear()
+            self.functions.clear()
+            self.current_function = FunctionType.NOFUN
+            self.current_class = ClassType.NOCLASS
             self.error_report(RE.token,RE.message)
             return
     '''
@@ -161,8 +244,13 @@ class Resolver(GenericVisitor):
 
     Visit a block, which contains a list of statements, and when executed,
     establishes a scope. Create a new scope, then visit each statement.
+    Unless it declares nothing, see "Blocks that declare nothing" above.
     '''
     def visitBlock(self, client:Stmt.Block):
+        if not declares(client.statements):
+            self.interpreter.resolve(client, 0)
+            self.resolve_statements(client.statements)
+            return
         self.beginScope()
         self.resolve_statements(client.statements)
         self.endScope()
@@ -185,23 +273,56 @@ class Resolver(GenericVisitor):
         self.resolveLocal( client, client.name )
     '''
     Resolve a variable's scope-depth and tell the interpreter about it. Note
-    that it is not necessary here to check for an empty scopes stack.
-    "list(range(len([])))" is an empty list, hence the for loop is null when
-    the scopes are empty.
+    that it is not necessary here to check for an empty scopes stack: the
+    for loop is null when the scopes are empty.
+
+    This used to loop over list(reversed(range(len(self.scopes)))), making
+    a list as long as the nesting for every single reference. Walking
+    reversed(self.scopes), innermost first, counts the depth as it goes
+    and makes nothing.
 
     The expr argument is Expr.Variable when called from visitVariable,
     Expr.Assign when called from visitAssign.
 
     Set the value of the name in the scope dict to -1, indicating it has
     been referenced or assigned in that scope (Chapter 11 challenge 3)
+
+    A local declared outside the function we are in is a free variable of
+    it, see capture().
     '''
     def resolveLocal(self, expr:Expr.Expr, name:Token.Token):
-        for index in list(reversed(range(len(self.scopes)))):
-            if name.lexeme in self.scopes[index]:
-                self.interpreter.resolve(expr, len(self.scopes)-1-index)
-                self.scopes[index][name.lexeme] = -1 # not a line number
-                return
-        # apparently it's a global?
+        depth = self.locate(name.lexeme)
+        if depth is not None:
+            self.interpreter.resolve(expr, depth)
+        # else apparently it's a global?
+
+    def locate(self, lexeme:str)->Optional[int]:
+        scopes = self.scopes
+        for (depth, scope) in enumerate(reversed(scopes)):
+            if lexeme in scope:
+                scope[lexeme] = -1 # not a line number
+                index = len(scopes) - 1 - depth
+                functions = self.functions
+                if functions and functions[-1][0] > index:
+                    return self.capture(lexeme, index, len(functions) - 1, len(scopes) - 1)
+                return depth
+        return None
+    '''
+    The variable lexeme, declared in scopes[index], is used in scopes[top],
+    inside functions[level], which it is declared outside of. Make it a
+    free variable of that function, and so of any functions around it
+    that it is also declared outside of; return the depth of the
+    function's Closure, seen from scopes[top].
+    '''
+    def capture(self, lexeme:str, index:int, level:int, top:int)->int:
+        (first, free) = self.functions[level]
+        if lexeme not in free:
+            declared_in = first - 1 # the scope the function is declared in
+            if level > 0 and self.functions[level-1][0] > index:
+                free[lexeme] = self.capture(lexeme, index, level-1, declared_in)
+            else:
+                free[lexeme] = declared_in - index
+        return top - first + 1
     '''
     Visit a class declaration. At this point (section 12.1) we do little,
     just define the name for reference (it is allowed to be local). As of
@@ -255,17 +376,41 @@ class Resolver(GenericVisitor):
     Open a new scope and define all the parameter names in it. Then
     recurse to visit the statements of the body. Set the fact that we
     are in a function of some kind, so as to permit return statements.
+
+    The Parser has marked a function with a yield as a generator. An
+    initializer can't be one, since calling it must make the instance.
     '''
     def resolveFunDecl(self, client:Stmt.Function, funtype:FunctionType):
+        method = funtype in (FunctionType.METHOD, FunctionType.INITIALIZER)
+        if client.generator :
+            if funtype == FunctionType.INITIALIZER:
+                raise Resolver.ResolutionError(client.name,
+                    "An initializer cannot yield." )
+            funtype = FunctionType.GENERATOR
         enclosing_fun_type = self.current_function
         self.current_function = funtype
+        self.beginFunction(method)
         self.beginScope()
         for param in client.params:
             self.define(param)
         self.resolve_statements(client.body)
         self.endScope()
+        self.endFunction(client)
         self.current_function = enclosing_fun_type
     '''
+    Around the scope of a function: note where it begins, and at the end,
+    give the function's free variables, if any, to the interpreter. See
+    "Free variables" above.
+    '''
+    def beginFunction(self, method:bool):
+        first = len(self.scopes) - 1 if method else len(self.scopes)
+        self.functions.append((first, dict()))
+
+    def endFunction(self, client:Stmt.Function):
+        (first, free) = self.functions.pop()
+        if free :
+            self.interpreter.resolve(client, tuple(free.items()))
+    '''
     Visit the test-expression and the statements in the branches of an if.
     '''
     def visitIf(self, client:Stmt.If):
@@ -285,8 +430,9 @@ class Resolver(GenericVisitor):
     def visitExpression(self, client:Stmt.Expression):
         client.expression.accept(self)
     '''
-    Visit the expressions that are arguments of print and return.
-    Diagnose the error of return in top-level code.
+    Visit the expressions that are arguments of print, return and yield.
+    Diagnose the error of return in top-level code, and of return with a
+    value from a generator, whose values are the ones it yields.
     '''
     def visitPrint(self, client:Stmt.Print):
         client.expression.accept(self)
@@ -299,8 +445,16 @@ class Resolver(GenericVisitor):
             if client.value : # is not None, e.g. an Expr of some kind,
                 raise Resolver.ResolutionError(client.keyword,
                     "Cannot return an explicit value from an initializer." )
+        if self.current_function == FunctionType.GENERATOR:
+            if client.value : # is not None
+                raise Resolver.ResolutionError(client.keyword,
+                    "Cannot return a value from a generator." )
         if client.value : # is not None, as in "return ;"
             client.value.accept(self)
+
+    def visitYield(self, client:Stmt.Yield):
+        if client.value : # is not None, as in "yield ;"
+            client.value.accept(self)
     '''
     ### Expressions:
 
@@ -346,6 +500,7 @@ class Resolver(GenericVisitor):
             raise Resolver.ResolutionError(client.keyword,
                         "Cannot use 'super' in a class with no superclass")
         self.resolveLocal(client,client.keyword)
+        self.locate("this") # which Interpreter.visitSuper also uses
 
     def visitThis(self,client:Expr.This):
         if self.current_class == ClassType.NOCLASS:
@@ -358,5 +513,14 @@ class Resolver(GenericVisitor):
 
     def visitGrouping(self,client:Expr.Grouping):
         client.expression.accept(self)
+    '''
+    The Optimizer normally runs after the Resolver, but should a program
+    containing its nodes be resolved again, resolve what they wrap.
+    '''
+    def visitMemo(self,client:Expr.Memo):
+        client.expression.accept(self)
+
+    def visitMemoize(self,client:Stmt.Memoize):
+        client.body.accept(self)
 
     # visitLiteral left to the default parent class "pass"
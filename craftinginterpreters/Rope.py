@@ -0,0 +1,136 @@
+'''
+
+# Rope: a Lox string made by concatenation, joined only when needed
+
+Not in the book. A Lox string is a Python str, and "+" on two strings was
+lhs+rhs, which copies both. The usual way to build up text in Lox,
+
+    var s = "";
+    while (i < n) { s = s + piece(i); i = i + 1; }
+
+copies all of s on every iteration, so it takes time (and garbage) in
+proportion to the square of the length of the result. So now, when "+"
+makes a string of any size, it makes a Rope instead: just a note of the
+two strings it is made of, each a str or another Rope. Making one takes
+the same time however long the strings are.
+
+The text of a Rope is put together the first time something needs it,
+in one ''.join() of all its pieces, and then kept; the pieces are let go.
+That happens when the string is printed, compared, hashed (as a memo key,
+for example), converted to a number, or handed out of Lox, to a native
+function written in Python, to a program using LoxProgram, or into a
+pickle, where it becomes a plain str.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## Invisible to Lox
+
+A Lox program can't tell a Rope from a str. The Interpreter checks for
+either where it checks for a string (see binary_value in Interpreter.py),
+and a Rope compares equal to the str with the same text, and hashes the
+same, so isEqual() and dict lookups are unchanged. str() gives its text,
+which is how print shows it (see OutputSink.format_value), and float()
+works on it as on a str, so the Interpreter's quirks with strings that
+look like numbers are kept too.
+
+A Rope is never changed, once made, apart from swapping its pieces for
+the joined text, so one can be shared by any number of variables, tasks
+or threads. The pieces and the text are kept in the one attribute, body,
+so the swap is a single assignment, and another thread walking the same
+Rope sees one or the other. Two threads might both join the same Rope at
+once; both get the same text, and one of them is kept.
+
+## Small strings
+
+For short strings, a Rope would cost more than it saves: making the
+object, and later walking it, costs more than copying a few hundred
+characters. So two str operands whose total length is under ROPE_MIN
+are just added, as before.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Union
+
+'''
+Total length below which "+" on two str operands makes a str, not a Rope.
+'''
+ROPE_MIN = 256
+
+class Rope():
+    __slots__ = ('body', 'length')
+
+    def __init__(self, left:Union[str,Rope], right:Union[str,Rope]):
+        self.body = (left, right) # until the text is wanted, then the text
+        self.length = len(left) + len(right)
+
+    def __len__(self)->int:
+        return self.length
+
+    '''
+    The text, joined on first use. The tree is walked with a stack of our
+    own, not by recursion, since a string built in a loop is a Rope nested
+    as deep as the loop ran.
+    '''
+    def __str__(self)->str:
+        body = self.body
+        if body.__class__ is str:
+            return body
+        pieces = list()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.__class__ is not str:
+                node = node.body
+                if node.__class__ is tuple:
+                    stack.append(node[1])
+                    stack.append(node[0])
+                    continue
+            pieces.append(node)
+        text = self.body = ''.join(pieces)
+        return text
+
+    def __eq__(self, other:object)->bool:
+        if other.__class__ is str or other.__class__ is Rope:
+            return str(self) == str(other)
+        return NotImplemented
+
+    def __ne__(self, other:object)->bool:
+        if other.__class__ is str or other.__class__ is Rope:
+            return str(self) != str(other)
+        return NotImplemented
+
+    def __hash__(self)->int:
+        return hash(str(self))
+
+    def __float__(self)->float:
+        return float(str(self))
+
+    def __repr__(self)->str:
+        return repr(str(self))
+
+    '''
+    A pickled Rope is a str when it is loaded (see HeapImage.py and
+    Parallel.py).
+    '''
+    def __reduce__(self):
+        return (str, (str(self),))
+
+'''
+"+" on two strings, each a str or a Rope.
+'''
+def concatenate(lhs:Union[str,Rope], rhs:Union[str,Rope])->Union[str,Rope]:
+    if lhs.__class__ is str and rhs.__class__ is str \
+       and len(lhs) + len(rhs) < ROPE_MIN:
+        return lhs + rhs
+    return Rope(lhs, rhs)
+
+'''
+A value as it goes out of Lox, to Python code: the same, unless it is a
+Rope, which becomes a str.
+'''
+def plain(value:object)->object:
+    return str(value) if value.__class__ is Rope else value
@@ -18,11 +18,75 @@ This work is licensed under a
 
 
 '''
+from __future__ import annotations # no annotation is evaluated
 from TokenType import * # all the names of lexemes e.g. COMMA, WHILE, etc.
 from Token import Token
-from typing import Callable, List
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, List
+
+'''
+Every integer of magnitude up to this is exactly a float; beyond it, not
+every one is. An integer number is kept as a Python int only up to here,
+see "Integers" in Interpreter.py.
+'''
+INT_LIMIT = 2**53
 
 class Scanner():
+        '''
+        This lengthy dict is the core of a switch statement used in
+        scanToken(), see section 4.5. The keys are expected characters. Each
+        value is a lambda returning a TokenType. Only some of the lambdas
+        contain logic, but all must be lambdas so that the result of searching
+        the dict is always an executable.
+
+        This and the keywords dict below used to be built in __init__, so
+        every Scanner made its own copy, fifteen new lambdas and all. They
+        never change, so now they are class attributes built once when the
+        module is loaded, and the lambdas take the scanner as an argument
+        instead of closing over self.
+        '''
+        switch_dict = {
+                '(':lambda scanner: LEFT_PAREN,
+                ')':lambda scanner: RIGHT_PAREN,
+                '{':lambda scanner: LEFT_BRACE,
+                '}':lambda scanner: RIGHT_BRACE,
+                ',':lambda scanner: COMMA,
+                '.':lambda scanner: DOT,
+                '-':lambda scanner: MINUS,
+                '+':lambda scanner: PLUS,
+                ';':lambda scanner: SEMICOLON,
+                '*':lambda scanner: STAR,
+                '!':lambda scanner: BANG_EQUAL if scanner.look_for('=') else BANG,
+                '=':lambda scanner: EQUAL_EQUAL if scanner.look_for('=') else EQUAL,
+                '<':lambda scanner: LESS_EQUAL if scanner.look_for('=') else LESS,
+                '>':lambda scanner: GREATER_EQUAL if scanner.look_for('=') else GREATER,
+                '/':lambda scanner: SLASH if not scanner.look_for('/') else None
+                }
+        '''
+        Dict (== Java Map) converting input keywords to token types
+        '''
+        keywords = {
+                "and":    AND,
+                "break":  BREAK,
+                "class":  CLASS,
+                "else":   ELSE,
+                "false":  FALSE,
+                "for":    FOR,
+                "fun":    FUN,
+                "if":     IF,
+                "nil":    NIL,
+                "or":     OR,
+                "print":  PRINT,
+                "return": RETURN,
+                "super":  SUPER,
+                "this":   THIS,
+                "true":   TRUE,
+                "var":    VAR,
+                "while":  WHILE,
+                "yield":  YIELD # see Generators.py
+                }
+
         '''
         The source argument to __init__ is a string of (presumably) Lox code,
         from a single line to a file-full. Also a reference to an error method.
@@ -34,8 +98,10 @@ class Scanner():
         can think of for external code accessing its attributes would be for
         debugging, I am not going to bother with leading underscores.
         '''
-        def __init__(self, source:str, error_report:Callable[[int,str],None] ):
+        def __init__(self, source:str, error_report:Callable[[int,str],None],
+                     int_numbers:bool=False ):
                 self.error_report = error_report
+                self.int_numbers = int_numbers # see number_lit()
                 self.source = source # source string
                 self.tokens = list() # collected tokens
                 # initialize the state of the scan
@@ -46,53 +112,6 @@ class Scanner():
                 self.source_len = len(source)
                 # note char position of each new line, for error displays
                 self.last_newline = 0
-                '''
-                This lengthy dict is the core of a switch statement used in
-                scanToken(), see section 4.5. The keys are expected
-                characters. Each value is a lambda returning a TokenType.
-                Only some of the lambdas contain logic, but all must be
-                lambdas so that the result of searching the dict is always an
-                executable.
-                '''
-                self.switch_dict = {
-                        '(':lambda: LEFT_PAREN,
-                        ')':lambda: RIGHT_PAREN,
-                        '{':lambda: LEFT_BRACE,
-                        '}':lambda: RIGHT_BRACE,
-                        ',':lambda: COMMA,
-                        '.':lambda: DOT,
-                        '-':lambda: MINUS,
-                        '+':lambda: PLUS,
-                        ';':lambda: SEMICOLON,
-                        '*':lambda: STAR,
-                        '!':lambda: BANG_EQUAL if self.look_for('=') else BANG,
-                        '=':lambda: EQUAL_EQUAL if self.look_for('=') else EQUAL,
-                        '<':lambda: LESS_EQUAL if self.look_for('=') else LESS,
-                        '>':lambda: GREATER_EQUAL if self.look_for('=') else GREATER,
-                        '/':lambda: SLASH if not self.look_for('/') else None
-                        }
-                '''
-                Dict (== Java Map) converting input keywords to token types
-                '''
-                self.keywords = {
-                        "and":    AND,
-                        "break":  BREAK,
-                        "class":  CLASS,
-                        "else":   ELSE,
-                        "false":  FALSE,
-                        "for":    FOR,
-                        "fun":    FUN,
-                        "if":     IF,
-                        "nil":    NIL,
-                        "or":     OR,
-                        "print":  PRINT,
-                        "return": RETURN,
-                        "super":  SUPER,
-                        "this":   THIS,
-                        "true":   TRUE,
-                        "var":    VAR,
-                        "while":  WHILE
-                        }
 
         '''
         Helper functions for scanning the source string
@@ -149,12 +168,12 @@ class Scanner():
 
                 The book's Java makes use of a switch statement. Here we use
                 the somewhat more verbose Python form, a dict whose values
-                are executables, initialized in the __init__ function.
+                are executables, defined at the top of the class.
                 '''
                 c = self.advance()
                 if c in self.switch_dict :
                         # handle a one- or two-char special character
-                        code = self.switch_dict[c]() #execute lambda
+                        code = self.switch_dict[c](self) #execute lambda
                         if code is not None :
                                 # normal lexeme, create token
                                 self.addToken(code)
@@ -229,9 +248,17 @@ class Scanner():
                         self.advance() # step current over the dot
                 while self.peek().isdecimal() : # get trailing digits
                         self.advance()
-                self.addToken(NUMBER,
-                              float(self.source[self.start:self.current])
-                              )
+                '''
+                Lox numbers are floats. But with int_numbers (plox --int), a
+                literal with no decimal point becomes a Python int, unless it
+                is too big to be exactly a float. See "Integers" in
+                Interpreter.py.
+                '''
+                text = self.source[self.start:self.current]
+                if self.int_numbers and '.' not in text and int(text) <= INT_LIMIT:
+                        self.addToken(NUMBER, int(text))
+                else:
+                        self.addToken(NUMBER, float(text))
         def identifier(self):
                 '''
                 Absorb a valid identifier string and make a token. Book
@@ -239,7 +266,7 @@ class Scanner():
                 to a single char, it doesn't accept digits. So use isalnum
                 plus a test for underscore.
 
-                The dict map of keywords to codes is initialized in __init__.
+                The dict map of keywords to codes is defined at the top of the class.
 
                 This would be a perfect place to use the "walrus"
                 operator, but I don't have Python 3.8 yet.
@@ -8,8 +8,11 @@
 #  Creative Commons Attribution-NonCommercial 4.0 International License
 #  see http://creativecommons.org/licenses/by-nc/4.0/
 
+from __future__ import annotations # no annotation is evaluated
 from Token import Token
-from typing import List
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List
 
 class Stmt:
 	def accept(self,visitor:object):
@@ -33,11 +36,12 @@ class Expression(Stmt):
 		return visitor.visitExpression(self)
 
 class Function(Stmt):
-	def __init__(self, name:Token,params:List[Token],body:List[Stmt] ):
+	def __init__(self, name:Token,params:List[Token],body:List[Stmt],generator:bool=False ):
 		# initialize attributes
 		self.name = name
 		self.params = params
 		self.body = body
+		self.generator = generator
 
 	def accept(self, visitor:object):
 		return visitor.visitFunction(self)
@@ -104,3 +108,21 @@ class Class(Stmt):
 
 	def accept(self, visitor:object):
 		return visitor.visitClass(self)
+
+class Memoize(Stmt):
+	def __init__(self, memos:List[Expr],body:Stmt ):
+		# initialize attributes
+		self.memos = memos
+		self.body = body
+
+	def accept(self, visitor:object):
+		return visitor.visitMemoize(self)
+
+class Yield(Stmt):
+	def __init__(self, keyword:Token,value:Expr ):
+		# initialize attributes
+		self.keyword = keyword
+		self.value = value
+
+	def accept(self, visitor:object):
+		return visitor.visitYield(self)
@@ -31,3 +31,7 @@ class StmtVisitor:
         raise NotImplementedError("No visitor defined for Stmt.Break")
     def visitWhile(self, client:Stmt.While):
         raise NotImplementedError("No visitor defined for Stmt.While")
+    def visitMemoize(self, client:Stmt.Memoize):
+        raise NotImplementedError("No visitor defined for Stmt.Memoize")
+    def visitYield(self, client:Stmt.Yield):
+        raise NotImplementedError("No visitor defined for Stmt.Yield")
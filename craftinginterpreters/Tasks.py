@@ -0,0 +1,276 @@
+'''
+
+# Tasks: green threads and channels for Lox
+
+Not in the book. Lox has no way to do two things at once, so a pipeline
+written in Lox (read records, transform them, write them out) has to run
+each stage to completion, building its whole output, before the next can
+start. These builtins let the stages run together, passing values along
+as they go:
+
+    spawn(fn)           start a task that calls fn(), a function of no
+                        arguments, usually a closure; returns nil
+    channel(n)          a new channel that holds up to n values
+    send(ch, value)     put a value in a channel, waiting while it is full
+    receive(ch)         take the oldest value from a channel, waiting while
+                        it is empty; nil once it is closed and empty
+    close(ch)           no more values will be sent on ch
+
+For example,
+
+    var ch = channel(10);
+    fun produce() { var i = 0; while (i < 1000) { send(ch, i); i = i + 1; } close(ch); }
+    spawn(produce);
+    var item = receive(ch);
+    while (item != nil) { print item; item = receive(ch); }
+
+Only ten values are ever waiting in the channel, however many are sent.
+
+The tasks are green threads: they take turns on one Python thread, and
+switch only at well defined points, so there are no locks and no data
+races in the Python sense. (Lox code still has to think about the order
+things happen in, as with any concurrency.)
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## How a task runs
+
+The Interpreter keeps the current environment in a single attribute,
+self.environment, and walks the tree recursively on the Python stack, so
+one Interpreter can only be in one place in one program at a time. A
+task needs its own place: its own environment chain and its own stack of
+pending visits. So each task gets its own AsyncInterpreter (see
+AsyncInterpreter.py) which shares the globals, and the resolver's depths,
+of the interpreter that spawned it, and runs fn as a coroutine.
+
+The Scheduler drives the coroutines of the tasks, round-robin, with
+send(None). A task's coroutine gives way in one of two ways: at a time
+slice, yielding None, after which it goes to the back of the ready queue;
+or when it must wait on a channel, yielding the Channel, after which it
+waits on that channel until some other task sends, receives or closes
+it. Then every task waiting on the channel is made ready again and looks
+again.
+
+The main program is run by the ordinary Interpreter, which can't give way
+like that. Instead, when it must wait on a channel, it runs the other
+tasks itself until what it wants is there. If it is waiting and no task
+is ready to run, nothing can ever change, and that is reported as a
+deadlock, a runtime error. When the main program ends, the tasks are run
+until every one has finished or is waiting on a channel; the waiting ones
+are then abandoned.
+
+A runtime error in a task is reported as usual and ends that task only.
+
+Tasks don't use the Optimizer's memos (see Optimizer.py): the Optimizer
+assumes that nothing can change a variable during a loop that makes no
+calls, and another task could.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+
+from LoxCallable import LoxCallable, NativeError
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, Deque, List
+
+'''
+Give up control until the channel changes: "await WaitOn(channel)" yields
+the channel up through every await to the scheduler.
+'''
+class WaitOn():
+    def __init__(self, channel:Channel):
+        self.channel = channel
+    def __await__(self):
+        yield self.channel
+
+class Channel():
+    def __init__(self, capacity:int):
+        from collections import deque # only when needed, see plox.py on start-up
+        self.capacity = capacity
+        self.values = deque()
+        self.closed = False
+        self.waiting = list() # Tasks waiting for a change
+
+    def is_full(self)->bool:
+        return len(self.values) >= self.capacity
+
+    def __str__(self)->str:
+        return "channel"
+
+class Task():
+    def __init__(self, coroutine):
+        self.coroutine = coroutine
+
+class Scheduler():
+    def __init__(self, error_report:Callable):
+        from collections import deque
+        self.error_report = error_report
+        self.ready = deque() # Deque[Task]
+
+    def add(self, task:Task):
+        self.ready.append(task)
+
+    '''
+    Something happened to a channel: ready every task waiting on it.
+    '''
+    def changed(self, channel:Channel):
+        if channel.waiting :
+            self.ready.extend(channel.waiting)
+            channel.waiting.clear()
+
+    '''
+    Run the task at the head of the ready queue until it gives way or ends.
+    '''
+    def step(self):
+        from Interpreter import Interpreter # not at top: it imports us
+        task = self.ready.popleft()
+        try:
+            waiting_on = task.coroutine.send(None)
+        except StopIteration:
+            return # finished
+        except Interpreter.EvaluationError as EVE:
+            self.error_report(EVE.token, EVE.message)
+            return # and the task is over
+        if waiting_on is None:
+            self.ready.append(task) # end of its time slice
+        elif isinstance(waiting_on, Channel):
+            waiting_on.waiting.append(task)
+        else:
+            task.coroutine.close()
+            raise NativeError("a task can't wait on anything but a channel")
+
+    '''
+    For the main program: run tasks until condition() is true.
+    '''
+    def run_until(self, condition:Callable[[],bool]):
+        while not condition():
+            if not self.ready :
+                raise NativeError("Deadlock: waiting on a channel and no task can run")
+            self.step()
+
+    '''
+    For the end of the main program: run tasks until none is ready.
+    '''
+    def finish(self):
+        while self.ready :
+            self.step()
+
+'''
+## The builtins
+
+The channel operations work both in the main program, under an ordinary
+Interpreter, and in a task, under an AsyncInterpreter, which calls their
+call_async instead of call. What differs is only how they wait: the
+task yields and lets the scheduler run something else; the main program
+runs the scheduler itself.
+'''
+def scheduler_of(interpreter)->Scheduler:
+    if interpreter.scheduler is None:
+        interpreter.scheduler = Scheduler(interpreter.report)
+    return interpreter.scheduler
+
+def check_channel(value:object, operation:str)->Channel:
+    if not isinstance(value, Channel):
+        raise NativeError(f"{operation} needs a channel")
+    return value
+
+class Spawn(LoxCallable):
+    def arity(self): return 1
+    def call(self, interpreter, args:List[object]):
+        from AsyncInterpreter import AsyncInterpreter # not at top: it imports us
+        function = args[0]
+        if not isinstance(function, LoxCallable) or function.arity() != 0:
+            raise NativeError("spawn needs a function of no arguments")
+        task_interpreter = AsyncInterpreter.sharing(interpreter)
+        task_interpreter.use_memos = False
+        task = Task(task_interpreter.call(function, []))
+        task_interpreter.task = task
+        task_interpreter.scheduler.add(task)
+        return None
+    def __str__(self): return "native function 'spawn'"
+
+class MakeChannel(LoxCallable):
+    def arity(self): return 1
+    def call(self, interpreter, args:List[object]):
+        capacity = args[0]
+        if isinstance(capacity, bool) or not isinstance(capacity, (int, float)) \
+           or capacity < 1 or capacity != int(capacity):
+            raise NativeError("channel needs a capacity of 1 or more")
+        return Channel(int(capacity))
+    def __str__(self): return "native function 'channel'"
+
+class Send(LoxCallable):
+    is_async = True
+    def arity(self): return 2
+    def call(self, interpreter, args:List[object]):
+        channel = check_channel(args[0], "send")
+        scheduler_of(interpreter).run_until(lambda: channel.closed or not channel.is_full())
+        return self.put(interpreter, channel, args[1])
+    async def call_async(self, interpreter, args:List[object]):
+        channel = check_channel(args[0], "send")
+        while not channel.closed and channel.is_full():
+            await wait_for(interpreter, channel)
+        return self.put(interpreter, channel, args[1])
+    def put(self, interpreter, channel:Channel, value:object):
+        if channel.closed :
+            raise NativeError("send on a closed channel")
+        channel.values.append(value)
+        scheduler_of(interpreter).changed(channel)
+        return None
+    def __str__(self): return "native function 'send'"
+
+class Receive(LoxCallable):
+    is_async = True
+    def arity(self): return 1
+    def call(self, interpreter, args:List[object]):
+        channel = check_channel(args[0], "receive")
+        scheduler_of(interpreter).run_until(lambda: channel.closed or channel.values)
+        return self.take(interpreter, channel)
+    async def call_async(self, interpreter, args:List[object]):
+        channel = check_channel(args[0], "receive")
+        while not channel.closed and not channel.values:
+            await wait_for(interpreter, channel)
+        return self.take(interpreter, channel)
+    def take(self, interpreter, channel:Channel)->object:
+        if not channel.values : # and so, closed
+            return None
+        value = channel.values.popleft()
+        scheduler_of(interpreter).changed(channel)
+        return value
+    def __str__(self): return "native function 'receive'"
+
+class Close(LoxCallable):
+    def arity(self): return 1
+    def call(self, interpreter, args:List[object]):
+        channel = check_channel(args[0], "close")
+        channel.closed = True
+        scheduler_of(interpreter).changed(channel)
+        return None
+    def __str__(self): return "native function 'close'"
+
+'''
+Wait for a change to the channel. A task yields to the scheduler. An
+AsyncInterpreter that is not a task (the main program of a host using
+asyncio, say) is in the position of the main program, and runs the
+scheduler until the channel changes.
+'''
+async def wait_for(interpreter, channel:Channel):
+    if interpreter.task is not None:
+        await WaitOn(channel)
+    else:
+        scheduler = scheduler_of(interpreter)
+        if not scheduler.ready :
+            raise NativeError("Deadlock: waiting on a channel and no task can run")
+        scheduler.step()
+
+'''
+Add the builtins to a global environment.
+'''
+def define_natives(environment):
+    environment.define('spawn', Spawn())
+    environment.define('channel', MakeChannel())
+    environment.define('send', Send())
+    environment.define('receive', Receive())
+    environment.define('close', Close())
@@ -0,0 +1,303 @@
+'''
+
+# TieredInterpreter: hot functions and loops move to a faster engine
+
+Not in the book. Most of a program runs a few times and a few parts of it
+run thousands of times; a JIT compiler makes use of that by interpreting
+everything at first, counting, and compiling what the counts show to be
+hot. This subclass of Interpreter does the same with two tiers: the tree
+walker of Interpreter, and the Python closures of ClosureCompiler (see
+ClosureCompiler.py), which do the same thing in about half the time but
+cost a compile.
+
+* Each LoxFunction call is counted, per function declaration. At the
+  CALL_THRESHOLD'th, the declaration is compiled, and every call of it
+  after that, from the tree walker or from compiled code, runs the
+  compiled body.
+* Each back-edge of a while loop is counted, per loop. At the
+  BACK_EDGE_THRESHOLD'th, the loop is compiled, and the rest of that
+  execution of it is handed over, right after a run of its body, to the
+  compiled loop, which carries on in the same Environment from the next
+  test of the condition: on-stack replacement, as a JIT calls it. Every
+  later execution of the loop runs compiled from the start. A for loop is
+  a while loop by now (see Parser.for_stmt), so it is included.
+
+A function or loop the ClosureCompiler won't take (one declaring a class,
+or a generator) stays on the tree walker, and is not tried again.
+
+The counts and compiled code are kept here, in dicts keyed by the
+declaration or loop, not in the tree: a LoxProgram gives the same tree to
+every Interpreter that runs it, on other threads too (see LoxProgram.py),
+and each of them makes its own. Functions are called through
+call_function() and call(), as in the AsyncInterpreter, and the compiled
+code calls those too, so a compiled function calling a cold one counts
+the call, and maybe compiles it.
+
+## What it gained
+
+tier_report() prints which functions and loops were compiled and how much
+faster they ran. To know that, a sample of the calls of each compiled
+function is timed, one in SAMPLE_INTERVAL each way: on the tree walker,
+with everything it calls on the tree walker too, and compiled, with
+nothing timed inside either. A call's time includes that of what it
+calls, so for a recursive function it is shared among the calls of it
+made inside as well. A loop is timed over all its iterations on each
+tier.
+
+plox --tiered runs a script on a TieredInterpreter, and --tier-report
+prints the report on stderr at the end as well.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import sys
+from time import perf_counter
+import Expr
+import Stmt
+from Interpreter import Interpreter, CONTINUE
+from LoxCallable import LoxCallable, LoxFunction, LoxClass, LoxInstance, ReturnUnwinder, NativeError
+from ClosureCompiler import ClosureCompiler
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Mapping, TextIO, Union
+    from Environment import Environment
+
+'''
+Calls of a function before it is compiled.
+'''
+CALL_THRESHOLD = 100
+
+'''
+Back-edges of a loop, over all its executions, before it is compiled.
+'''
+BACK_EDGE_THRESHOLD = 1000
+
+'''
+One call in this many of a compiled function is timed on each tier.
+'''
+SAMPLE_INTERVAL = 32
+
+'''
+What is known of one function declaration or loop: how many times it was
+called, or went round; its compiled form, None until it is compiled, or
+False if it can't be, and why; and the times taken on each tier, and the
+calls or iterations they were taken over.
+'''
+class Tier():
+    __slots__ = ('count', 'compiled', 'reason', 'cold_time', 'cold_runs',
+                 'hot_time', 'hot_runs')
+
+    def __init__(self):
+        self.count = 0
+        self.compiled = None # Optional[Union[Callable,bool]]
+        self.reason = None # Optional[str]
+        self.cold_time = 0.0
+        self.cold_runs = 0
+        self.hot_time = 0.0
+        self.hot_runs = 0
+
+class TieredInterpreter(Interpreter):
+
+    def __init__(self, error_report:Callable[[int,str],None],
+                 locals_map:Mapping[Expr.Expr,int]=None,
+                 output:object=None):
+        super().__init__(error_report, locals_map, output)
+        self.functions = dict() # Dict[Stmt.Function,Tier]
+        self.loops = dict() # Dict[Stmt.While,Tier]
+        '''
+        While a call is timed, timing is True, and no other is; and while
+        it is timed on the tree walker, cold is True, and nothing runs
+        compiled.
+        '''
+        self.timing = False
+        self.cold = False
+
+    '''
+    Calling things, as Interpreter.visitCall does, but with a LoxFunction,
+    or the initializer of a LoxClass, called through call_function().
+    '''
+    def visitCall(self, client:Expr.Call)->object:
+        callee = self.evaluate(client.callee)
+        if not isinstance(callee, LoxCallable) :
+            raise Interpreter.EvaluationError(client.paren,
+                            "Only functions and classes can be called.")
+        params = [self.evaluate(argument) for argument in client.arguments]
+        if callee.arity() != len(params):
+            raise Interpreter.EvaluationError(client.paren,
+                    f"Expected {callee.arity()} arguments but got {len(params)}." )
+        if callee.__class__ is LoxFunction:
+            return self.call_function(callee, params)
+        try:
+            return self.call(callee, params)
+        except NativeError as NE:
+            raise Interpreter.EvaluationError(client.paren, str(NE))
+
+    def call(self, callee:LoxCallable, args:List[object])->object:
+        if isinstance(callee, LoxFunction):
+            return self.call_function(callee, args)
+        if isinstance(callee, LoxClass):
+            instance = LoxInstance(callee)
+            initializer = callee.initializer
+            if initializer : # has been declared,
+                self.call_function(initializer.bind(instance), args)
+            return instance
+        return callee.call(self, args)
+
+    '''
+    Call a LoxFunction: count the call, compile the function when it is
+    hot, and run it on whichever tier it is on, now and then timing it.
+    '''
+    def call_function(self, function:LoxFunction, args:List[object])->object:
+        declaration = function.declaration
+        tier = self.functions.get(declaration)
+        if tier is None:
+            tier = self.functions[declaration] = Tier()
+        tier.count += 1
+        compiled = tier.compiled
+        if compiled is None:
+            if tier.count < CALL_THRESHOLD:
+                return function.call(self, args)
+            compiled = self.compile_function(tier, declaration)
+        if compiled is False or self.cold:
+            return function.call(self, args)
+        if not self.timing:
+            phase = tier.count % SAMPLE_INTERVAL
+            if phase == 0 or phase == SAMPLE_INTERVAL // 2:
+                return self.sample(tier, function, args, phase == 0)
+        return compiled(function, args)
+
+    def compile_function(self, tier:Tier, declaration:Stmt.Function)->Union[Callable,bool]:
+        try:
+            tier.compiled = ClosureCompiler(self).function(declaration)
+        except ClosureCompiler.Unsupported as U:
+            tier.compiled = False
+            tier.reason = str(U)
+        return tier.compiled
+
+    '''
+    Time one call of a compiled function, on the tree walker if cold.
+    '''
+    def sample(self, tier:Tier, function:LoxFunction, args:List[object], cold:bool)->object:
+        self.timing = True
+        self.cold = cold
+        before = tier.count
+        start = perf_counter()
+        try:
+            if cold:
+                return function.call(self, args)
+            return tier.compiled(function, args)
+        finally:
+            elapsed = perf_counter() - start
+            self.timing = self.cold = False
+            calls = tier.count - before + 1 # this one, and its own inside
+            if cold:
+                tier.cold_time += elapsed
+                tier.cold_runs += calls
+            else:
+                tier.hot_time += elapsed
+                tier.hot_runs += calls
+
+    '''
+    A while loop, as Interpreter.visitWhile runs it, counting its
+    back-edges, until it is hot; then the compiled loop takes over, see
+    above. A return from inside that comes back as a value, and goes on as
+    the tree walker's return does.
+    '''
+    def visitWhile(self, client:Stmt.While):
+        if self.cold:
+            return super().visitWhile(client)
+        tier = self.loops.get(client)
+        if tier is None:
+            tier = self.loops[client] = Tier()
+        if tier.compiled:
+            return self.run_loop(tier, self.environment)
+        environment = self.environment
+        environment.define(CONTINUE,True)
+        start = perf_counter()
+        iterations = 0
+        while self.isTruthy( self.evaluate(client.condition ) ) \
+              and environment.fetch(CONTINUE) :
+            self.execute(client.body)
+            iterations += 1
+            tier.count += 1
+            if tier.count >= BACK_EDGE_THRESHOLD and tier.compiled is None \
+               and dict.get(environment, CONTINUE) is True:
+                tier.cold_time += perf_counter() - start
+                tier.cold_runs += iterations
+                if self.compile_loop(tier, client):
+                    return self.run_loop(tier, environment)
+                start = perf_counter()
+                iterations = 0
+        tier.cold_time += perf_counter() - start
+        tier.cold_runs += iterations
+        environment.define(CONTINUE,True)
+
+    def compile_loop(self, tier:Tier, client:Stmt.While)->Union[Callable,bool]:
+        counter = [0]
+        try:
+            loop = ClosureCompiler(self).loop(client, counter)
+        except ClosureCompiler.Unsupported as U:
+            tier.compiled = False
+            tier.reason = str(U)
+            return False
+        '''
+        The condition is tested once more than the body runs, at the end;
+        and the counter is read after a return from the loop too.
+        '''
+        def compiled(environment):
+            before = counter[0]
+            start = perf_counter()
+            try:
+                return loop(environment)
+            finally:
+                tier.hot_time += perf_counter() - start
+                tier.hot_runs += max(0, counter[0] - before - 1)
+        tier.compiled = compiled
+        return compiled
+
+    def run_loop(self, tier:Tier, environment:Environment):
+        result = tier.compiled(environment)
+        if result is not None: # a return
+            raise ReturnUnwinder(result[0])
+
+    '''
+    Print what went to the compiled tier and how it did there, and what
+    would not go, and why.
+    '''
+    def tier_report(self, out:TextIO=sys.stderr):
+        from MemoryProfile import line_of
+        print(f"plox tiered execution: functions compiled after {CALL_THRESHOLD} calls, "
+              f"loops after {BACK_EDGE_THRESHOLD} back-edges", file=out)
+        rows = list()
+        refused = list()
+        for (kind, table) in (('fun', self.functions), ('while', self.loops)):
+            for (node, tier) in table.items():
+                if kind == 'fun':
+                    name = f"fun {node.name.lexeme}"
+                    line = node.name.line
+                    count = tier.count
+                else:
+                    name = 'while'
+                    line = line_of(node)
+                    count = tier.cold_runs + tier.hot_runs
+                if tier.compiled is False:
+                    refused.append((name, line, tier.reason))
+                elif tier.compiled is not None:
+                    rows.append((name, line, count, tier))
+        print(f"\n{'compiled':<20} {'line':>6} {'calls/laps':>12} {'walker us':>11} "
+              f"{'compiled us':>12} {'speedup':>8}", file=out)
+        for (name, line, count, tier) in rows:
+            cold = tier.cold_time / tier.cold_runs * 1e6 if tier.cold_runs else None
+            hot = tier.hot_time / tier.hot_runs * 1e6 if tier.hot_runs else None
+            speedup = f"x{cold/hot:.2f}" if cold and hot else '-'
+            print(f"{name:<20} {'?' if line is None else line:>6} {count:>12} "
+                  f"{'-' if cold is None else format(cold, '.2f'):>11} "
+                  f"{'-' if hot is None else format(hot, '.2f'):>12} {speedup:>8}",
+                  file=out)
+        if not rows:
+            print(f"{'(none)':<20}", file=out)
+        for (name, line, reason) in refused:
+            print(f"not compiled: {name}, line {line}: {reason}", file=out)
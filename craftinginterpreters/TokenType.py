@@ -55,6 +55,7 @@ VAR = 37
 WHILE = 38
 EOF = 39
 BREAK = 40
+YIELD = 41
 
 TokenNames = {
     1 : "LEFT_PAREN",
@@ -96,5 +97,6 @@ TokenNames = {
     37 : "VAR",
     38 : "WHILE",
     39 : "EOF",
-    40 : "BREAK" # Ch.9 challenge
+    40 : "BREAK", # Ch.9 challenge
+    41 : "YIELD" # see Generators.py
     }
\ No newline at end of file
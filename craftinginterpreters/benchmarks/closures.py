@@ -0,0 +1,112 @@
+'''
+
+# Closure benchmark: what closures keep alive, and what their lookups cost
+
+Two closure-heavy Lox programs, each compiled with LoxProgram and run:
+
+* MEMORY makes --closures small callbacks, each in a call of a function
+  that also builds a --big character string it doesn't let the callback
+  use, and keeps them all. The memory still in use afterward (measured
+  with tracemalloc, while the results, and so the callbacks, are alive)
+  is printed, in all and per callback. When a closure kept the whole
+  Environment it was declared in, every string stayed with its callback;
+  with flat closures (see "Flat closures" in Environment.py) only the
+  callback's free variables do.
+
+* LOOKUP calls a closure declared four blocks deep inside a function,
+  which adds to a variable of the function on each of --calls calls. The
+  best time of --runs runs is printed.
+
+    python benchmarks/closures.py [--closures N] [--big N] [--calls N] [--runs N]
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import LoxProgram
+
+'''
+The string is made by doubling, as a Rope (see Rope.py), and compared,
+which joins it into one str of 2**big characters. Each callback keeps
+the one before it alive, so that the last keeps them all.
+'''
+MEMORY = '''
+fun make(prev, n) {
+    var text = "x";
+    var i = 0;
+    while (i < big) { text = text + text; i = i + 1; }
+    var count = n;
+    if (text == "") count = 0;
+    fun callback() { if (count < 0) return prev; return count; }
+    return callback;
+}
+var last = nil;
+var n = 0;
+while (n < closures) { last = make(last, n); n = n + 1; }
+var total = last();
+'''
+
+LOOKUP = '''
+fun work(calls) {
+    var total = 0;
+    { var a = 1; { var b = 2; { var c = 3; { var d = a + b + c;
+        fun step(j) { total = total + j + d; }
+        var j = 0;
+        while (j < calls) { step(j); j = j + 1; }
+    } } } }
+    return total;
+}
+var result = work(calls);
+'''
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Measure the memory and speed of Lox closures.')
+    parser.add_argument('--closures', type=int, default=2000,
+                help='callbacks kept (default: %(default)s)')
+    parser.add_argument('--big', type=int, default=14,
+                help='each string is 2**big characters (default: %(default)s)')
+    parser.add_argument('--calls', type=int, default=200000,
+                help='calls of the closure in the lookup test (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=3,
+                help='runs of the lookup test, the best is taken (default: %(default)s)')
+    args = parser.parse_args()
+
+    memory = LoxProgram.compile(MEMORY)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = memory.run({'closures':args.closures, 'big':args.big})
+    kept = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    if results['total'] != args.closures - 1:
+        print("WRONG RESULT", file=sys.stderr)
+        return 1
+    print(f"{args.closures} closures: {kept/2**20:8.1f} MiB kept, "
+          f"{kept/args.closures/1024:.1f} KiB each "
+          f"(strings of {2**args.big/1024:.0f} KiB)")
+
+    lookup = LoxProgram.compile(LOOKUP)
+    best = None
+    for run in range(args.runs):
+        start = time.perf_counter()
+        results = lookup.run({'calls':args.calls})
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    if results['result'] != args.calls * (args.calls - 1) / 2 + 6 * args.calls:
+        print("WRONG RESULT", file=sys.stderr)
+        return 1
+    print(f"{args.calls} calls of a closure 4 blocks deep: {best*1000:8.1f} ms")
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
@@ -0,0 +1,165 @@
+'''
+
+# Front end benchmark: three passes against one
+
+How long does it take to compile a big Lox program, with the Parser and
+Resolver as separate passes (as usual) and with the Parser resolving as
+it goes (plox --one-pass, see "Resolving in the same pass" in Parser.py)?
+The program is generated: --lines lines of functions, classes, loops
+and blocks, with some of the functions nested --depth blocks deep.
+
+    python benchmarks/front_end.py [--lines N] [--depth N] [--runs N]
+
+It prints the best time, over --runs runs taking turns, of the Scanner,
+and of parsing and resolving each way. The resolution data of the two
+ways must be identical, reference for reference, or it says so and fails.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+from Scanner import Scanner
+from Parser import Parser
+from Resolver import Resolver, Depths
+import Expr
+import Stmt
+
+'''
+One unit of the program, about 30 lines, n making its names unique.
+Every local is used, as the Resolver insists.
+'''
+def unit(n:int)->str:
+    return f'''
+class Shape{n} {{
+    init(w, h) {{ this.w = w; this.h = h; }}
+    area() {{ return this.w * this.h; }}
+}}
+class Square{n} < Shape{n} {{
+    init(s) {{ super.init(s, s); }}
+    area() {{ var a = super.area(); return a; }}
+}}
+fun sum{n}(limit) {{
+    var total = 0;
+    for (var i = 0; i < limit; i = i + 1) {{
+        var square = Square{n}(i);
+        if (square.area() > 10) {{
+            total = total + square.area();
+        }} else {{
+            var small = square.area();
+            total = total - small;
+        }}
+    }}
+    return total;
+}}
+fun counter{n}() {{
+    var count = 0;
+    fun next() {{ count = count + 1; return count; }}
+    return next;
+}}
+var c{n} = counter{n}();
+while (c{n}() < 3) {{ print sum{n}(c{n}()); }}
+'''
+
+'''
+A function whose body is depth blocks deep, referring at the bottom to
+variables declared at every level.
+'''
+def nested(n:int, depth:int)->str:
+    lines = [f"fun deep{n}(p) {{"]
+    for level in range(depth):
+        lines.append(f"{{ var v{level} = p + {level};")
+    lines.append("print " + " + ".join(f"v{level}" for level in range(depth)) + ";")
+    lines.append("}" * depth)
+    lines.append("}")
+    return "\n".join(lines)
+
+def program(lines:int, depth:int)->str:
+    parts = list()
+    count = 0
+    n = 0
+    while count < lines:
+        part = unit(n) if n % 10 else nested(n, depth)
+        parts.append(part)
+        count += part.count('\n') + 1
+        n += 1
+    return '\n'.join(parts)
+
+def report(a_token, message:str):
+    raise SystemExit(f"error in generated program, line {a_token.line}: {message}")
+
+def three_pass(tokens:list)->Depths:
+    statements = Parser(tokens, report).parse()
+    depths = Depths()
+    Resolver(depths, report).resolve(statements)
+    return depths
+
+def one_pass(tokens:list)->Depths:
+    parser = Parser(tokens, report, one_pass=True)
+    parser.parse()
+    return parser.depths
+
+'''
+The depths, keyed by the token that names each reference and the class of
+the reference, so that two trees parsed from the same tokens can be
+compared. (The free variables of a function are keyed by its name. A
+block that declares nothing has no token, so those are only counted.)
+'''
+def by_token(depths:Depths)->dict:
+    def token_of(reference):
+        if isinstance(reference, (Expr.This, Expr.Super)):
+            return reference.keyword
+        return reference.name
+    keyed = {Stmt.Block: 0}
+    for (reference, depth) in depths.items():
+        if isinstance(reference, Stmt.Block):
+            keyed[Stmt.Block] += 1
+        else:
+            keyed[(id(token_of(reference)), type(reference))] = depth
+    return keyed
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Time the Lox front end, in three passes and in one.')
+    parser.add_argument('--lines', type=int, default=100000,
+                help='lines of generated Lox (default: %(default)s)')
+    parser.add_argument('--depth', type=int, default=100,
+                help='nesting of the deep functions (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=3,
+                help='runs of each, the best is taken (default: %(default)s)')
+    args = parser.parse_args()
+    source = program(args.lines, args.depth)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * args.depth + 1000))
+    best = {'scan':None, 'three passes':None, 'one pass':None}
+    for run in range(args.runs):
+        start = time.perf_counter()
+        tokens = Scanner(source, report).scanTokens()
+        times = {'scan': time.perf_counter() - start}
+        start = time.perf_counter()
+        three = three_pass(tokens)
+        times['three passes'] = time.perf_counter() - start
+        start = time.perf_counter()
+        one = one_pass(tokens)
+        times['one pass'] = time.perf_counter() - start
+        for (name, elapsed) in times.items():
+            if best[name] is None or elapsed < best[name]:
+                best[name] = elapsed
+    if one is None or by_token(one) != by_token(three):
+        print("DIFFERENT RESOLUTION DATA", file=sys.stderr)
+        return 1
+    print(f"{source.count(chr(10))+1} lines, {len(tokens)} tokens, {len(three)} local references")
+    print(f"scan:                     {best['scan']*1000:8.1f} ms")
+    print(f"parse, then resolve:      {best['three passes']*1000:8.1f} ms")
+    print(f"parse, resolving as it goes: {best['one pass']*1000:5.1f} ms, "
+          f"x{best['three passes']/best['one pass']:.2f}")
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
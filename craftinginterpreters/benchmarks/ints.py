@@ -0,0 +1,85 @@
+'''
+
+# Integer benchmark for plox --int
+
+How much quicker is integer-heavy Lox with whole numbers kept as ints
+(see "Integers" in Interpreter.py)? The program below, all counters,
+indices and sums, is compiled both ways with LoxProgram, run --runs times
+each way, taking turns, and the best time of each is printed, with the
+speed-up.
+
+    python benchmarks/ints.py [--runs N] [--size N]
+
+The results of the two ways are compared, and must be equal, so a
+difference in arithmetic would show up as a failure, not just a number.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import LoxProgram
+
+'''
+Nested counting loops, a recursive function, and a running checksum
+that stays well inside the range of exact integers.
+'''
+SOURCE = '''
+fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+var total = 0;
+var i = 0;
+while (i < size) {
+    var j = 0;
+    while (j < 100) {
+        total = total + i * j - (j - i);
+        j = j + 1;
+    }
+    if (total > 1000000000) total = total - 1000000000;
+    i = i + 1;
+}
+var f = fib(18);
+'''
+
+'''
+Run the two programs turn about, so that whatever else the machine is
+doing slows both alike, and return the best time of each and its results.
+'''
+def best_times(programs:list, globals_in:dict, runs:int):
+    best = [None] * len(programs)
+    results = [None] * len(programs)
+    for run in range(runs):
+        for (index, program) in enumerate(programs):
+            start = time.perf_counter()
+            results[index] = program.run(globals_in)
+            elapsed = time.perf_counter() - start
+            if best[index] is None or elapsed < best[index]:
+                best[index] = elapsed
+    return best, results
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Time Lox integer arithmetic, with and without --int.')
+    parser.add_argument('--runs', type=int, default=5,
+                help='runs of each way, the best is taken (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=1000,
+                help='iterations of the outer loop (default: %(default)s)')
+    args = parser.parse_args()
+    programs = [LoxProgram.compile(SOURCE), LoxProgram.compile(SOURCE, int_numbers=True)]
+    (floats, ints), (float_results, int_results) = \
+        best_times(programs, {'size':args.size}, args.runs)
+    if (float_results['total'], float_results['f']) != (int_results['total'], int_results['f']):
+        print("WRONG RESULTS", file=sys.stderr)
+        return 1
+    print(f"floats: {floats*1000:8.1f} ms")
+    print(f"  ints: {ints*1000:8.1f} ms, x{floats/ints:.2f}")
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
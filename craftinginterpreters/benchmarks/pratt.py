@@ -0,0 +1,104 @@
+'''
+
+# Parser benchmark: the recursive-descent ladder against precedence climbing
+
+How much quicker does a PrattParser (plox --pratt, see PrattParser.py)
+parse expression-dense Lox than the Parser? The program is generated:
+--lines statements, each an assignment or print of a long expression of
+arithmetic, comparisons, logic, calls and property references.
+
+    python benchmarks/pratt.py [--lines N] [--runs N]
+
+It scans the program once, then parses the tokens with each parser
+--runs times, taking turns, and prints the best time of each. The two
+trees must be the same, node for node, or it says so and fails.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+from Scanner import Scanner
+from Parser import Parser
+from PrattParser import PrattParser
+from Token import Token
+
+'''
+Statement n of the program, one of a few shapes of expression, with n
+making its numbers differ.
+'''
+def statement(n:int)->str:
+    shape = n % 4
+    if shape == 0:
+        return f"a = b * {n} + c / (d - {n % 7}) - -e * f;"
+    if shape == 1:
+        return f"print a < {n} and b >= c or !(d == e) and f != {n};"
+    if shape == 2:
+        return f"p.x = q.f(a + 1, b * 2).y - r.g(c)(d) * {n};"
+    return f"var v{n} = (a + b) * (c + d) * (e + f) / {n + 1} - a * b + c * d - e * f;"
+
+def program(lines:int)->str:
+    return '\n'.join(statement(n) for n in range(lines))
+
+def report(a_token, message:str):
+    raise SystemExit(f"error in generated program, line {a_token.line}: {message}")
+
+'''
+Two trees are the same if their nodes are of the same classes with the
+same attributes, the tokens in them being the very same Token objects.
+'''
+def same_tree(one:object, other:object)->bool:
+    stack = [(one, other)]
+    while stack:
+        (one, other) = stack.pop()
+        if isinstance(one, Token) or isinstance(other, Token):
+            if one is not other:
+                return False
+        elif isinstance(one, list):
+            if not isinstance(other, list) or len(one) != len(other):
+                return False
+            stack.extend(zip(one, other))
+        elif hasattr(one, '__dict__'):
+            if one.__class__ is not other.__class__ or vars(one).keys() != vars(other).keys():
+                return False
+            stack.extend((value, vars(other)[name]) for (name, value) in vars(one).items())
+        elif one.__class__ is not other.__class__ or one != other:
+            return False
+    return True
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Time the Lox Parser against the PrattParser.')
+    parser.add_argument('--lines', type=int, default=50000,
+                help='statements of generated Lox (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5,
+                help='runs of each, the best is taken (default: %(default)s)')
+    args = parser.parse_args()
+    tokens = Scanner(program(args.lines), report).scanTokens()
+    best = {Parser:None, PrattParser:None}
+    trees = dict()
+    for run in range(args.runs):
+        for kind in best:
+            start = time.perf_counter()
+            trees[kind] = kind(tokens, report).parse()
+            elapsed = time.perf_counter() - start
+            if best[kind] is None or elapsed < best[kind]:
+                best[kind] = elapsed
+    if not same_tree(trees[Parser], trees[PrattParser]):
+        print("DIFFERENT TREES", file=sys.stderr)
+        return 1
+    print(f"{args.lines} statements, {len(tokens)} tokens")
+    print(f"Parser:      {best[Parser]*1000:8.1f} ms")
+    print(f"PrattParser: {best[PrattParser]*1000:8.1f} ms, "
+          f"x{best[Parser]/best[PrattParser]:.2f}")
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
@@ -0,0 +1,164 @@
+'''
+
+# The benchmark suite: run it, save the results, compare with a baseline
+
+benchmarks/suite holds one Lox program per classic workload: fib,
+binary_trees, method_call, instantiation, properties, string_concat,
+equality, closures and loops. Each describes itself in its first comment
+lines, and leaves its answer in the global result, which must equal the
+value on its "// expect:" line, or the benchmark fails; a quick wrong
+answer is no improvement.
+
+    python benchmarks/run.py [name ...] [--warmups N] [--runs N] [--int] [--tiered]
+                             [--json FILE] [--baseline FILE] [--threshold PCT]
+
+Each program is compiled once, with LoxProgram, then run --warmups times
+untimed and --runs times timed, each run with a fresh Interpreter and
+after a gc.collect(), so only executing is measured, not compiling. For
+each it prints the median time, and the spread, the range from fastest
+to slowest run as a percentage of the median. A spread bigger than the
+threshold marks a result as noisy: the machine was busy, or --runs is
+too small. --tiered runs each on a TieredInterpreter, as plox --tiered
+does, a fresh one each time, so each run compiles its hot code anew.
+
+--json writes the results to FILE, the times of every run included. A
+file so written is a baseline for a later run: given --baseline, each
+median is compared with the one there, and a benchmark more than
+--threshold percent slower is flagged as a regression, which makes the
+exit status 1; one as much faster is flagged too, to be pleased about.
+Give the names of benchmarks to run only those.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import LoxProgram
+from Interpreter import Interpreter
+from TieredInterpreter import TieredInterpreter
+from OutputSink import format_value
+
+SUITE = os.path.join(HERE, 'suite')
+
+'''
+The benchmarks, name -> path of its program, in order of name.
+'''
+def suite()->dict:
+    return {os.path.splitext(os.path.basename(path))[0]: path
+            for path in sorted(glob.glob(os.path.join(SUITE, '*.lox')))}
+
+'''
+The value a program's "// expect:" line says it leaves in result.
+'''
+def expected(source:str)->str:
+    for line in source.splitlines():
+        if line.startswith('// expect:'):
+            return line[len('// expect:'):].strip()
+    raise SystemExit("no '// expect:' line in a benchmark")
+
+'''
+Time one benchmark: a list of the times of its timed runs, in seconds.
+'''
+def measure(path:str, warmups:int, runs:int, int_numbers:bool,
+            interpreter_class:type=Interpreter)->list:
+    with open(path, encoding='utf_8') as f:
+        source = f.read()
+    answer = expected(source)
+    program = LoxProgram.compile(source, int_numbers=int_numbers)
+    times = list()
+    for run in range(warmups + runs):
+        gc.collect()
+        start = time.perf_counter()
+        interpreter = program.new_interpreter(None, interpreter_class)
+        interpreter.interpret(program.statements)
+        results = program.results(interpreter)
+        elapsed = time.perf_counter() - start
+        if format_value(results['result']) != answer:
+            raise SystemExit(f"{path}: result {format_value(results['result'])}, "
+                             f"expected {answer}")
+        if run >= warmups:
+            times.append(elapsed)
+    return times
+
+def summary(times:list)->dict:
+    median = statistics.median(times)
+    return {'median': median, 'min': min(times), 'max': max(times),
+            'spread': (max(times) - min(times)) / median * 100, 'times': times}
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Run the Lox benchmark suite.')
+    parser.add_argument('names', nargs='*', metavar='name',
+                help='benchmarks to run (default: all of them)')
+    parser.add_argument('--warmups', type=int, default=1,
+                help='untimed runs of each first (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5,
+                help='timed runs of each (default: %(default)s)')
+    parser.add_argument('--int', action='store_true',
+                help='compile as plox --int does')
+    parser.add_argument('--tiered', action='store_true',
+                help='run as plox --tiered does')
+    parser.add_argument('--json', metavar='FILE',
+                help='write the results to FILE')
+    parser.add_argument('--baseline', metavar='FILE',
+                help='compare with the results in FILE, written by --json')
+    parser.add_argument('--threshold', type=float, default=10.0, metavar='PCT',
+                help='percent slower that is a regression (default: %(default)s)')
+    args = parser.parse_args()
+    benchmarks = suite()
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error(f"no benchmark {name}; there are {', '.join(benchmarks)}")
+    names = args.names or list(benchmarks)
+    baseline = dict()
+    if args.baseline:
+        with open(args.baseline, encoding='utf_8') as f:
+            baseline = json.load(f)['benchmarks']
+
+    results = dict()
+    regressions = 0
+    print(f"{'benchmark':<14} {'median ms':>10} {'spread':>8}  {'baseline ms':>11} {'change':>8}")
+    for name in names:
+        result = results[name] = summary(measure(benchmarks[name], args.warmups,
+                                                 args.runs, args.int,
+                                                 TieredInterpreter if args.tiered
+                                                 else Interpreter))
+        line = f"{name:<14} {result['median']*1000:>10.1f} {result['spread']:>7.1f}%"
+        if name in baseline:
+            before = baseline[name]['median']
+            change = (result['median'] - before) / before * 100
+            line += f"  {before*1000:>11.1f} {change:>+7.1f}%"
+            if change > args.threshold:
+                line += "  REGRESSION"
+                regressions += 1
+            elif change < -args.threshold:
+                line += "  faster"
+        if result['spread'] > args.threshold:
+            line += "  (noisy)"
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf_8') as f:
+            json.dump({'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'int': args.int, 'tiered': args.tiered, 'warmups': args.warmups, 'runs': args.runs,
+                       'benchmarks': results}, f, indent=2)
+    if regressions:
+        print(f"{regressions} regression(s) of more than {args.threshold:g}%", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
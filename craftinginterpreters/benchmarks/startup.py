@@ -0,0 +1,84 @@
+'''
+
+# Start-up benchmark for plox
+
+How long from launching "python plox.py script.lox" until the first
+statement of the script has run? For the short scripts we run by the
+thousand, that is nearly all of the run time, and it is nearly all spent
+importing modules (see the notes on start-up time at the top of plox.py).
+
+This launches plox on a one-line script that prints a line, and times from
+just before the process is started until that line arrives on the pipe
+from it, over a number of runs. As a reference it does the same for bare
+Python printing a line, which is the floor plox can't get under. It
+prints the median and best of each, and the difference, which is what
+plox itself costs.
+
+    python benchmarks/startup.py [--runs N] [--target MS]
+
+With --target, exit with status 1 if the median time-to-first-statement
+of plox is over MS milliseconds, so a test script can watch for
+regressions.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLOX = os.path.join(os.path.dirname(HERE), 'plox.py')
+
+'''
+Time one launch of command, until it writes its first line. Then let it
+finish, and check that it did what it should.
+'''
+def first_line_time(command)->float:
+    start = time.perf_counter()
+    child = subprocess.Popen(command, stdout=subprocess.PIPE)
+    line = child.stdout.readline()
+    elapsed = time.perf_counter() - start
+    child.stdout.read()
+    child.wait()
+    if line.strip() != b'ready' or child.returncode != 0:
+        raise SystemExit(f"startup: {command} printed {line!r}, status {child.returncode}")
+    return elapsed
+
+def measure(command, runs:int):
+    first_line_time(command) # once to warm the disk cache and write .pyc files
+    times = [first_line_time(command) for _ in range(runs)]
+    return statistics.median(times)*1000, min(times)*1000
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Time plox start-up.')
+    parser.add_argument('--runs', type=int, default=20,
+                help='launches to time (default: %(default)s)')
+    parser.add_argument('--target', type=float, metavar='MS',
+                help='fail if the median for plox is over MS milliseconds')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as folder:
+        script = os.path.join(folder, 'trivial.lox')
+        with open(script, 'w') as f:
+            f.write('print "ready";\n')
+        python_median, python_best = measure(
+            [sys.executable, '-c', 'print("ready")'], args.runs)
+        plox_median, plox_best = measure(
+            [sys.executable, PLOX, script], args.runs)
+    print(f"python: median {python_median:6.1f} ms, best {python_best:6.1f} ms")
+    print(f"plox:   median {plox_median:6.1f} ms, best {plox_best:6.1f} ms")
+    print(f"plox costs {plox_median-python_median:.1f} ms over bare python")
+    if args.target is not None and plox_median > args.target:
+        print(f"over the target of {args.target:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
@@ -0,0 +1,89 @@
+'''
+
+# Thread benchmark for LoxProgram
+
+How many runs a second can one compiled LoxProgram do, as the number of
+threads running it goes up? The program is compiled once; then for each
+thread count, a batch of runs is made with LoxProgram.run_all on that
+many threads, each run with its own Interpreter (see "Sharing" in
+LoxProgram.py), and timed.
+
+    python benchmarks/threads.py [--runs N] [--threads 1,2,4,8] [--size N]
+
+It prints runs per second for each thread count, and the speed-up over
+one thread. Every run's result is checked against the one-thread result,
+so a data race between runs would show up as a failure, not just a
+number.
+
+On a Python with the global interpreter lock, expect no speed-up, since
+only one thread at a time runs Python code. On a free-threaded build
+(python3.13t or later, where sys._is_gil_enabled() is False), expect it
+to scale with the cores, up to the number of cores. The first line of the
+output says which it is.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+'''
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import LoxProgram
+
+'''
+Work for one run: some function calls, a closure, a loop and an instance
+per iteration, all depending on the input "seed" so that runs differ.
+'''
+SOURCE = '''
+class Point {
+    init(x, y) { this.x = x; this.y = y; }
+    sum() { return this.x + this.y; }
+}
+fun adder(n) { fun add(v) { return v + n; } return add; }
+var add = adder(seed);
+var total = 0;
+var i = 0;
+while (i < size) {
+    var p = Point(i, seed);
+    total = add(total + p.sum());
+    i = i + 1;
+}
+'''
+
+def main()->int:
+    parser = argparse.ArgumentParser(description='Time LoxProgram runs on threads.')
+    parser.add_argument('--runs', type=int, default=64,
+                help='runs per thread count (default: %(default)s)')
+    parser.add_argument('--threads', default='1,2,4,8',
+                help='comma-separated thread counts (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=2000,
+                help='loop iterations in each run (default: %(default)s)')
+    args = parser.parse_args()
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}, "
+          f"{os.cpu_count()} cores")
+    program = LoxProgram.compile(SOURCE)
+    inputs = [{'seed':seed, 'size':args.size} for seed in range(args.runs)]
+    expected = [program.run(globals_in)['total'] for globals_in in inputs]
+    base_rate = None
+    for threads in (int(count) for count in args.threads.split(',')):
+        start = time.perf_counter()
+        results = program.run_all(inputs, threads=threads)
+        elapsed = time.perf_counter() - start
+        if [result['total'] for result in results] != expected:
+            print(f"{threads} threads: WRONG RESULTS", file=sys.stderr)
+            return 1
+        rate = args.runs / elapsed
+        if base_rate is None:
+            base_rate = rate
+        print(f"{threads:3d} threads: {rate:8.1f} runs/s, x{rate/base_rate:.2f}")
+    return 0
+
+if __name__ == '__main__' :
+
+    sys.exit(main())
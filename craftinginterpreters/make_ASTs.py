@@ -38,8 +38,11 @@ TEMPLATE = '''
 #  Creative Commons Attribution-NonCommercial 4.0 International License
 #  see http://creativecommons.org/licenses/by-nc/4.0/
 
+from __future__ import annotations # no annotation is evaluated
 from Token import Token
-from typing import List
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List
 
 class {master_class}:
 \tdef accept(self,visitor:object):
@@ -80,19 +83,22 @@ EXPRS = [
       "Super    : Token keyword, Token method",
       "This     : Token keyword",
       "Unary    : Token operator, Expr right",
-      "Variable : Token name"
+      "Variable : Token name",
+      "Memo     : Expr expression, Expr key" # see Optimizer.py
     ]
 STMTS = [
     "Block      : List[Stmt] statements",
     "Expression : Expr expression",
-    "Function   : Token name, List[Token] params, List[Stmt] body",
+    "Function   : Token name, List[Token] params, List[Stmt] body, bool=False generator",
     "If         : Expr condition, Stmt thenBranch, Stmt elseBranch",
     "Print      : Expr expression",
     "Return     : Token keyword, Expr value",
     "Var        : Token name, Expr initializer",
     "While      : Expr condition, Stmt body",
     "Break      : Token keyword", # Ch 9 challenge
-    "Class      : Token name, List[Function] methods, Expr.Variable=None superclass"
+    "Class      : Token name, List[Function] methods, Expr.Variable=None superclass",
+    "Memoize    : List[Expr] memos, Stmt body", # see Optimizer.py
+    "Yield      : Token keyword, Expr value" # see Generators.py
     ]
 
 
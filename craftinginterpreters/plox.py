@@ -10,16 +10,49 @@ This work is licensed under a
 
 '''
 
+from __future__ import annotations # no annotation is evaluated
 import sys
+'''
+## Start-up time
+
+A one-line script runs in well under a millisecond, but starting plox used
+to take several times as long as starting Python, nearly all of it spent
+importing modules, and most of those not even ours: argparse, typing (only
+ever used for annotations), enum (for two tiny enums in the Resolver), and
+pickle, hashlib and tempfile for the program cache, plus re, collections
+and functools which those drag in. So:
+
+* "plox client" needs none of the interpreter, so it is dispatched right
+  here, before anything else is imported.
+* The interpreter modules below import only each other. Annotations are
+  never evaluated (from __future__ import annotations) so typing is only
+  imported under "if TYPE_CHECKING", which is never true at run time but
+  is to a type checker.
+* argparse is imported only when the command line is anything more than
+  a single script path.
+* The program cache is only used for scripts big enough that loading one
+  from the cache saves more than importing pickle and hashlib costs, and
+  HeapImage is imported only when an image is named.
+
+See benchmarks/startup.py for the measurement.
+'''
+if __name__ == '__main__' and sys.argv[1:2] == ['client']:
+    import plox_server
+    sys.exit(plox_server.main(sys.argv[1:]))
+
 from Scanner import Scanner
 from Parser import Parser
 from Token import Token
 from TokenType import *
 #import Expr
 import Stmt
-from AstPrinter import AstPrinter
 from Interpreter import Interpreter
-from Resolver import Resolver
+from Resolver import Resolver, Depths
+from Optimizer import Optimizer
+from OutputSink import format_value
+TYPE_CHECKING = False # typing is only for the type checker, see above
+if TYPE_CHECKING:
+    from typing import List, Union
 
 # Syntax/parsing error detection flag. See book, sect. 4.1.1
 #   set: report() run_prompt()
@@ -30,127 +63,330 @@ def main():
     '''
     Top level of plox: if invoked with a single file path, execute the
     contents of that file. Invoked with no file, go into interactive mode.
+
+    Given several files, or the --jobs option, run them all as a batch on
+    a pool of worker processes, see plox_batch.py. With --check, only scan,
+    parse and resolve the file(s), reporting any errors, without executing.
+
+    "plox serve" and "plox client" run and use a server of warm plox
+    processes, see plox_server.py.
+
+    --save-image writes the global state left by a script to an image
+    file, and --image loads one before running a script, see HeapImage.py.
+
+    --int keeps whole numbers as Python ints, which is quicker and makes no
+    other difference, see "Integers" in Interpreter.py.
+
+    --one-pass resolves variables as the script is parsed, rather than in
+    a pass of its own, see "Resolving in the same pass" in Parser.py.
+
+    --pratt parses expressions by precedence climbing, which is quicker
+    and makes the same tree, see PrattParser.py.
+
+    --mem-profile reports which lines of the script made the objects of the
+    interpreter, and which hold on to them, see MemoryProfile.py.
+
+    --tiered compiles the functions and loops that run most into Python
+    closures as the script runs, see TieredInterpreter.py; --tier-report
+    does too, and reports what was compiled and how much faster it ran.
     '''
-    num_args = len(sys.argv)
-    if num_args > 2 :
-        # more than 1 command argument, ergo confused user
-        print('Usage: plox [script]')
-        # with some research I find that Unix exit code 64
-        # is EX_USAGE, command line usage error. TIL!
-        sys.exit(64)
-    elif num_args == 2 : # one argument, hopefully a path to a script
-        run_file(sys.argv[1])
+    argv = sys.argv[1:]
+    if len(argv) == 1 and not argv[0].startswith('-') and argv[0] not in ('serve','client'):
+        run_file(argv[0]) # the usual case, no need to load argparse
+        return
+    if sys.argv[1:2] in (['serve'],['client']):
+        import plox_server
+        sys.exit(plox_server.main(sys.argv[1:]))
+    args = command_line().parse_args()
+    if args.jobs is not None or len(args.scripts) > 1 :
+        import plox_batch
+        if args.save_image :
+            command_line().error('--save-image takes a single script')
+        if args.int or args.one_pass or args.pratt or args.mem_profile \
+           or args.tiered or args.tier_report :
+            command_line().error('--int, --one-pass, --pratt, --mem-profile, --tiered '
+                                 'and --tier-report take a single script')
+        sys.exit(plox_batch.main(args.scripts, args.jobs, args.check, args.image))
+    elif args.scripts : # one argument, hopefully a path to a script
+        run_file(args.scripts[0], check_only=args.check,
+                 use_cache=not args.no_cache,
+                 image=args.image, save_image=args.save_image,
+                 int_numbers=args.int, one_pass=args.one_pass, pratt=args.pratt,
+                 mem_profile=args.mem_profile, tiered=args.tiered,
+                 tier_report=args.tier_report)
     else: # no argument
-        run_prompt()
+        run_prompt(int_numbers=args.int)
     # and out
 
-def run_file( fpath:str ):
+'''
+Describe the command line to argparse. Override its error method so that
+a usage error exits with code 64, EX_USAGE, command line usage error (with
+some research I find. TIL!) instead of argparse's usual 2.
+'''
+def command_line()->argparse.ArgumentParser:
+    import argparse
+    class PloxArgumentParser(argparse.ArgumentParser):
+        def error(self, message:str):
+            self.print_usage(sys.stderr)
+            self.exit(64, f"plox: {message}\n")
+    parser = PloxArgumentParser(prog='plox',
+                description='Execute Lox scripts, or with none, start a Lox prompt.')
+    parser.add_argument('scripts', nargs='*', metavar='script',
+                help='Lox source file(s) to execute')
+    parser.add_argument('--jobs', '-j', type=int, metavar='N',
+                help='run the scripts on N worker processes (default: one per core)')
+    parser.add_argument('--check', action='store_true',
+                help='scan, parse and resolve only; do not execute')
+    parser.add_argument('--no-cache', action='store_true',
+                help='do not use or write the __ploxcache__ directory')
+    parser.add_argument('--image', metavar='IMG',
+                help='start from the global state saved in image file IMG')
+    parser.add_argument('--save-image', metavar='IMG',
+                help='after running the script, save its global state in IMG')
+    parser.add_argument('--int', action='store_true',
+                help='do arithmetic on whole numbers as integers (faster, same results)')
+    parser.add_argument('--one-pass', action='store_true',
+                help='resolve variables while parsing, not in a separate pass')
+    parser.add_argument('--pratt', action='store_true',
+                help='parse expressions by precedence climbing (faster, same tree)')
+    parser.add_argument('--mem-profile', action='store_true',
+                help='report the Lox lines that make and keep runtime objects, on stderr')
+    parser.add_argument('--tiered', action='store_true',
+                help='compile hot functions and loops as the script runs (faster)')
+    parser.add_argument('--tier-report', action='store_true',
+                help='as --tiered, and report what was compiled, on stderr')
+    return parser
+
+def run_file( fpath:str, check_only:bool=False, use_cache:bool=True,
+              image:str=None, save_image:str=None, int_numbers:bool=False,
+              one_pass:bool=False, pratt:bool=False, mem_profile:bool=False,
+              tiered:bool=False, tier_report:bool=False ):
     '''
     Get the contents of a Lox source file. If an error opening the file,
     abort with error code 66, EX_NOINPUT.
 
     Pass the file as a single string to run_lox. If it reports an error,
     abort the program with code 65, EX_DATAERR
+
+    Unless use_cache is False, look first in the __ploxcache__ directory
+    beside the file for the compiled form of this exact source text; if it
+    is there, skip scanning, parsing and resolving altogether. Otherwise
+    compile it as usual and save the result there for next time. Very
+    short scripts are not cached, they compile faster than the cache code
+    can load. See ProgramCache.py.
+
+    Given an image, load the saved state into the interpreter before
+    anything else; given save_image, save the state after running. A bad
+    image is also EX_NOINPUT; failing to write one is 73, EX_CANTCREAT.
+
+    int_numbers is plox --int, see Scanner.number_lit. A program compiled
+    that way is cached apart from the same program compiled without it.
+    one_pass is plox --one-pass, and pratt plox --pratt, see front_end().
+    mem_profile is plox --mem-profile, see execute(). tiered is plox
+    --tiered, which runs the script on a TieredInterpreter, and tier_report
+    --tier-report, which does that and prints its report at the end.
     '''
     #print('running file at',fpath)
     try: # to open the file as UTF_8 text
         f = open(fpath,mode='r',encoding='utf_8')
+        source = f.read()
+        f.close()
     except Exception as E:
         print('problem accessing',fpath)
         print(E)
         sys.exit(66)
-    run_lox(f.read())
+    if tiered or tier_report :
+        from TieredInterpreter import TieredInterpreter
+        interpreter = TieredInterpreter(parse_error)
+    else:
+        interpreter = Interpreter(parse_error)
+    if image :
+        from HeapImage import HeapImage
+        try:
+            HeapImage(image).load(interpreter)
+        except HeapImage.ImageError as E:
+            print(f"plox: {E}", file=sys.stderr)
+            sys.exit(66)
+    if use_cache :
+        from ProgramCache import worth_caching
+        use_cache = worth_caching(source)
+    if not use_cache:
+        run_lox(source, interpreter, check_only=check_only,
+                int_numbers=int_numbers, one_pass=one_pass, pratt=pratt,
+                mem_profile=mem_profile)
+    else:
+        from ProgramCache import ProgramCache
+        cache = ProgramCache(fpath, variant='int' if int_numbers else None)
+        program = cache.load(source, interpreter)
+        if program is None: # not cached (or stale), compile it
+            '''
+            Resolve into a Depths of its own, so that what is stored in the
+            cache is the resolver data of this program only, not that of an
+            image, then give the data to the interpreter.
+            '''
+            depths = Depths()
+            program = front_end(source, depths, int_numbers, one_pass, pratt)
+            if program is not None:
+                program = prepare(program)
+                cache.store(source, program, depths)
+                interpreter.locals.update(depths)
+        if program is not None and not check_only:
+            execute(program, interpreter, mem_profile)
+    if tier_report and not check_only:
+        interpreter.tier_report(sys.stderr)
     if HAD_ERROR : sys.exit(65)
+    if save_image and not check_only:
+        from HeapImage import HeapImage
+        try:
+            HeapImage(save_image).save(interpreter)
+        except HeapImage.ImageError as E:
+            print(f"plox: {E}", file=sys.stderr)
+            sys.exit(73)
 
-def run_prompt():
+def run_prompt(int_numbers:bool=False):
     global HAD_ERROR
     '''
     Prompt the user for a line of Lox code. Stop on KeyboardInterrupt (^c) or
     EOFError (^d). When stopping, print something with a newline so as not to
     mess up the command line in the terminal window.
 
-    Pass each line to run_lox for execution. After running the line, clear
-    the global HAD_ERROR.
-
     Challenge 8#1: allow single-entry expressions with results display, "desk
     calculator mode" operation. Since with Chapter 8, the Parser and
     Interpreter are completely organized around statements, it is not
     possible to feed a bare expression; it has to be an "expression
     statement" ending in a semicolon. Help the user by supplying that.
 
-    Must make the Interpreter instance here, so as to preserve its Environment
-    across separate calls. Then the interactive user can enter "var x=5;"
-    on one line, and "x/3;" on the next line.
+    The Interpreter must persist across separate entries, so that the
+    interactive user can enter "var x=5;" on one line, and "x/3;" on the
+    next line.
 
-    This brings up a problem with the resolver, if the user enters long lines
-    with functions or blocks in them. Over multiple lines, the Resolver used
-    by run_lox will keep stuffing definitions into the interpreter's "locals"
-    map. That is ok, since each parsed Expr is unique, and as long as there
-    is a reference to an Expr (in the locals map) Python won't garbage
-    collect it, and so won't reuse its memory for a different Expr. Over a
-    sufficiently long interactive session, the locals map could get pretty
-    large, but heck, there's memory for thousands of them, millions. No
-    problem.
+    This used to bring up a problem with the resolver: over a long session,
+    the Resolver kept stuffing definitions into the interpreter's "locals"
+    map, and it only ever grew. Now all that is kept in a ReplSession,
+    which lets go of the resolution data of entries that are finished with.
+    The session also lets an entry run over several lines, prompting with
+    "... " until its braces and parentheses balance. See ReplSession.py.
 
+    After running an entry, clear the global HAD_ERROR.
     '''
-    interactive_interpreter = Interpreter(parse_error)
+    from ReplSession import ReplSession
+    session = ReplSession(lex_error, parse_error, show_value, int_numbers)
     while True:
         try:
-            line_in = input('> ').strip()
+            line_in = input('... ' if session.waiting() else '> ')
         except EOFError:
             print("\nk thx byeee")
             sys.exit()
         except KeyboardInterrupt:
+            if session.waiting() : # ^c abandons a partial entry
+                session.cancel()
+                print()
+                continue
             print("\noof, gone")
             sys.exit()
-        if not line_in.endswith(';') and not line_in.endswith('}'):
-            line_in += ';'
-        run_lox(line_in,interactive_interpreter)
+        session.feed(line_in)
         HAD_ERROR = False
 
     # end while
 
 
-def run_lox(lox_code:str, interpreter=None):
+def run_lox(lox_code:str, interpreter=None, check_only:bool=False,
+            int_numbers:bool=False, one_pass:bool=False, pratt:bool=False,
+            mem_profile:bool=False):
+    '''
+    Compile the code (see front_end), and unless there was an error or
+    we are only checking, prepare and execute it.
+    '''
+    if interpreter is None: # if we need an Interpreter, make one now.
+        interpreter = Interpreter(parse_error)
+    program = front_end(lox_code, interpreter, int_numbers, one_pass, pratt)
+    if program is None or check_only: return
+    execute(prepare(program), interpreter, mem_profile)
+
+def front_end(lox_code:str, interpreter:Union[Interpreter,Depths],
+              int_numbers:bool=False, one_pass:bool=False, pratt:bool=False):
     '''
     Tokenize the input string. If any errors are reported, stop.
+    Return None if there was an error or there is nothing to do,
+    otherwise the program, resolved into the interpreter (or Depths).
+
+    With one_pass, the Parser resolves the program as it parses it, and
+    the Resolver only runs if the Parser gave that up, which it does on
+    finding any error, so that the Resolver can report it.
+
+    With pratt, a PrattParser does the parsing; the tree is the same.
     '''
-    scanner = Scanner(lox_code,lex_error)
+    scanner = Scanner(lox_code, lex_error, int_numbers)
     tokens = scanner.scanTokens()
-    if HAD_ERROR: return
+    if HAD_ERROR: return None
     '''
     Parse the scanned tokens. If any semantic errors, stop.
     '''
-    parser = Parser(tokens, parse_error)
+    if pratt :
+        from PrattParser import PrattParser
+        parser = PrattParser(tokens, parse_error, one_pass)
+    else:
+        parser = Parser(tokens, parse_error, one_pass)
     program = parser.parse()
-    if HAD_ERROR: return
+    if HAD_ERROR: return None
 
-    if 0 == len(program): return # null statement, {} or // cmt
-    if interpreter is None: # if we need an Interpreter, make one now.
-        interpreter = Interpreter(parse_error)
+    if 0 == len(program): return None # null statement, {} or // cmt
+    if parser.depths is not None: # resolved in the one pass
+        for (reference, depth) in parser.depths.items():
+            interpreter.resolve(reference, depth)
+        return program
     '''
     Parsing reports no error, so program is now [Stmt...].
     Perform variable name resolution; check for new errors.
     '''
     resolver = Resolver(interpreter,parse_error)
     resolver.resolve(program)
-    if HAD_ERROR: return
+    if HAD_ERROR: return None
+    return program
+
+def is_one_expression(program:List[Stmt.Stmt])->bool:
     '''
     Per challenge 8#1, separate the real programs from single expression
     statements and handle differently.
     '''
-    if 1 == len(program) and isinstance(program[0],Stmt.Expression):
+    return 1 == len(program) and isinstance(program[0],Stmt.Expression)
+
+def prepare(program:List[Stmt.Stmt])->List[Stmt.Stmt]:
+    '''
+    A real program: hoist loop invariants and share repeated subexpressions
+    (see Optimizer.py). A single expression is left alone.
+    '''
+    if is_one_expression(program):
+        return program
+    return Optimizer().optimize(program)
+
+def execute(program:List[Stmt.Stmt], interpreter:Interpreter,
+            mem_profile:bool=False):
+    '''
+    With mem_profile, execute it under a MemoryProfile, and print its
+    report on stderr afterward, whatever happened.
+    '''
+    if mem_profile :
+        from MemoryProfile import MemoryProfile
+        profile = MemoryProfile()
+        try:
+            with profile:
+                execute(program, interpreter)
+        finally:
+            profile.report(sys.stderr)
+        return
+    if is_one_expression(program):
         '''
         All of lox_code was a single statement which was not any kind
         of declarator, but a single expression. Get its value and print.
         '''
-        value = interpreter.one_line_program(program)
-        str_value = str(value)
-        if str_value.endswith('.0') : str_value = str_value[0:-2]
-        print(str_value)
+        show_value(interpreter.one_line_program(program))
     else:
         interpreter.interpret(program)
 
+def show_value(value:object):
+    print(format_value(value))
+
 '''
 The book provides (at least?) two variations of the function error():
 one in section 4.1.1 for reporting scanner errors, which takes a line number;
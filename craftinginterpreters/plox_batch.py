@@ -0,0 +1,135 @@
+'''
+
+# Run many Lox scripts at once
+
+This is the code behind "plox --jobs N a.lox b.lox ...". Not in the book;
+the book's Lox main program runs one script and quits, and so does plox
+when given one script. Running a nightly set of thousands of scripts that
+way means thousands of Python start-ups, and only one core busy at a time.
+
+Here the scripts are handed to a concurrent.futures process pool. Each
+worker process imports the plox modules once and then runs script after
+script, so the start-up cost is paid once per worker, not once per
+script. The scripts are independent, so N workers should run them about N
+times as fast, as long as there are N cores to run on.
+
+Each script runs with its own Interpreter, and with the HAD_ERROR flag of
+plox cleared. Its printed output, error output and exit status are
+collected in a ScriptResult and returned to the parent, which writes them
+out in the order the scripts were named, so the output of a batch is the
+same however many workers ran it. The exit codes are those of run_file,
+with one addition:
+
+    0   fine
+    65  EX_DATAERR, a Lox error of some kind
+    66  EX_NOINPUT, the file could not be read
+    70  EX_SOFTWARE, the Python code of plox itself failed
+
+With check_only, the scripts are scanned, parsed and resolved but not
+executed, a quick way to find syntax errors in a large set of scripts.
+
+Given an image (see HeapImage.py), each script starts from the state
+saved in it. The image is loaded afresh for every script, so no script
+sees what an earlier one did to the state.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+'''
+
+import io
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Iterable, List, NamedTuple
+
+import plox
+from HeapImage import HeapImage
+
+'''
+The result of running one script, as sent back from a worker.
+'''
+class ScriptResult(NamedTuple):
+    path: str
+    status: int
+    stdout: str
+    stderr: str
+
+'''
+Run one script, in whatever process this is, capturing its output.
+This is the function the workers execute; it must never raise, or the
+whole batch would stop.
+'''
+def run_script(fpath:str, check_only:bool=False, image:str=None)->ScriptResult:
+    try: # to read the file as UTF_8 text
+        with open(fpath,mode='r',encoding='utf_8') as f:
+            source = f.read()
+    except Exception as E:
+        return ScriptResult(fpath, 66, f"problem accessing {fpath}\n{E}\n", '')
+    return run_source(source, fpath, check_only, image)
+
+'''
+Run a string of Lox source code, capturing its output. The name is only
+used to label the result. Also used by the plox server, plox_server.py.
+'''
+def run_source(source:str, name:str, check_only:bool=False, image:str=None)->ScriptResult:
+    out = io.StringIO()
+    err = io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        status = 0
+        plox.HAD_ERROR = False # each script starts clean
+        try:
+            interpreter = plox.Interpreter(plox.parse_error)
+            if image :
+                HeapImage(image).load(interpreter)
+            plox.run_lox(source, interpreter, check_only=check_only)
+            if plox.HAD_ERROR : status = 65
+        except HeapImage.ImageError as E:
+            print(f"plox: {E}", file=sys.stderr)
+            status = 66
+        except Exception:
+            traceback.print_exc()
+            status = 70
+    return ScriptResult(name, status, out.getvalue(), err.getvalue())
+
+def run_batch(paths:List[str], jobs:int=None, check_only:bool=False,
+              image:str=None)->Iterable[ScriptResult]:
+    '''
+    Run the scripts at paths on a pool of jobs processes (default, one per
+    core) and yield their results in the order of paths. The scripts are
+    passed to the workers in chunks, so a worker handling many small
+    scripts isn't waiting on the parent between each one.
+    '''
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(paths)))
+    chunk = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(run_script, paths, [check_only]*len(paths),
+                            [image]*len(paths), chunksize=chunk)
+
+def main(paths:List[str], jobs:int=None, check_only:bool=False, image:str=None)->int:
+    '''
+    Run a batch from the command line. Write each script's output in turn,
+    headed by its name when there is more than one, then a summary of the
+    failures. Return the largest exit status of any script, so that the
+    batch as a whole fails if any script did.
+    '''
+    worst = 0
+    failures = 0
+    for result in run_batch(paths, jobs, check_only, image):
+        if len(paths) > 1:
+            print(f"==> {result.path} <==")
+        sys.stdout.write(result.stdout)
+        sys.stdout.flush()
+        sys.stderr.write(result.stderr)
+        sys.stderr.flush()
+        if result.status :
+            failures += 1
+            worst = max(worst, result.status)
+    if len(paths) > 1:
+        print(f"{len(paths)} scripts, {failures} failed", file=sys.stderr)
+    return worst
@@ -0,0 +1,235 @@
+'''
+
+# A persistent plox server, and its client
+
+Starting Python and importing the plox modules takes longer than running
+many of the short Lox scripts we use. So here is "plox serve", which pays
+that cost once: it imports the Scanner, Parser, Resolver and Interpreter
+(by importing plox_batch, which imports plox, which imports the rest),
+then forks a pool of worker processes that all wait on one Unix-domain
+socket. Each worker accepts a connection, runs the script it is sent, and
+sends back the captured output and exit status. The forked workers share
+the parent's already-imported modules, so a request never waits on an
+import.
+
+"plox client script.lox" is the other end. It sends the script's path (or
+with "-", the text of the script read from stdin), waits for the reply,
+writes the output where it belongs and exits with the script's status.
+The client code needs none of the interpreter modules, so it starts about
+as fast as Python can, and callers of plox can switch to it without
+noticing anything but the speed.
+
+This only works on a Unix, of course: it needs os.fork and AF_UNIX.
+
+This work is licensed under a
+  Creative Commons Attribution-NonCommercial 4.0 International License
+  see http://creativecommons.org/licenses/by-nc/4.0/
+
+## The protocol
+
+The client connects, sends one JSON object and shuts down its side of the
+connection. The object is either {"path": "/abs/path.lox"} or
+{"source": "...lox code..."}, either with an optional "check": true for a
+scan/parse/resolve only run (see plox --check). The server replies with
+one JSON object, {"status": int, "stdout": str, "stderr": str}, and closes
+the connection. A malformed request gets status 64, EX_USAGE.
+
+If the server can't be reached, the client exits with status 69,
+EX_UNAVAILABLE.
+
+## Workers
+
+The parent process does nothing but keep the pool full. A worker that
+dies is replaced, and so is one that has served max_requests scripts,
+which bounds whatever memory a long run of scripts might leave behind.
+SIGTERM or SIGINT to the parent stops the workers and removes the socket.
+'''
+
+from __future__ import annotations # no annotation is evaluated
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+TYPE_CHECKING = False # typing is only for the type checker, see plox.py
+if TYPE_CHECKING:
+    from typing import List
+
+'''
+Where the server listens unless told otherwise: $PLOX_SOCKET, or a name
+in the temp directory that is unique to the user.
+'''
+def default_socket()->str:
+    return os.environ.get('PLOX_SOCKET') or \
+        os.path.join(tempfile.gettempdir(), f"plox-{os.getuid()}.sock")
+
+'''
+Read everything the other end sends until it shuts down its side.
+'''
+def receive_all(conn:socket.socket)->bytes:
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+'''
+## The server side
+'''
+class PloxServer():
+    def __init__(self, path:str, workers:int, max_requests:int):
+        self.path = path
+        self.workers = workers
+        self.max_requests = max_requests
+        self.children = set() # pids of live workers
+        self.listener = None # the listening socket, once bound
+
+    '''
+    Bind the socket, fill the pool, and then wait on the workers until
+    told to stop. A socket file left by a server that died is removed, but
+    one that some live server is still answering on is not.
+    '''
+    def serve(self):
+        import plox_batch # preload everything before forking
+        self.run_source = plox_batch.run_source
+        self.run_script = plox_batch.run_script
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise SystemExit(f"plox: a server is already running on {self.path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            finally:
+                probe.close()
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(128)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        print(f"plox server on {self.path} with {self.workers} workers", file=sys.stderr)
+        try:
+            while True:
+                while len(self.children) < self.workers:
+                    self.fork_worker()
+                pid, _ = os.wait()
+                self.children.discard(pid)
+        finally:
+            self.shutdown()
+
+    def stop(self, signum, frame):
+        raise SystemExit(0)
+
+    def shutdown(self):
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+        self.listener.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def fork_worker(self):
+        pid = os.fork()
+        if pid : # in the parent
+            self.children.add(pid)
+            return
+        # in the child: default signal handling, then work until retired
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        status = 0
+        try:
+            for _ in range(self.max_requests):
+                conn, _ = self.listener.accept()
+                with conn:
+                    self.handle(conn)
+        except BaseException:
+            status = 1
+        os._exit(status) # never return into the parent's code
+
+    '''
+    Serve one request on an accepted connection.
+    '''
+    def handle(self, conn:socket.socket):
+        try:
+            request = json.loads(receive_all(conn).decode('utf_8'))
+            check = bool(request.get('check', False))
+            if 'source' in request:
+                result = self.run_source(str(request['source']), '<client>', check)
+            else:
+                result = self.run_script(str(request['path']), check)
+            reply = {'status':result.status,
+                     'stdout':result.stdout,
+                     'stderr':result.stderr}
+        except (ValueError, KeyError, AttributeError) as E:
+            reply = {'status':64, 'stdout':'', 'stderr':f"plox server: bad request: {E}\n"}
+        try:
+            conn.sendall(json.dumps(reply).encode('utf_8'))
+        except OSError:
+            pass # the client went away; nothing to be done
+
+'''
+## The client side
+
+Send one request and report its result. Return the exit status.
+'''
+def client(script:str, path:str, check:bool=False)->int:
+    if script == '-':
+        request = {'source':sys.stdin.read()}
+    else:
+        request = {'path':os.path.abspath(script)}
+    request['check'] = check
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        conn.sendall(json.dumps(request).encode('utf_8'))
+        conn.shutdown(socket.SHUT_WR)
+        reply = json.loads(receive_all(conn).decode('utf_8'))
+    except (OSError, ValueError) as E:
+        print(f"plox client: no server on {path}: {E}", file=sys.stderr)
+        return 69
+    finally:
+        conn.close()
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    return reply['status']
+
+'''
+Command lines, "plox serve [options]" and "plox client [options] script",
+as dispatched from plox.main().
+'''
+def main(argv:List[str])->int:
+    parser = argparse.ArgumentParser(prog='plox')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_args = commands.add_parser('serve', help='run a pool of warm plox workers')
+    serve_args.add_argument('--socket', default=default_socket(),
+                help='Unix socket path (default: $PLOX_SOCKET or %(default)s)')
+    serve_args.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                help='number of worker processes (default: %(default)s)')
+    serve_args.add_argument('--max-requests', type=int, default=1000,
+                help='scripts a worker runs before it is replaced (default: %(default)s)')
+    client_args = commands.add_parser('client', help='run a script on a plox server')
+    client_args.add_argument('--socket', default=default_socket(),
+                help='Unix socket path (default: $PLOX_SOCKET or %(default)s)')
+    client_args.add_argument('--check', action='store_true',
+                help='scan, parse and resolve only; do not execute')
+    client_args.add_argument('script', help="Lox source file, or - to send stdin")
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        PloxServer(args.socket, max(1,args.workers), max(1,args.max_requests)).serve()
+        return 0
+    return client(args.script, args.socket, args.check)
+
+if __name__ == '__main__' :
+
+    sys.exit(main(sys.argv[1:]))